@@ -0,0 +1,221 @@
+# c:\Users\1134931\chat_bot\app\chat_sessions.py
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterator
+
+from .config import (
+    CHAT_CHARS_PER_TOKEN, CHAT_HISTORY_TOKEN_BUDGET, CHAT_COMPACT_TARGET_RATIO, CHAT_MIN_RECENT_TURNS,
+    CHAT_SUMMARY_MAX_WORDS, CHAT_SESSION_TTL_SECONDS, CHAT_MAX_SESSIONS,
+    CHAT_SUMMARY_PROMPT_TEMPLATE, CHAT_SUMMARY_MESSAGE_TEMPLATE, CHAT_SUMMARY_ACK,
+)
+from .gemini_client import GenerationResult, generate_text_result_async, stream_chat_results_async
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap local token estimate, good enough for history budgets."""
+    return len(text) // CHAT_CHARS_PER_TOKEN + 1
+
+
+class ChatTurn:
+    """One user message and the model's reply."""
+
+    __slots__ = ("user", "reply", "tokens")
+
+    def __init__(self, user: str, reply: str):
+        self.user = user
+        self.reply = reply
+        self.tokens = estimate_tokens(user) + estimate_tokens(reply)
+
+
+class ChatSession:
+    """
+    Conversation state for one browser session: a rolling summary of older
+    turns plus the recent turns that are still sent verbatim.
+    """
+
+    __slots__ = ("session_id", "persona_name", "backstory", "summary", "turns", "last_used", "lock")
+
+    def __init__(self, session_id: str, persona_name: str, backstory: str):
+        self.session_id = session_id
+        self.persona_name = persona_name
+        self.backstory = backstory
+        self.summary = ""
+        self.turns: list[ChatTurn] = []
+        self.last_used = time.monotonic()
+        # Serializes turns of one session (e.g. a double-clicked send button)
+        self.lock = asyncio.Lock()
+
+    @property
+    def history_tokens(self) -> int:
+        """Estimated tokens of the history sent with the next message."""
+        summary_tokens = estimate_tokens(self.summary) if self.summary else 0
+        return summary_tokens + sum(turn.tokens for turn in self.turns)
+
+    def history(self) -> list[dict]:
+        """The history in the SDK's content format, summary first."""
+        messages = []
+        if self.summary:
+            messages.append({"role": "user", "parts": [CHAT_SUMMARY_MESSAGE_TEMPLATE.format(summary=self.summary)]})
+            messages.append({"role": "model", "parts": [CHAT_SUMMARY_ACK]})
+        for turn in self.turns:
+            messages.append({"role": "user", "parts": [turn.user]})
+            messages.append({"role": "model", "parts": [turn.reply]})
+        return messages
+
+
+class ChatSessionStore:
+    """
+    Thread-safe in-memory map of session id -> ChatSession.
+
+    Sessions idle for longer than ttl_seconds are evicted, and at most
+    max_sessions are kept (least recently used first out), which bounds the
+    memory used by abandoned browser tabs.
+    """
+
+    def __init__(self, ttl_seconds: float, max_sessions: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        # Ordered by last use, oldest first
+        self._sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get_or_create(self, session_id: str | None, persona_name: str, backstory: str) -> ChatSession:
+        """
+        Returns the session for session_id, or a new one if it doesn't exist,
+        expired or was started with a different persona (or backstory).
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None or session.persona_name != persona_name or session.backstory != backstory:
+                session = ChatSession(session_id or uuid.uuid4().hex, persona_name, backstory)
+                self._sessions[session.session_id] = session
+            session.last_used = now
+            self._sessions.move_to_end(session.session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+            return session
+
+    def drop(self, session_id: str | None) -> None:
+        if not session_id:
+            return
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def evict_idle(self) -> int:
+        """Drops sessions idle for longer than the TTL. Returns how many were dropped."""
+        with self._lock:
+            return self._evict_idle(time.monotonic())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    # --- Internal helpers (caller holds the lock) ---
+    def _evict_idle(self, now: float) -> int:
+        cutoff = now - self.ttl_seconds
+        evicted = 0
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_used >= cutoff:
+                break
+            self._sessions.popitem(last=False)
+            evicted += 1
+        if evicted:
+            self.evictions += evicted
+            logger.info(f"Evicted {evicted} idle chat sessions.")
+        return evicted
+
+
+async def stream_chat_reply(session: ChatSession, user_message: str) -> AsyncIterator[GenerationResult]:
+    """
+    Sends a message in a chat session and yields the reply as it streams in
+    (see gemini_client.stream_chat_results_async). A complete reply is added to
+    the session history. If that takes the history over the token budget, it is
+    compacted in a background task once the reply is done, so the summary call
+    is not part of this turn (the session's next turn waits for it).
+    """
+    async with session.lock:
+        result = None
+        async for result in stream_chat_results_async(session.backstory, session.history(), user_message):
+            yield result
+        # Failed turns (blocked, error, busy...) are not remembered
+        if result is not None and result.ok:
+            session.turns.append(ChatTurn(user_message, result.text))
+            if session.history_tokens > CHAT_HISTORY_TOKEN_BUDGET:
+                _schedule_compaction(session)
+
+
+# Running background compactions; the event loop only keeps weak references to tasks
+_compactions: set[asyncio.Task] = set()
+
+
+def _schedule_compaction(session: ChatSession) -> None:
+    task = asyncio.get_running_loop().create_task(_compact_in_background(session))
+    _compactions.add(task)
+    task.add_done_callback(_compactions.discard)
+
+
+async def _compact_in_background(session: ChatSession) -> None:
+    """Compacts the session under its lock, after the turn that scheduled it has released it."""
+    try:
+        async with session.lock:
+            # Another compaction (or a reset) may have got there first
+            if session.history_tokens > CHAT_HISTORY_TOKEN_BUDGET:
+                await compact_session(session)
+    except Exception as e:
+        logger.error(f"Compacting chat session {session.session_id} failed: {e}", exc_info=True)
+
+
+async def compact_session(session: ChatSession) -> None:
+    """
+    Folds the oldest turns into the rolling summary until the remaining turns
+    fit in CHAT_COMPACT_TARGET_RATIO of the budget (leaving room to grow before
+    the next compaction). The last CHAT_MIN_RECENT_TURNS turns are always kept.
+    """
+    target_tokens = CHAT_HISTORY_TOKEN_BUDGET * CHAT_COMPACT_TARGET_RATIO
+    recent_tokens = sum(turn.tokens for turn in session.turns)
+    split = 0
+    while split < len(session.turns) - CHAT_MIN_RECENT_TURNS and recent_tokens > target_tokens:
+        recent_tokens -= session.turns[split].tokens
+        split += 1
+    if split == 0:
+        return
+
+    old_turns = session.turns[:split]
+    transcript = "\n".join(f"User: {turn.user}\nChatbot: {turn.reply}" for turn in old_turns)
+    prompt = CHAT_SUMMARY_PROMPT_TEMPLATE.format(
+        max_words=CHAT_SUMMARY_MAX_WORDS, summary=session.summary or "(none)", transcript=transcript
+    )
+    result = await generate_text_result_async(prompt)
+    if result.ok:
+        summary = result.text
+    else:
+        # Summary unavailable: keep the most recent part of the old text rather than the whole transcript
+        logger.warning(f"Could not summarize chat history ({result.status}); truncating instead.")
+        summary = f"{session.summary}\n{transcript}".strip()
+    session.summary = _limit_words(summary, CHAT_SUMMARY_MAX_WORDS)
+    session.turns = session.turns[split:]
+    logger.info(f"Compacted {split} chat turns into the summary of session {session.session_id}.")
+
+
+def _limit_words(text: str, max_words: int) -> str:
+    """Keeps the last max_words words of the text (the newest information)."""
+    words = text.split()
+    if len(words) <= max_words:
+        return text
+    return "... " + " ".join(words[-max_words:])
+
+
+# Shared session store for the app
+chat_sessions = ChatSessionStore(CHAT_SESSION_TTL_SECONDS, CHAT_MAX_SESSIONS)
@@ -2,51 +2,310 @@
 import json
 import os
 import logging
+import tempfile
+import threading
 
 # Get a logger specific to this module
+# Logging is configured by the entry point (run.py or main.py), not on import
 logger = logging.getLogger(__name__)
-# Basic configuration if no root logger is set yet (won't override if already configured by run.py)
-# This basicConfig might be removed if run.py handles it definitively.
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 # --- Configuration ---
 # Use a known valid model name
 GEMINI_MODEL_NAME = "gemini-2.5-pro-exp-03-25"
 
-# --- Load API Key ---
-API_KEY = None
+
+def _env_int(name: str, default: int) -> int:
+    """Reads an integer setting from the environment, falling back to the default if unset or invalid."""
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logger.warning(f"Invalid integer for {name}: {value!r}. Using default {default}.")
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    """Reads a float setting from the environment, falling back to the default if unset or invalid."""
+    value = os.environ.get(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        logger.warning(f"Invalid number for {name}: {value!r}. Using default {default}.")
+        return default
+
+
+# --- Concurrency Limits ---
+# Maximum number of Gemini calls in flight at once (per process) on the async path
+GEMINI_MAX_CONCURRENCY = _env_int("GEMINI_MAX_CONCURRENCY", 8)
+# Maximum number of requests allowed to wait for a free slot; anything beyond gets a "busy" reply
+GEMINI_MAX_QUEUE_SIZE = _env_int("GEMINI_MAX_QUEUE_SIZE", 32)
+# How long a queued request waits for a slot before giving up with a "busy" reply
+GEMINI_QUEUE_TIMEOUT_SECONDS = _env_float("GEMINI_QUEUE_TIMEOUT_SECONDS", 30.0)
+# Identical concurrent requests (same backstory and prompt) share one upstream call
+GEMINI_SINGLE_FLIGHT_ENABLED = _env_int("GEMINI_SINGLE_FLIGHT_ENABLED", 1) != 0
+# Longest a request attached to a shared stream waits for its next chunk; after that the
+# request that started the stream is taken to have stopped reading it, and the waiting
+# request restarts the stream itself (0 = wait indefinitely)
+GEMINI_SINGLE_FLIGHT_STALL_SECONDS = _env_float("GEMINI_SINGLE_FLIGHT_STALL_SECONDS", 60.0)
+
+# Gradio queue settings for the submit event
+GRADIO_CONCURRENCY_LIMIT = _env_int("GRADIO_CONCURRENCY_LIMIT", GEMINI_MAX_CONCURRENCY)
+GRADIO_QUEUE_MAX_SIZE = _env_int("GRADIO_QUEUE_MAX_SIZE", 64)
+
+# --- Response Cache ---
+# Set RESPONSE_CACHE_ENABLED=0 to always call Gemini
+RESPONSE_CACHE_ENABLED = _env_int("RESPONSE_CACHE_ENABLED", 1) != 0
+# Upper bound on the memory used by cached replies (keys + text, in bytes)
+RESPONSE_CACHE_MAX_BYTES = _env_int("RESPONSE_CACHE_MAX_BYTES", 16 * 1024 * 1024)
+# How long a cached reply may be served, in seconds
+RESPONSE_CACHE_TTL_SECONDS = _env_float("RESPONSE_CACHE_TTL_SECONDS", 6 * 60 * 60)
+# Number of distinct replies kept per key. With more than 1, the first N requests for a
+# key still go to Gemini and later hits pick one of the stored variants at random.
+RESPONSE_CACHE_VARIANTS = _env_int("RESPONSE_CACHE_VARIANTS", 1)
+# Where cached replies are stored: "memory" (per process) or "sqlite" (shared by all
+# workers on the node through a file at RESPONSE_CACHE_PATH)
+RESPONSE_CACHE_BACKEND = os.environ.get("RESPONSE_CACHE_BACKEND", "memory").strip().lower()
+RESPONSE_CACHE_PATH = os.environ.get(
+    "RESPONSE_CACHE_PATH", os.path.join(tempfile.gettempdir(), "mean_chatbot_response_cache.sqlite3")
+)
+# Bytes of the SQLite file to memory-map (0 disables mmap)
+RESPONSE_CACHE_SQLITE_MMAP_BYTES = _env_int("RESPONSE_CACHE_SQLITE_MMAP_BYTES", 64 * 1024 * 1024)
+# Minimum seconds between bulk sweeps of expired SQLite entries
+RESPONSE_CACHE_SWEEP_INTERVAL_SECONDS = _env_float("RESPONSE_CACHE_SWEEP_INTERVAL_SECONDS", 300.0)
+
+# --- Near-Duplicate Prompts ---
+# On an exact cache miss, serve the cached reply of a previously answered prompt of the same
+# persona that is nearly identical ("Give me a simple recipe for salmon!" vs "give me a
+# salmon recipe"). Needs the response cache; set NEAR_DUPLICATE_ENABLED=0 to turn it off.
+NEAR_DUPLICATE_ENABLED = _env_int("NEAR_DUPLICATE_ENABLED", 1) != 0
+# Estimated Jaccard similarity of the prompts' character n-grams needed to reuse a reply.
+# Case, punctuation, word order and a filler word or two barely matter; lower values also
+# match looser rewordings. Prompts that differ in numbers or negations, or that ask about a
+# word the earlier prompt didn't have ("salmon" / "chicken"), never match.
+NEAR_DUPLICATE_THRESHOLD = _env_float("NEAR_DUPLICATE_THRESHOLD", 0.8)
+NEAR_DUPLICATE_NGRAM = _env_int("NEAR_DUPLICATE_NGRAM", 3)
+# MinHash signature length, and how LSH splits its first BANDS * ROWS values into bands.
+# Prompts sharing any band are compared; more rows per band = fewer, closer candidates.
+NEAR_DUPLICATE_NUM_PERM = _env_int("NEAR_DUPLICATE_NUM_PERM", 64)
+NEAR_DUPLICATE_BANDS = _env_int("NEAR_DUPLICATE_BANDS", 8)
+NEAR_DUPLICATE_ROWS = _env_int("NEAR_DUPLICATE_ROWS", 4)
+# Prompts with fewer distinct n-grams are too short to compare reliably ("yes" vs "no")
+NEAR_DUPLICATE_MIN_NGRAMS = _env_int("NEAR_DUPLICATE_MIN_NGRAMS", 8)
+# Prompts remembered per persona; the oldest half is dropped when the index is full
+NEAR_DUPLICATE_MAX_ENTRIES = _env_int("NEAR_DUPLICATE_MAX_ENTRIES", 200_000)
+
+# --- Personas ---
 CONFIG_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKSTORIES_FILE_PATH = os.environ.get("BACKSTORIES_FILE_PATH", os.path.join(CONFIG_DIR, "backstories.json"))
+# Seconds between background checks of backstories.json for changes (hot reload); 0 disables reloading
+PERSONA_RELOAD_CHECK_SECONDS = _env_float("PERSONA_RELOAD_CHECK_SECONDS", 2.0)
+
+# --- Persona Images ---
+# Base path for relative image paths in backstories.json
+IMAGE_BASE_PATH = os.path.abspath(os.path.join(CONFIG_DIR, 'images'))
+# Thumbnails are generated once per image and served with long-lived cache headers
+PERSONA_THUMBNAIL_DIR = os.environ.get(
+    "PERSONA_THUMBNAIL_DIR", os.path.join(tempfile.gettempdir(), "mean_chatbot_thumbnails")
+)
+# Matches the max-height of #persona-local-image in the interface CSS
+PERSONA_THUMBNAIL_HEIGHT = _env_int("PERSONA_THUMBNAIL_HEIGHT", 200)
+# URL path the thumbnails are served under (see the route in main.py)
+PERSONA_IMAGE_URL_PREFIX = os.environ.get("PERSONA_IMAGE_URL_PREFIX", "/persona-images")
+
+# --- Gemini Client ---
+# After a failed client initialization, wait this long before trying again
+GEMINI_CLIENT_RETRY_SECONDS = _env_float("GEMINI_CLIENT_RETRY_SECONDS", 5.0)
+
+# --- Key and Model Routing ---
+# keys.json may list several API keys and models (see get_keys_config); each request is
+# routed to the least-loaded healthy key. Without a "models" list, GEMINI_MODEL_NAME is
+# the primary model and this one, if set, is used when it is saturated or slow. Off by
+# default: replies then silently come from a different model (e.g. "gemini-2.0-flash").
+GEMINI_FALLBACK_MODEL_NAME = os.environ.get("GEMINI_FALLBACK_MODEL_NAME", "").strip()
+# Default request budget per key and model (requests per minute) for keys.json entries
+# that don't set one. 0 = no local budget, rely on the API's 429 replies.
+GEMINI_KEY_REQUESTS_PER_MINUTE = _env_float("GEMINI_KEY_REQUESTS_PER_MINUTE", 0.0)
+# A key that gets rate limited (429), or fails this many times in a row, sits out for the cooldown
+GEMINI_KEY_COOLDOWN_SECONDS = _env_float("GEMINI_KEY_COOLDOWN_SECONDS", 30.0)
+GEMINI_KEY_FAILURE_THRESHOLD = _env_int("GEMINI_KEY_FAILURE_THRESHOLD", 3)
+# A primary model whose recent response time (moving average) exceeds this is treated as
+# slow and requests go to the fallback model; one request per probe interval still tries it
+GEMINI_SLOW_MODEL_SECONDS = _env_float("GEMINI_SLOW_MODEL_SECONDS", 20.0)
+GEMINI_SLOW_MODEL_PROBE_SECONDS = _env_float("GEMINI_SLOW_MODEL_PROBE_SECONDS", 10.0)
+
+# --- Logging ---
+# Applied by configure_logging() (app/logging_setup.py), called once by each entry point
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").strip().upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Also write the log to this file ("" = console only)
+LOG_FILE = os.environ.get("LOG_FILE", "").strip()
+# Records waiting for the background writer; beyond this they are dropped (and counted)
+LOG_QUEUE_SIZE = _env_int("LOG_QUEUE_SIZE", 10_000)
+
+# --- Transcripts ---
+# Audit log of every submission (persona, prompt, reply, status, latency, tokens) as
+# gzip-compressed JSON lines, written in batches by a background thread. With several
+# worker processes, include {pid} in TRANSCRIPTS_PATH so each writes its own file.
+TRANSCRIPTS_ENABLED = _env_int("TRANSCRIPTS_ENABLED", 0) != 0
+TRANSCRIPTS_PATH = os.environ.get(
+    "TRANSCRIPTS_PATH", os.path.join(os.path.dirname(CONFIG_DIR), "logs", "transcripts.jsonl.gz")
+)
+# Rotate the file once it reaches this size (compressed bytes); keep this many old files
+TRANSCRIPTS_MAX_BYTES = _env_int("TRANSCRIPTS_MAX_BYTES", 64 * 1024 * 1024)
+TRANSCRIPTS_BACKUP_COUNT = _env_int("TRANSCRIPTS_BACKUP_COUNT", 10)
+# A batch is written when it has this many records or is this old, whichever comes first
+TRANSCRIPTS_BATCH_SIZE = _env_int("TRANSCRIPTS_BATCH_SIZE", 200)
+TRANSCRIPTS_FLUSH_SECONDS = _env_float("TRANSCRIPTS_FLUSH_SECONDS", 2.0)
+# Records waiting to be written; beyond this they are dropped (and counted)
+TRANSCRIPTS_QUEUE_SIZE = _env_int("TRANSCRIPTS_QUEUE_SIZE", 10_000)
+
+# --- Production Server ---
+# Used by `python run.py --production` (uvicorn) and gunicorn.conf.py
+SERVER_HOST = os.environ.get("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = _env_int("SERVER_PORT", 7860)
+# Worker processes. Gradio keeps queue and chat state per process, so all requests of a browser
+# session must reach the same worker; for more than one, prefer one instance per port behind a
+# proxy with session affinity over several workers sharing a port.
+SERVER_WORKERS = _env_int("SERVER_WORKERS", 1)
+# On SIGTERM a worker reports not ready (/ready -> 503) but keeps serving for this long,
+# so the load balancer stops sending it requests before it stops accepting them. Set it
+# to at least the balancer's readiness probe interval; 0 stops accepting immediately.
+SERVER_SHUTDOWN_DELAY_SECONDS = _env_float("SERVER_SHUTDOWN_DELAY_SECONDS", 5.0)
+# After that, in-flight generations get this long to finish before they are cut off
+SERVER_GRACEFUL_SHUTDOWN_SECONDS = _env_float("SERVER_GRACEFUL_SHUTDOWN_SECONDS", 30.0)
+
+# --- Resilience ---
+# Deadline for a single Gemini call (for streams: until the first chunk, then between chunks)
+GEMINI_REQUEST_TIMEOUT_SECONDS = _env_float("GEMINI_REQUEST_TIMEOUT_SECONDS", 60.0)
+# Retries for transient errors (429/5xx/timeouts) with jittered exponential backoff
+GEMINI_MAX_RETRIES = _env_int("GEMINI_MAX_RETRIES", 2)
+GEMINI_RETRY_BASE_SECONDS = _env_float("GEMINI_RETRY_BASE_SECONDS", 0.5)
+GEMINI_RETRY_MAX_SECONDS = _env_float("GEMINI_RETRY_MAX_SECONDS", 8.0)
+# No retry is started once a request has been going for this long
+GEMINI_TOTAL_DEADLINE_SECONDS = _env_float("GEMINI_TOTAL_DEADLINE_SECONDS", 120.0)
+# Circuit breaker: after MIN_CALLS calls in WINDOW seconds with at least FAILURE_RATIO failing,
+# fail fast for COOLDOWN seconds, then let a single probe call through
+CIRCUIT_BREAKER_ENABLED = _env_int("CIRCUIT_BREAKER_ENABLED", 1) != 0
+CIRCUIT_BREAKER_WINDOW_SECONDS = _env_float("CIRCUIT_BREAKER_WINDOW_SECONDS", 30.0)
+CIRCUIT_BREAKER_MIN_CALLS = _env_int("CIRCUIT_BREAKER_MIN_CALLS", 10)
+CIRCUIT_BREAKER_FAILURE_RATIO = _env_float("CIRCUIT_BREAKER_FAILURE_RATIO", 0.5)
+CIRCUIT_BREAKER_COOLDOWN_SECONDS = _env_float("CIRCUIT_BREAKER_COOLDOWN_SECONDS", 15.0)
+# Hedged requests (non-streaming calls only): if no reply after HEDGE_DELAY seconds, send a
+# duplicate request and use whichever finishes first. Costs extra upstream calls, so off by default.
+GEMINI_HEDGE_ENABLED = _env_int("GEMINI_HEDGE_ENABLED", 0) != 0
+GEMINI_HEDGE_DELAY_SECONDS = _env_float("GEMINI_HEDGE_DELAY_SECONDS", 5.0)
+# Threads used to run hedged blocking calls
+GEMINI_HEDGE_MAX_WORKERS = _env_int("GEMINI_HEDGE_MAX_WORKERS", 16)
+
+# --- Load API Key ---
+# The key is loaded on first use (see get_api_key) so importing config does no file I/O
 KEYS_FILE_PATH = os.path.join(CONFIG_DIR, "keys.json")
 
-try:
-    logger.info(f"Attempting to load API key from: {KEYS_FILE_PATH}")
+_api_key = None
+_api_key_lock = threading.Lock()
+
+
+def get_api_key() -> str | None:
+    """
+    Returns the Gemini API key, loading it from keys.json or the GEMINI_API_KEY
+    environment variable on first use. A failed load is not remembered, so a key
+    added later is picked up by the next call.
+    """
+    global _api_key
+    if _api_key:
+        return _api_key
+    with _api_key_lock:
+        if not _api_key:
+            _api_key = _load_api_key()
+        return _api_key
+
+
+def _load_api_key() -> str | None:
+    api_key = None
+    try:
+        logger.info(f"Attempting to load API key from: {KEYS_FILE_PATH}")
+        if os.path.exists(KEYS_FILE_PATH):
+            with open(KEYS_FILE_PATH, 'r') as f:
+                keys = json.load(f)
+                api_key = keys.get("gemini_api_key") or _first_listed_key(keys)
+                if api_key:
+                    logger.info("API key loaded successfully from keys.json.")
+                else:
+                    logger.warning(f"Found {KEYS_FILE_PATH}, but 'gemini_api_key' key is missing or empty.")
+        else:
+            logger.info(f"{KEYS_FILE_PATH} not found. Checking environment variable GEMINI_API_KEY.")
+            api_key = os.environ.get("GEMINI_API_KEY")
+            if api_key:
+                logger.info("API key loaded successfully from environment variable.")
+
+        if not api_key:
+            error_message = f"Gemini API key not found. Please create '{KEYS_FILE_PATH}' with format {{ \"gemini_api_key\": \"YOUR_API_KEY\" }} or set the environment variable GEMINI_API_KEY."
+            logger.error(error_message)
+            raise ValueError(error_message)
+
+    except (FileNotFoundError, json.JSONDecodeError, ValueError, Exception) as e:
+        logger.error(f"Error loading configuration: {e}", exc_info=True)
+        api_key = None # Ensure the key is None if loading fails
+    return api_key
+
+
+def _first_listed_key(keys: dict) -> str | None:
+    """Returns the first key of a "gemini_api_keys" list (strings or {"key": ...} objects)."""
+    for entry in keys.get("gemini_api_keys") or []:
+        key = entry.get("key") if isinstance(entry, dict) else entry
+        if key:
+            return key
+    return None
+
+
+def get_keys_config() -> dict:
+    """
+    Returns the routing configuration from keys.json, read on every call (callers
+    keep the result). Besides the single "gemini_api_key", the file may contain:
+
+        {
+          "gemini_api_keys": [
+            {"name": "team-a", "key": "...", "requests_per_minute": 60, "weight": 2},
+            "another-key"
+          ],
+          "models": [
+            {"name": "gemini-2.5-pro-exp-03-25", "weight": 3},
+            {"name": "gemini-2.5-pro", "weight": 1},
+            {"name": "gemini-2.0-flash", "fallback": true, "requests_per_minute": 200}
+          ]
+        }
+
+    Without keys.json, the GEMINI_API_KEY environment variable provides a single key.
+    Returns an empty dict if no key is configured.
+    """
+    keys = {}
     if os.path.exists(KEYS_FILE_PATH):
-        with open(KEYS_FILE_PATH, 'r') as f:
-            keys = json.load(f)
-            API_KEY = keys.get("gemini_api_key")
-            if API_KEY:
-                logger.info("API key loaded successfully from keys.json.")
-            else:
-                logger.warning(f"Found {KEYS_FILE_PATH}, but 'gemini_api_key' key is missing or empty.")
-    else:
-        logger.info(f"{KEYS_FILE_PATH} not found. Checking environment variable GEMINI_API_KEY.")
-        API_KEY = os.environ.get("GEMINI_API_KEY")
-        if API_KEY:
-            logger.info("API key loaded successfully from environment variable.")
-
-    if not API_KEY:
-        error_message = f"Gemini API key not found. Please create '{KEYS_FILE_PATH}' with format {{ \"gemini_api_key\": \"YOUR_API_KEY\" }} or set the environment variable GEMINI_API_KEY."
-        logger.error(error_message)
-        # Consider if raising an error here is desired, or if the app should proceed
-        # and let gemini_client handle the None key. Raising it stops the app earlier.
-        raise ValueError(error_message)
-
-except (FileNotFoundError, json.JSONDecodeError, ValueError, Exception) as e:
-    logger.error(f"Error loading configuration: {e}", exc_info=True)
-    API_KEY = None # Ensure API_KEY is None if loading fails
+        try:
+            with open(KEYS_FILE_PATH, 'r') as f:
+                keys = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.error(f"Could not read {KEYS_FILE_PATH}: {e}")
+            return {}
+    elif os.environ.get("GEMINI_API_KEY"):
+        keys = {"gemini_api_key": os.environ["GEMINI_API_KEY"]}
+    return keys if isinstance(keys, dict) else {}
+
+
+def __getattr__(name: str):
+    # API_KEY used to be a module constant loaded at import time; keep it readable (lazily)
+    if name == "API_KEY":
+        return get_api_key()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # --- Prompt Template ---
-PROMPT_TEMPLATE = """
+# The template is split in two: the persona preamble only depends on the backstory, so it
+# is rendered once per persona (see persona_prompts.py) and sent as the model's system
+# instruction. Each request then only carries the short user part.
+SYSTEM_PROMPT_TEMPLATE = """
 You are a mean chatbot responding to a user.
 You have been given some background information about this user.
 
@@ -55,9 +314,60 @@ USER BACKSTORY:
 
 Based on this backstory, respond to the user's following request.
 Your response should directly answer the request, while ostentatiously (or sometimes cheekily, depending on the context) weave in weaknesses, elements or the overall tone suggested by their backstory.
+"""
 
+USER_PROMPT_TEMPLATE = """
 USER REQUEST:
 {user_prompt}
 
 YOUR RESPONSE:
 """
+
+# Full single-string prompt, equivalent to the two parts above
+PROMPT_TEMPLATE = SYSTEM_PROMPT_TEMPLATE + USER_PROMPT_TEMPLATE
+
+# --- Persona Prompt Compilation ---
+# Send the persona preamble as a system instruction (set to 0 to send it inline with every request)
+PERSONA_SYSTEM_INSTRUCTIONS = _env_int("PERSONA_SYSTEM_INSTRUCTIONS", 1) != 0
+# Maximum number of compiled persona prompts / per-persona model handles kept in memory
+PERSONA_PROMPT_CACHE_SIZE = _env_int("PERSONA_PROMPT_CACHE_SIZE", 4096)
+# Preambles at least this long (in characters) are registered as Gemini cached context.
+# The API has a minimum cacheable size (tens of thousands of tokens), so this is off (0) by default.
+PERSONA_CONTEXT_CACHE_MIN_CHARS = _env_int("PERSONA_CONTEXT_CACHE_MIN_CHARS", 0)
+PERSONA_CONTEXT_CACHE_TTL_SECONDS = _env_int("PERSONA_CONTEXT_CACHE_TTL_SECONDS", 60 * 60)
+
+# --- Chat Mode ---
+# Multi-turn chat keeps a bounded history per session: the most recent turns are sent
+# verbatim and older ones are folded into a rolling summary, so the per-turn payload
+# stays roughly constant however long the conversation gets.
+# Token counts are estimated locally (about CHAT_CHARS_PER_TOKEN characters per token)
+CHAT_CHARS_PER_TOKEN = 4
+# Estimated tokens of history (summary + recent turns) sent with each message
+CHAT_HISTORY_TOKEN_BUDGET = _env_int("CHAT_HISTORY_TOKEN_BUDGET", 2000)
+# When compacting, older turns are summarized until the recent turns fit in this share of the budget
+CHAT_COMPACT_TARGET_RATIO = _env_float("CHAT_COMPACT_TARGET_RATIO", 0.5)
+# The latest turns are always sent verbatim, however long they are
+CHAT_MIN_RECENT_TURNS = _env_int("CHAT_MIN_RECENT_TURNS", 2)
+CHAT_SUMMARY_MAX_WORDS = _env_int("CHAT_SUMMARY_MAX_WORDS", 150)
+# Sessions idle for longer than this are dropped, along with their history
+CHAT_SESSION_TTL_SECONDS = _env_int("CHAT_SESSION_TTL_SECONDS", 30 * 60)
+# Hard cap on sessions kept in memory; the least recently used are dropped first
+CHAT_MAX_SESSIONS = _env_int("CHAT_MAX_SESSIONS", 2000)
+
+CHAT_SUMMARY_PROMPT_TEMPLATE = """
+Summarize the conversation below between a user and a chatbot in at most {max_words} words.
+Keep facts the user shared about themselves, their requests and anything the chatbot promised.
+Write it as plain notes, without any preamble.
+
+EARLIER SUMMARY:
+{summary}
+
+NEW MESSAGES:
+{transcript}
+
+SUMMARY:
+"""
+
+# Sent at the start of the history in place of the turns that were summarized
+CHAT_SUMMARY_MESSAGE_TEMPLATE = "Summary of our conversation so far:\n{summary}"
+CHAT_SUMMARY_ACK = "Understood."
@@ -1,24 +1,269 @@
-import google.generativeai as genai
-from .config import API_KEY, GEMINI_MODEL_NAME, PROMPT_TEMPLATE
+from .config import (
+    get_api_key, get_keys_config, GEMINI_MODEL_NAME, GEMINI_CLIENT_RETRY_SECONDS,
+    GEMINI_FALLBACK_MODEL_NAME, GEMINI_KEY_REQUESTS_PER_MINUTE, GEMINI_KEY_COOLDOWN_SECONDS,
+    GEMINI_KEY_FAILURE_THRESHOLD, GEMINI_SLOW_MODEL_SECONDS, GEMINI_SLOW_MODEL_PROBE_SECONDS,
+    GEMINI_MAX_CONCURRENCY, GEMINI_MAX_QUEUE_SIZE, GEMINI_QUEUE_TIMEOUT_SECONDS, GEMINI_SINGLE_FLIGHT_ENABLED,
+    GEMINI_SINGLE_FLIGHT_STALL_SECONDS,
+    PERSONA_SYSTEM_INSTRUCTIONS, PERSONA_PROMPT_CACHE_SIZE,
+    PERSONA_CONTEXT_CACHE_MIN_CHARS, PERSONA_CONTEXT_CACHE_TTL_SECONDS,
+    GEMINI_REQUEST_TIMEOUT_SECONDS, GEMINI_MAX_RETRIES, GEMINI_RETRY_BASE_SECONDS,
+    GEMINI_RETRY_MAX_SECONDS, GEMINI_TOTAL_DEADLINE_SECONDS,
+    CIRCUIT_BREAKER_ENABLED, CIRCUIT_BREAKER_WINDOW_SECONDS, CIRCUIT_BREAKER_MIN_CALLS,
+    CIRCUIT_BREAKER_FAILURE_RATIO, CIRCUIT_BREAKER_COOLDOWN_SECONDS,
+    GEMINI_HEDGE_ENABLED, GEMINI_HEDGE_DELAY_SECONDS, GEMINI_HEDGE_MAX_WORKERS,
+)
+from .metrics import UPSTREAM_IN_FLIGHT, UPSTREAM_LATENCY, registry
+from .persona_prompts import CompiledPersonaPrompt, compile_persona_prompt, render_full_prompt, render_user_prompt
+from .rate_limit import TokenBucket
+from .resilience import CallTimeoutError, CircuitBreaker, CircuitOpenError, RetryPolicy, is_retryable
+from .routing import ApiKeySpec, ModelRouter, Route, is_rate_limited, parse_routing_config
+from .single_flight import AsyncSingleFlight, SingleFlight
+import asyncio
+import concurrent.futures
+import contextlib
+import datetime
 import logging # Added for better error reporting
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Iterator
 
 # Get logger instance - configuration should happen in the main entry point (run.py or main.py)
 logger = logging.getLogger(__name__)
 
-# Configure the Gemini client
-model = None # Initialize model to None
-if API_KEY:
+# --- Lazy client factory ---
+# The Gemini SDK is imported and configured on the first request rather than at import
+# time, which keeps startup (and every worker fork) fast. A failed initialization is
+# retried after GEMINI_CLIENT_RETRY_SECONDS instead of disabling the client for good.
+_model = None
+_model_lock = threading.Lock()
+_model_failed_at = None # time.monotonic() of the last failed initialization
+_sdk_lock = threading.Lock()
+_sdk_configured = False
+# Optional override used by tests and benchmarks: factory(system_instruction, model_name) -> model
+_model_factory: Callable[[str | None, str], object] | None = None
+_router: ModelRouter | None = None
+_router_lock = threading.Lock()
+
+
+def get_model():
+    """
+    Returns the shared Gemini model, creating it on first use.
+
+    Thread-safe. Returns None if the client can't be initialized (e.g. no API
+    key); initialization is attempted again once the retry delay has passed.
+    """
+    global _model, _model_failed_at
+    if _model is not None:
+        return _model
+    with _model_lock:
+        if _model is not None:
+            return _model
+        if _model_failed_at is not None and time.monotonic() - _model_failed_at < GEMINI_CLIENT_RETRY_SECONDS:
+            return None
+        try:
+            _model = _create_model()
+            _model_failed_at = None
+            logger.info(f"Gemini client configured successfully for model: {GEMINI_MODEL_NAME}")
+        except Exception as e:
+            logger.error(f"Failed to configure Gemini client: {e}", exc_info=True) # Log traceback
+            _model_failed_at = time.monotonic()
+        return _model
+
+
+def set_model_factory(factory: Callable[[str | None, str], object] | None) -> None:
+    """
+    Replaces the way model objects are created (None restores the Gemini SDK).
+
+    The factory is called with the persona system instruction (or None for the
+    shared model) and the routed model name, and must return an object with
+    generate_content, generate_content_async and start_chat methods compatible
+    with genai.GenerativeModel. No API key is needed while a factory is set.
+    """
+    global _model_factory
+    _model_factory = factory
+    reset_client()
+
+
+def reset_client() -> None:
+    """Drops the router, the shared model and all per-persona handles so they are recreated on next use."""
+    global _model, _model_failed_at, _router
+    with _model_lock:
+        _model = None
+        _model_failed_at = None
+        with _router_lock:
+            _router = None
+    with _persona_models_lock:
+        _persona_models.clear()
+        _route_models.clear()
+
+
+def get_router() -> ModelRouter:
+    """
+    Returns the key/model router, built from keys.json on first use.
+    Raises if no API key is configured (and no model factory is set).
+    """
+    global _router
+    if _router is not None:
+        return _router
+    with _router_lock:
+        if _router is None:
+            keys, models = parse_routing_config(
+                get_keys_config(), GEMINI_MODEL_NAME, GEMINI_FALLBACK_MODEL_NAME, GEMINI_KEY_REQUESTS_PER_MINUTE
+            )
+            if not keys:
+                if _model_factory is None:
+                    raise RuntimeError("No Gemini API key configured.")
+                # Stand-in models don't need a key
+                keys = [ApiKeySpec("default", None)]
+            _router = ModelRouter(
+                keys, models, GEMINI_KEY_COOLDOWN_SECONDS, GEMINI_KEY_FAILURE_THRESHOLD,
+                GEMINI_SLOW_MODEL_SECONDS, GEMINI_SLOW_MODEL_PROBE_SECONDS,
+            )
+            logger.info(
+                f"Routing Gemini calls over {len(keys)} API key(s); models: "
+                + ", ".join(f"{m.name}{' (fallback)' if m.fallback else ''}" for m in models)
+            )
+        return _router
+
+
+def primary_model_names() -> tuple[str, ...]:
+    """Models requests normally go to, e.g. for response cache lookups (fallbacks excluded)."""
     try:
-        genai.configure(api_key=API_KEY)
-        model = genai.GenerativeModel(GEMINI_MODEL_NAME)
-        logger.info(f"Gemini client configured successfully for model: {GEMINI_MODEL_NAME}")
-    except Exception as e:
-        logger.error(f"Failed to configure Gemini client: {e}", exc_info=True) # Log traceback
-        model = None # Ensure model is None if configuration fails
-else:
-    # This log might be redundant if config.py already logged/raised an error
-    logger.error("Gemini API Key was not available during client initialization.")
-    model = None
+        return get_router().primary_model_names
+    except RuntimeError:
+        # No key configured: nothing is generated, so nothing can have been cached under other models
+        return (GEMINI_MODEL_NAME,)
+
+
+def _create_model(system_instruction: str | None = None, route: Route | None = None):
+    router = get_router()
+    route = route or router.default_route
+    if _model_factory is not None:
+        return _model_factory(system_instruction, route.model_name)
+    genai = _configured_sdk()
+    kwargs = {"system_instruction": system_instruction} if system_instruction else {}
+    if len(router.keys) > 1:
+        return _keyed_model_class(genai)(route.model_name, client_manager=_key_client_manager(route.key), **kwargs)
+    # Single key: the process-wide genai.configure() key is the right one
+    return genai.GenerativeModel(route.model_name, **kwargs)
+
+
+def _configured_sdk():
+    """Imports and configures google.generativeai once. Raises if no API key is available."""
+    global _sdk_configured
+    # Deferred: importing the SDK is the slowest part of startup
+    import google.generativeai as genai
+    if _sdk_configured:
+        return genai
+    with _sdk_lock:
+        if not _sdk_configured:
+            api_key = get_api_key()
+            if not api_key:
+                raise RuntimeError("Gemini API Key was not available during client initialization.")
+            genai.configure(api_key=api_key)
+            _sdk_configured = True
+    return genai
+
+
+# --- Per-key clients ---
+# genai.configure() holds a single process-wide key. With several keys, each model handle
+# gets the clients of its own key from a separate SDK client manager. The SDK offers no
+# public hook for this, so the (private) _client/_async_client slots are overridden; the
+# clients themselves are still created lazily by the SDK, as for the default key.
+_key_clients: dict = {}
+_keyed_model_cls = None
+
+
+def _key_client_manager(key: ApiKeySpec):
+    with _sdk_lock:
+        manager = _key_clients.get(key.name)
+        if manager is None:
+            from google.generativeai import client as genai_client
+            manager = genai_client._ClientManager()
+            manager.configure(api_key=key.key)
+            _key_clients[key.name] = manager
+        return manager
+
+
+def _keyed_model_class(genai):
+    """Returns a GenerativeModel subclass whose calls use a given key's client manager."""
+    global _keyed_model_cls
+    if _keyed_model_cls is None:
+        class KeyedGenerativeModel(genai.GenerativeModel):
+            def __init__(self, *args, client_manager, **kwargs):
+                self._client_manager = client_manager
+                super().__init__(*args, **kwargs)
+
+            @property
+            def _client(self):
+                return self._client_manager.get_default_client("generative")
+
+            @_client.setter
+            def _client(self, value):
+                pass # Set to None by the base class; the key's client is always used
+
+            @property
+            def _async_client(self):
+                return self._client_manager.get_default_client("generative_async")
+
+            @_async_client.setter
+            def _async_client(self, value):
+                pass
+
+        _keyed_model_cls = KeyedGenerativeModel
+    return _keyed_model_cls
+# --- End per-key clients ---
+# --- End lazy client factory ---
+
+# --- User-facing messages ---
+ERROR_MESSAGE = "An error occurred while contacting the AI model. Please check the logs for details."
+BUSY_MESSAGE = "I'm getting too many requests right now. Please try again in a moment."
+UNAVAILABLE_MESSAGE = "The AI model is temporarily unavailable. Please try again in a little while."
+EMPTY_RESPONSE_MESSAGE = "Sorry, I couldn't generate a response for that. Please try again or rephrase your request."
+# Candidate finish reasons that mean the answer was cut off by a safety filter
+BLOCKING_FINISH_REASONS = {"SAFETY", "RECITATION", "BLOCKLIST", "PROHIBITED_CONTENT", "SPII"}
+# SDK exceptions raised by the chat session API for blocked prompts / stopped candidates
+BLOCKED_EXCEPTION_NAMES = {"BlockedPromptException", "StopCandidateException"}
+
+# --- Generation results ---
+# Outcome of a generation call. Only STATUS_OK replies are real model output;
+# everything else carries a user-facing message and must not be cached.
+STATUS_OK = "ok"
+STATUS_PARTIAL = "partial" # Intermediate streaming update, more text to follow
+STATUS_BLOCKED = "blocked"
+STATUS_EMPTY = "empty"
+STATUS_ERROR = "error"
+STATUS_BUSY = "busy"
+STATUS_UNAVAILABLE = "unavailable" # Circuit breaker open, upstream not called
+STATUS_INVALID = "invalid" # Rejected before calling the model (missing input or client)
+
+
+class GenerationResult:
+    """The text shown to the user together with how it was produced."""
+
+    __slots__ = ("text", "status", "prompt_tokens", "response_tokens", "model_name")
+
+    def __init__(self, text: str, status: str, prompt_tokens: int | None = None, response_tokens: int | None = None,
+                 model_name: str | None = None):
+        self.text = text
+        self.status = status
+        # Token usage reported by Gemini (None if the model wasn't called or didn't report it)
+        self.prompt_tokens = prompt_tokens
+        self.response_tokens = response_tokens
+        # Model that produced the reply (the router may have used a fallback); None if none was called
+        self.model_name = model_name
+
+    @property
+    def ok(self) -> bool:
+        """True if the text is a complete model reply (safe to cache or reuse)."""
+        return self.status == STATUS_OK
+
+    def __repr__(self) -> str:
+        return f"GenerationResult(status={self.status!r}, text={self.text[:40]!r})"
+# --- End generation results ---
+
 
 def generate_response(backstory: str, user_prompt: str) -> str:
     """
@@ -31,49 +276,987 @@ def generate_response(backstory: str, user_prompt: str) -> str:
     Returns:
         The generated response string from Gemini, or an error message.
     """
-    if not model:
-        logger.error("generate_response called but Gemini client is not initialized.")
-        return "Error: Gemini client is not initialized. Please check API key and configuration logs."
-    if not backstory:
-        logger.warning("generate_response called without backstory.")
-        return "Error: Please provide a user backstory."
-    if not user_prompt:
-        logger.warning("generate_response called without user_prompt.")
-        return "Error: Please provide a user prompt."
+    return generate_result(backstory, user_prompt).text
+
+
+def generate_result(backstory: str, user_prompt: str) -> GenerationResult:
+    """Same as generate_response, but also reports whether the reply is real model output."""
+    if not GEMINI_SINGLE_FLIGHT_ENABLED:
+        return _generate_result(backstory, user_prompt)
+    return _single_flight.do((backstory, user_prompt), lambda: _generate_result(backstory, user_prompt))
 
-    try:
-        # Construct the full prompt using the template
-        full_prompt = PROMPT_TEMPLATE.format(backstory=backstory, user_prompt=user_prompt)
 
+def _generate_result(backstory: str, user_prompt: str) -> GenerationResult:
+    invalid = _validate_request("generate_response", backstory, user_prompt)
+    if invalid:
+        return invalid
+
+    try:
         logger.info("Sending prompt to Gemini...")
-        # print(f"--- DEBUG: Sending Prompt ---\n{full_prompt}\n--------------------------") # Uncomment for debugging
-
-        response = model.generate_content(full_prompt)
-
-        # Handle potential safety blocks or empty responses
-        # Check for prompt_feedback existence before accessing block_reason
-        prompt_feedback = getattr(response, 'prompt_feedback', None)
-        if not response.parts:
-             if prompt_feedback and prompt_feedback.block_reason:
-                 block_reason = prompt_feedback.block_reason
-                 logger.warning(f"Gemini response blocked. Reason: {block_reason}")
-                 # Provide a more user-friendly message if possible
-                 return f"My response was blocked due to safety settings ({block_reason}). Please try phrasing your request differently."
-             else:
-                 # If not blocked, it's likely just an empty response
-                 logger.warning("Gemini returned an empty response with no blocking reason.")
-                 return "Sorry, I couldn't generate a response for that. Please try again or rephrase your request."
-
-        # Accessing response.text is simpler if parts exist
-        generated_text = response.text
-        logger.info("Received response from Gemini.")
-        # print(f"--- DEBUG: Received Response ---\n{generated_text}\n--------------------------") # Uncomment for debugging
-        return generated_text.strip()
+        # Full prompts and replies go to the transcript log (TRANSCRIPTS_ENABLED), not the log
 
+        # Each attempt is routed separately, so a retry can go to another key or model
+        routed = _call_with_retries(
+            lambda: _routed_call(backstory, user_prompt, lambda model, contents: model.generate_content(
+                contents, request_options=_request_options()
+            )),
+            hedge=hedge_enabled,
+        )
+        return _result_from_response(routed.response, routed.model_name)
+
+    except GeminiBusyError as e:
+        logger.warning(f"Rejecting Gemini request, client is busy: {e}")
+        return GenerationResult(BUSY_MESSAGE, STATUS_BUSY)
+    except CircuitOpenError as e:
+        logger.warning(f"Not calling Gemini: {e}")
+        return GenerationResult(UNAVAILABLE_MESSAGE, STATUS_UNAVAILABLE)
     except Exception as e:
         logger.error(f"Error during Gemini API call: {e}", exc_info=True) # Log traceback
         # Consider more specific error handling based on potential API errors
-        return f"An error occurred while contacting the AI model. Please check the logs for details."
+        return GenerationResult(ERROR_MESSAGE, STATUS_ERROR)
+
+
+def generate_response_stream(backstory: str, user_prompt: str) -> Iterator[str]:
+    """
+    Streaming variant of generate_response.
+
+    Yields the accumulated response text each time a new chunk arrives from Gemini,
+    so a Gradio textbox bound to this generator fills in progressively. Validation,
+    safety-block and empty-response handling match generate_response; if the stream
+    is blocked or fails part-way through, the partial text is replaced by the
+    corresponding message.
+
+    Args:
+        backstory: The predefined backstory of the user.
+        user_prompt: The user's current request or question.
+
+    Yields:
+        The response text received so far, or a single error message.
+    """
+    for result in stream_results(backstory, user_prompt):
+        yield result.text
+
+
+def stream_results(backstory: str, user_prompt: str) -> Iterator[GenerationResult]:
+    """
+    Same as generate_response_stream, but yields GenerationResults. Every result
+    except the last has STATUS_PARTIAL; the last one carries the final status.
+    """
+    if not GEMINI_SINGLE_FLIGHT_ENABLED:
+        return _stream_results(backstory, user_prompt)
+    return _single_flight.stream((backstory, user_prompt), lambda: _stream_results(backstory, user_prompt))
+
+
+def _stream_results(backstory: str, user_prompt: str) -> Iterator[GenerationResult]:
+    invalid = _validate_request("generate_response_stream", backstory, user_prompt)
+    if invalid:
+        yield invalid
+        return
+
+    accumulator = _StreamAccumulator()
+    routed = None
+    stream_error = None
+    try:
+        logger.info("Sending streaming prompt to Gemini...")
+        # The SDK fetches the first chunk before returning, so retries cover time-to-first-token
+        routed = _call_with_retries(
+            lambda: _routed_call(backstory, user_prompt, lambda model, contents: model.generate_content(
+                contents, stream=True, request_options=_request_options()
+            ), hold=True)
+        )
+        accumulator.model_name = routed.model_name
+
+        for chunk in routed.response:
+            result = accumulator.add(chunk)
+            yield result
+            if result.status != STATUS_PARTIAL:
+                return
+
+        yield accumulator.finish(routed.response)
+
+    except GeminiBusyError as e:
+        logger.warning(f"Rejecting Gemini request, client is busy: {e}")
+        yield GenerationResult(BUSY_MESSAGE, STATUS_BUSY)
+    except CircuitOpenError as e:
+        logger.warning(f"Not calling Gemini: {e}")
+        yield GenerationResult(UNAVAILABLE_MESSAGE, STATUS_UNAVAILABLE)
+    except Exception as e:
+        # Failures part-way through a stream can't be retried (text was already shown)
+        stream_error = e
+        _record_stream_failure(e)
+        logger.error(f"Error during streaming Gemini API call: {e}", exc_info=True)
+        yield GenerationResult(ERROR_MESSAGE, STATUS_ERROR)
+    except BaseException as e:
+        stream_error = e # Closed by the consumer
+        raise
+    finally:
+        if routed is not None:
+            routed.finish(stream_error, accumulator.usage)
+
+
+# --- Async client with bounded concurrency ---
+class GeminiBusyError(Exception):
+    """Raised when no concurrency slot is available and the wait queue is full (or the wait timed out)."""
+
+
+class ConcurrencyLimiter:
+    """
+    Caps the number of in-flight async Gemini calls and the number of callers
+    allowed to wait for a slot. Callers beyond the queue limit are rejected
+    immediately with GeminiBusyError instead of piling up.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue_size: int, queue_timeout: float | None = None):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max(0, max_queue_size)
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._waiting = 0
+        self._in_flight = 0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """Async context manager holding one concurrency slot for the duration of the block."""
+        if not self._semaphore.locked():
+            # A slot is free, so acquire() returns without suspending
+            await self._semaphore.acquire()
+        elif self._waiting >= self.max_queue_size:
+            raise GeminiBusyError(f"{self._in_flight} calls in flight and {self._waiting} waiting")
+        else:
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                raise GeminiBusyError(f"Timed out after {self.queue_timeout}s waiting for a free slot") from None
+            finally:
+                self._waiting -= 1
+
+        self._in_flight += 1
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+
+# asyncio primitives belong to a single event loop, so keep one limiter per loop
+_limiters: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ConcurrencyLimiter]" = weakref.WeakKeyDictionary()
+
+
+def get_concurrency_limiter() -> ConcurrencyLimiter:
+    """Returns the limiter for the running event loop, creating it from config on first use."""
+    loop = asyncio.get_running_loop()
+    limiter = _limiters.get(loop)
+    if limiter is None:
+        limiter = ConcurrencyLimiter(GEMINI_MAX_CONCURRENCY, GEMINI_MAX_QUEUE_SIZE, GEMINI_QUEUE_TIMEOUT_SECONDS)
+        _limiters[loop] = limiter
+    return limiter
+
+
+async def generate_response_async(backstory: str, user_prompt: str) -> str:
+    """
+    Async variant of generate_response using the SDK's generate_content_async.
+
+    At most GEMINI_MAX_CONCURRENCY calls run at once; up to GEMINI_MAX_QUEUE_SIZE
+    more wait for a slot, and anything beyond that gets BUSY_MESSAGE right away.
+
+    Args:
+        backstory: The predefined backstory of the user.
+        user_prompt: The user's current request or question.
+
+    Returns:
+        The generated response string from Gemini, or an error/busy message.
+    """
+    return (await generate_result_async(backstory, user_prompt)).text
+
+
+async def generate_result_async(backstory: str, user_prompt: str) -> GenerationResult:
+    """Same as generate_response_async, but returns a GenerationResult."""
+    if not GEMINI_SINGLE_FLIGHT_ENABLED:
+        return await _generate_result_async(backstory, user_prompt)
+    return await get_async_single_flight().do(
+        (backstory, user_prompt), lambda: _generate_result_async(backstory, user_prompt)
+    )
+
+
+async def _generate_result_async(backstory: str, user_prompt: str) -> GenerationResult:
+    invalid = _validate_request("generate_response_async", backstory, user_prompt)
+    if invalid:
+        return invalid
+
+    try:
+        async with get_concurrency_limiter().slot():
+            logger.info("Sending async prompt to Gemini...")
+            routed = await _call_with_retries_async(
+                lambda: _routed_call_async(backstory, user_prompt, lambda model, contents: model.generate_content_async(
+                    contents, request_options=_request_options()
+                )),
+                hedge=hedge_enabled,
+            )
+            return _result_from_response(routed.response, routed.model_name)
+
+    except GeminiBusyError as e:
+        logger.warning(f"Rejecting Gemini request, client is busy: {e}")
+        return GenerationResult(BUSY_MESSAGE, STATUS_BUSY)
+    except CircuitOpenError as e:
+        logger.warning(f"Not calling Gemini: {e}")
+        return GenerationResult(UNAVAILABLE_MESSAGE, STATUS_UNAVAILABLE)
+    except Exception as e:
+        logger.error(f"Error during async Gemini API call: {e}", exc_info=True)
+        return GenerationResult(ERROR_MESSAGE, STATUS_ERROR)
+
+
+async def generate_response_stream_async(backstory: str, user_prompt: str) -> AsyncIterator[str]:
+    """
+    Async streaming variant of generate_response, subject to the same concurrency
+    limits as generate_response_async. The slot is held until the stream finishes.
+
+    Args:
+        backstory: The predefined backstory of the user.
+        user_prompt: The user's current request or question.
+
+    Yields:
+        The response text received so far, or a single error/busy message.
+    """
+    async for result in stream_results_async(backstory, user_prompt):
+        yield result.text
+
+
+async def stream_results_async(backstory: str, user_prompt: str) -> AsyncIterator[GenerationResult]:
+    """Same as generate_response_stream_async, but yields GenerationResults (see stream_results)."""
+    make_stream = lambda: _stream_results_async("generate_response_stream_async", backstory, user_prompt)
+    if GEMINI_SINGLE_FLIGHT_ENABLED:
+        stream = get_async_single_flight().stream((backstory, user_prompt), make_stream)
+    else:
+        stream = make_stream()
+    async for result in stream:
+        yield result
+
+
+async def stream_chat_results_async(backstory: str, history: list[dict], user_prompt: str) -> AsyncIterator[GenerationResult]:
+    """
+    Multi-turn variant of stream_results_async using the SDK's chat session API.
+
+    Args:
+        backstory: The predefined backstory of the user.
+        history: Earlier messages as [{"role": "user" | "model", "parts": [text]}, ...].
+            The caller owns and bounds the history; it is sent as-is with this message.
+        user_prompt: The user's new message.
+
+    Yields:
+        GenerationResults as in stream_results; the last one carries the final status.
+    """
+    async for result in _stream_results_async("stream_chat_results_async", backstory, user_prompt, history):
+        yield result
+
+
+async def generate_text_result_async(prompt: str) -> GenerationResult:
+    """
+    Sends a raw prompt to the shared model, without any persona. Used for
+    housekeeping calls such as summarizing chat history. Subject to the same
+    concurrency limits and retries as the persona calls.
+    """
+    if get_model() is None:
+        return GenerationResult("Error: Gemini client is not initialized.", STATUS_INVALID)
+    try:
+        async with get_concurrency_limiter().slot():
+            routed = await _call_with_retries_async(
+                lambda: _routed_call_async(None, prompt, lambda model, contents: model.generate_content_async(
+                    contents, request_options=_request_options()
+                ))
+            )
+            return _result_from_response(routed.response, routed.model_name)
+    except GeminiBusyError as e:
+        logger.warning(f"Rejecting Gemini request, client is busy: {e}")
+        return GenerationResult(BUSY_MESSAGE, STATUS_BUSY)
+    except CircuitOpenError as e:
+        logger.warning(f"Not calling Gemini: {e}")
+        return GenerationResult(UNAVAILABLE_MESSAGE, STATUS_UNAVAILABLE)
+    except Exception as e:
+        logger.error(f"Error during async Gemini API call: {e}", exc_info=True)
+        return GenerationResult(ERROR_MESSAGE, STATUS_ERROR)
+
+
+async def _stream_results_async(caller: str, backstory: str, user_prompt: str,
+                                history: list[dict] | None = None) -> AsyncIterator[GenerationResult]:
+    """Shared body of stream_results_async and stream_chat_results_async (history=None: single-shot)."""
+    invalid = _validate_request(caller, backstory, user_prompt)
+    if invalid:
+        yield invalid
+        return
+
+    accumulator = _StreamAccumulator()
+    routed = None
+    stream_error = None
+    try:
+        async with get_concurrency_limiter().slot():
+            if history is None:
+                logger.info("Sending async streaming prompt to Gemini...")
+                send = lambda model, contents: model.generate_content_async(
+                    contents, stream=True, request_options=_request_options()
+                )
+            else:
+                logger.info(f"Sending chat message to Gemini with {len(history)} history messages...")
+                # A fresh chat session per attempt: the history lives with the caller, not the SDK
+                send = lambda model, contents: model.start_chat(history=history).send_message_async(
+                    contents, stream=True, request_options=_request_options()
+                )
+            routed = await _call_with_retries_async(lambda: _routed_call_async(backstory, user_prompt, send, hold=True))
+            accumulator.model_name = routed.model_name
+
+            async for chunk in _iterate_with_deadline(routed.response, GEMINI_REQUEST_TIMEOUT_SECONDS):
+                result = accumulator.add(chunk)
+                yield result
+                if result.status != STATUS_PARTIAL:
+                    return
+
+            yield accumulator.finish(routed.response)
+
+    except GeminiBusyError as e:
+        logger.warning(f"Rejecting Gemini request, client is busy: {e}")
+        yield GenerationResult(BUSY_MESSAGE, STATUS_BUSY)
+    except CircuitOpenError as e:
+        logger.warning(f"Not calling Gemini: {e}")
+        yield GenerationResult(UNAVAILABLE_MESSAGE, STATUS_UNAVAILABLE)
+    except Exception as e:
+        if type(e).__name__ in BLOCKED_EXCEPTION_NAMES:
+            # The chat session API raises instead of returning a blocked response
+            prompt_feedback = e.args[0] if e.args else None
+            yield _blocked_result(getattr(prompt_feedback, "block_reason", None) or "SAFETY")
+            return
+        stream_error = e
+        _record_stream_failure(e)
+        logger.error(f"Error during async streaming Gemini API call: {e}", exc_info=True)
+        yield GenerationResult(ERROR_MESSAGE, STATUS_ERROR)
+    except BaseException as e:
+        stream_error = e # Closed or cancelled by the consumer
+        raise
+    finally:
+        if routed is not None:
+            routed.finish(stream_error, accumulator.usage)
+# --- End async client ---
+
+
+# --- Request coalescing ---
+# Identical requests (same backstory and prompt) that arrive while one is in flight
+# attach to it instead of calling Gemini again - e.g. many users trying the same
+# popular prompt at once. Followers get copies of the results without token counts,
+# so usage is only accounted for once.
+_COALESCED = registry.counter(
+    "gemini_coalesced_requests_total", "Requests served by attaching to an identical in-flight call.", ("path",))
+
+
+def _shared_result(result: GenerationResult) -> GenerationResult:
+    return GenerationResult(result.text, result.status, model_name=result.model_name)
+
+
+_single_flight = SingleFlight(
+    share=_shared_result, on_follow=lambda: _COALESCED.inc(path="sync"),
+    stall_timeout=GEMINI_SINGLE_FLIGHT_STALL_SECONDS or None,
+)
+# Like the limiter, asyncio state belongs to one event loop
+_async_flights: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncSingleFlight]" = weakref.WeakKeyDictionary()
+
+
+def get_async_single_flight() -> AsyncSingleFlight:
+    """Returns the single-flight group for the running event loop."""
+    loop = asyncio.get_running_loop()
+    flights = _async_flights.get(loop)
+    if flights is None:
+        flights = AsyncSingleFlight(share=_shared_result, on_follow=lambda: _COALESCED.inc(path="async"))
+        _async_flights[loop] = flights
+    return flights
+# --- End request coalescing ---
+
+
+# --- Resilience (deadlines, retries, circuit breaker, hedging) ---
+retry_policy = RetryPolicy(GEMINI_MAX_RETRIES, GEMINI_RETRY_BASE_SECONDS, GEMINI_RETRY_MAX_SECONDS, GEMINI_TOTAL_DEADLINE_SECONDS)
+circuit_breaker = None # None when disabled
+if CIRCUIT_BREAKER_ENABLED:
+    circuit_breaker = CircuitBreaker(
+        CIRCUIT_BREAKER_WINDOW_SECONDS, CIRCUIT_BREAKER_MIN_CALLS,
+        CIRCUIT_BREAKER_FAILURE_RATIO, CIRCUIT_BREAKER_COOLDOWN_SECONDS,
+    )
+hedge_enabled = GEMINI_HEDGE_ENABLED
+# Rate limit on every upstream attempt, retries included (set by batch.py's --rate; None = none)
+attempt_rate_limiter: TokenBucket | None = None
+_hedge_executor = None
+_hedge_executor_lock = threading.Lock()
+
+
+def configure_retries(policy: RetryPolicy, hedge: bool | None = None,
+                      rate_limiter: TokenBucket | None = None) -> None:
+    """
+    Replaces the retry policy for all later calls, optionally switches hedging
+    on or off and sets the rate limiter every attempt (retries included) takes a
+    token from (None = no limit). Used by batch.py, whose retry and rate flags
+    apply here rather than in an extra retry loop of its own.
+    """
+    global retry_policy, hedge_enabled, attempt_rate_limiter
+    retry_policy = policy
+    if hedge is not None:
+        hedge_enabled = hedge
+    attempt_rate_limiter = rate_limiter
+
+
+def _request_options() -> dict:
+    """Per-call options passed to the SDK; the timeout is enforced by the transport."""
+    return {"timeout": GEMINI_REQUEST_TIMEOUT_SECONDS}
+
+
+def _record_outcome(error: BaseException | None) -> None:
+    """Feeds a call outcome to the circuit breaker. Only transient errors count as upstream failures."""
+    if circuit_breaker is None or isinstance(error, GeminiBusyError):
+        # No key had budget left - nothing was sent upstream
+        return
+    if error is not None and is_rate_limited(error) and get_router().can_route():
+        # One key's quota: the router cools that key down and the retry goes to another
+        return
+    if error is not None and is_retryable(error):
+        circuit_breaker.record_failure()
+    else:
+        # Success, or a non-transient error (bad request etc.) that shows upstream is responding
+        circuit_breaker.record_success()
+
+
+def _observe_attempt(started: float, error: BaseException | None) -> None:
+    """Records the latency of one upstream attempt, labelled with how it ended."""
+    if error is None:
+        outcome = "ok"
+    elif isinstance(error, (CircuitOpenError, GeminiBusyError)):
+        return
+    elif isinstance(error, TimeoutError):
+        outcome = "timeout"
+    else:
+        outcome = "retryable_error" if is_retryable(error) else "error"
+    UPSTREAM_LATENCY.observe(time.perf_counter() - started, outcome=outcome)
+
+
+def _collect_breaker_metrics() -> None:
+    stats = circuit_breaker.stats()
+    _BREAKER_OPEN.set(0 if stats["state"] == "closed" else 1)
+    _BREAKER_OPENED.set(stats["times_opened"])
+    _BREAKER_REJECTED.set(stats["rejected_calls"])
+
+
+if circuit_breaker is not None:
+    _BREAKER_OPEN = registry.gauge("gemini_circuit_breaker_open", "1 while the circuit breaker is open or half-open.")
+    _BREAKER_OPENED = registry.gauge("gemini_circuit_breaker_opened", "Times the circuit breaker has opened since startup.")
+    _BREAKER_REJECTED = registry.gauge("gemini_circuit_breaker_rejected_calls", "Calls rejected by the open circuit breaker since startup.")
+    registry.add_collector(_collect_breaker_metrics)
+
+
+# Per key/model route accounting. Keys are labelled by their name in keys.json, never by the key itself.
+_ROUTE_STATS = registry.gauge(
+    "gemini_route", "Per API key and model: requests, failures, rate_limited, in_flight, cooling_down, "
+    "budget_available, prompt_tokens, response_tokens.", ("key", "model", "stat"))
+_ROUTE_FALLBACKS = registry.gauge("gemini_route_fallbacks", "Calls routed to a fallback model since startup.")
+_ROUTE_STAT_NAMES = (
+    "requests", "failures", "rate_limited", "in_flight", "cooling_down", "budget_available",
+    "prompt_tokens", "response_tokens",
+)
+
+
+def _collect_route_metrics() -> None:
+    router = _router
+    if router is None:
+        return # Not built until the first call
+    for route in router.stats():
+        for stat in _ROUTE_STAT_NAMES:
+            value = route[stat]
+            if value is not None:
+                _ROUTE_STATS.set(float(value), key=route["key"], model=route["model"], stat=stat)
+    _ROUTE_FALLBACKS.set(router.fallbacks_used)
+
+
+registry.add_collector(_collect_route_metrics)
+
+
+def _record_stream_failure(error: BaseException) -> None:
+    if not isinstance(error, (CircuitOpenError, GeminiBusyError)):
+        _record_outcome(error)
+
+
+def _call_with_retries(call: Callable[[], object], hedge: bool = False):
+    """
+    Runs a blocking upstream call with the circuit breaker and jittered
+    exponential retries for transient errors. Raises the last error (or
+    CircuitOpenError) if it doesn't succeed.
+    """
+    started = time.monotonic()
+    retry_number = 0
+    while True:
+        if attempt_rate_limiter is not None:
+            attempt_rate_limiter.acquire()
+        if circuit_breaker is not None:
+            circuit_breaker.before_call()
+        attempt_started = time.perf_counter()
+        try:
+            with UPSTREAM_IN_FLIGHT.track_in_progress():
+                response = _hedged_call(call) if hedge else call()
+        except Exception as e:
+            _observe_attempt(attempt_started, e)
+            _record_outcome(e)
+            if not is_retryable(e):
+                raise
+            retry_number += 1
+            delay = retry_policy.next_delay(retry_number, started)
+            if delay is None:
+                raise
+            logger.warning(f"Transient Gemini error ({type(e).__name__}: {e}); retry {retry_number} in {delay:.2f}s.")
+            time.sleep(delay)
+            continue
+        _observe_attempt(attempt_started, None)
+        _record_outcome(None)
+        return response
+
+
+async def _call_with_retries_async(make_call: Callable[[], object], hedge: bool = False):
+    """
+    Async counterpart of _call_with_retries. make_call must bound its own attempt by the
+    request timeout (_routed_call_async does, so the router sees the timeout as the route's failure).
+    """
+    started = time.monotonic()
+    retry_number = 0
+    while True:
+        if attempt_rate_limiter is not None:
+            await _acquire_attempt_token(attempt_rate_limiter)
+        if circuit_breaker is not None:
+            circuit_breaker.before_call()
+        attempt_started = time.perf_counter()
+        try:
+            with UPSTREAM_IN_FLIGHT.track_in_progress():
+                if hedge:
+                    response = await _hedged_call_async(make_call)
+                else:
+                    response = await make_call()
+        except Exception as e:
+            _observe_attempt(attempt_started, e)
+            _record_outcome(e)
+            if not is_retryable(e):
+                raise
+            retry_number += 1
+            delay = retry_policy.next_delay(retry_number, started)
+            if delay is None:
+                raise
+            logger.warning(f"Transient Gemini error ({type(e).__name__}: {e}); retry {retry_number} in {delay:.2f}s.")
+            await asyncio.sleep(delay)
+            continue
+        _observe_attempt(attempt_started, None)
+        _record_outcome(None)
+        return response
+
+
+async def _acquire_attempt_token(rate_limiter: TokenBucket) -> None:
+    """Waits for a rate limiter token without blocking the event loop."""
+    while not rate_limiter.try_acquire():
+        await asyncio.sleep(1.0 / rate_limiter.rate)
+
+
+async def _with_deadline(awaitable, timeout: float | None = None):
+    if timeout is None:
+        timeout = GEMINI_REQUEST_TIMEOUT_SECONDS
+    try:
+        return await asyncio.wait_for(awaitable, timeout=timeout)
+    except asyncio.TimeoutError:
+        raise CallTimeoutError(f"Gemini call exceeded its {timeout}s deadline") from None
+
+
+async def _iterate_with_deadline(stream, timeout: float):
+    """Iterates an async stream, failing if any single chunk takes longer than the timeout."""
+    iterator = stream.__aiter__()
+    while True:
+        try:
+            chunk = await _with_deadline(iterator.__anext__(), timeout)
+        except StopAsyncIteration:
+            return
+        yield chunk
+
+
+def _get_hedge_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _hedge_executor_lock:
+            if _hedge_executor is None:
+                _hedge_executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=GEMINI_HEDGE_MAX_WORKERS, thread_name_prefix="gemini-hedge"
+                )
+    return _hedge_executor
+
+
+def _hedged_call(call: Callable[[], object]):
+    """
+    Runs a blocking call; if it hasn't finished after GEMINI_HEDGE_DELAY_SECONDS,
+    starts a duplicate and returns whichever succeeds first. A blocking call can't
+    be cancelled, so the loser runs to completion and its result is discarded.
+    """
+    executor = _get_hedge_executor()
+    primary = executor.submit(call)
+    try:
+        return primary.result(timeout=GEMINI_HEDGE_DELAY_SECONDS)
+    except concurrent.futures.TimeoutError:
+        pass
+
+    logger.info(f"No Gemini reply after {GEMINI_HEDGE_DELAY_SECONDS}s, sending a hedged request.")
+    pending = {primary, executor.submit(call)}
+    last_error = None
+    while pending:
+        done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            last_error = future.exception()
+    raise last_error
+
+
+async def _hedged_call_async(make_call: Callable[[], object]):
+    """Async counterpart of _hedged_call; the losing request is cancelled."""
+    tasks = [asyncio.ensure_future(make_call())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=GEMINI_HEDGE_DELAY_SECONDS)
+        if done:
+            return tasks[0].result()
+
+        logger.info(f"No Gemini reply after {GEMINI_HEDGE_DELAY_SECONDS}s, sending a hedged request.")
+        tasks.append(asyncio.ensure_future(make_call()))
+        pending = set(tasks)
+        last_error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                last_error = task.exception()
+        raise last_error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+# --- End resilience ---
+
+
+# --- Per-persona models ---
+class _PersonaModel:
+    """A model handle with one persona's preamble attached (as system instruction or cached context)."""
+
+    __slots__ = ("model", "inline_prefix", "expires_at")
+
+    def __init__(self, model, inline_prefix: bool, expires_at: float | None = None):
+        self.model = model
+        # True if the preamble could not be attached and must be sent with every request
+        self.inline_prefix = inline_prefix
+        # Cached contexts expire server-side; the handle is rebuilt before that happens
+        self.expires_at = expires_at
+
+
+_persona_models: "OrderedDict[tuple, _PersonaModel]" = OrderedDict()
+_persona_models_lock = threading.Lock()
+# Persona-less model handles for routes other than the default one
+_route_models: dict[tuple, object] = {}
+
+
+class _RoutedResponse:
+    """
+    A response and the route it was sent on. A held route (streams) still
+    counts as in flight on its key until finish() is called at the end of the
+    stream; other routes are released as soon as the response arrives.
+    """
+
+    __slots__ = ("response", "route", "latency", "held")
+
+    def __init__(self, response, route: Route, latency: float, held: bool):
+        self.response = response
+        self.route = route
+        self.latency = latency # Until the response (for streams: the first chunk) arrived
+        self.held = held
+
+    @property
+    def model_name(self) -> str:
+        return self.route.model_name
+
+    def finish(self, error: BaseException | None = None, usage: tuple = (None, None)) -> None:
+        """Releases a held route with the stream's outcome and total token usage."""
+        if not self.held:
+            return
+        self.held = False
+        router = get_router()
+        router.release(self.route, self.latency, error)
+        router.record_usage(self.route, *usage)
+
+
+def _routed_call(backstory: str | None, user_prompt: str, send: Callable[[object, object], object],
+                 hold: bool = False) -> _RoutedResponse:
+    """
+    Runs send(model, contents) on the least-loaded healthy key/model route and
+    reports the outcome to the router. backstory=None sends user_prompt as-is
+    to the persona-less model. Raises GeminiBusyError if no route is available.
+    With hold=True the route stays reserved after success until the caller
+    finishes the returned _RoutedResponse.
+    """
+    route = _acquire_route()
+    started = time.monotonic()
+    try:
+        model, contents = _prepare_request(backstory, user_prompt, route)
+        response = send(model, contents)
+    except BaseException as e:
+        get_router().release(route, time.monotonic() - started, e)
+        raise
+    return _routed_response(route, started, response, hold)
+
+
+async def _routed_call_async(backstory: str | None, user_prompt: str, send: Callable[[object, object], object],
+                             hold: bool = False) -> _RoutedResponse:
+    """
+    Async counterpart of _routed_call; send returns an awaitable, which is cut off
+    after GEMINI_REQUEST_TIMEOUT_SECONDS. The timeout is reported to the router as
+    the route's failure (a cancellation from outside says nothing about the route).
+    """
+    route = _acquire_route()
+    started = time.monotonic()
+    try:
+        model, contents = _prepare_request(backstory, user_prompt, route)
+        response = await _with_deadline(send(model, contents))
+    except BaseException as e:
+        get_router().release(route, time.monotonic() - started, e)
+        raise
+    return _routed_response(route, started, response, hold)
+
+
+def _acquire_route() -> Route:
+    route = get_router().acquire()
+    if route is None:
+        raise GeminiBusyError("Every API key is rate limited or out of request budget")
+    return route
+
+
+def _routed_response(route: Route, started: float, response, hold: bool) -> _RoutedResponse:
+    routed = _RoutedResponse(response, route, time.monotonic() - started, held=True)
+    if not hold:
+        routed.finish(usage=_token_usage(response))
+    return routed
+
+
+def _prepare_request(backstory: str | None, user_prompt: str, route: Route):
+    """
+    Returns the model handle to call on a route and the per-request contents.
+
+    The persona preamble is compiled once per backstory. When it is attached to
+    the model as a system instruction, the request itself only carries the
+    rendered user prompt. Without a backstory the prompt is sent as-is.
+    """
+    if backstory is None:
+        return _get_shared_model(route), user_prompt
+    compiled = compile_persona_prompt(backstory)
+    persona_model = _get_persona_model(compiled, route)
+    if persona_model.inline_prefix:
+        return persona_model.model, render_full_prompt(compiled, user_prompt)
+    return persona_model.model, render_user_prompt(user_prompt)
+
+
+def _get_persona_model(compiled: CompiledPersonaPrompt, route: Route) -> _PersonaModel:
+    """Returns the (LRU-cached) model handle for a compiled persona prompt on a route."""
+    cache_key = (compiled.digest, route.key_name, route.model_name)
+    with _persona_models_lock:
+        persona_model = _persona_models.get(cache_key)
+        if persona_model is not None and (persona_model.expires_at is None or persona_model.expires_at > time.time()):
+            _persona_models.move_to_end(cache_key)
+            return persona_model
+
+    # Built outside the lock - creating a cached context is a network call
+    persona_model = _build_persona_model(compiled, route)
+    with _persona_models_lock:
+        _persona_models[cache_key] = persona_model
+        _persona_models.move_to_end(cache_key)
+        while len(_persona_models) > PERSONA_PROMPT_CACHE_SIZE:
+            _persona_models.popitem(last=False)
+    return persona_model
+
+
+def _build_persona_model(compiled: CompiledPersonaPrompt, route: Route) -> _PersonaModel:
+    """Creates a model handle for a persona, falling back to the shared model with an inline preamble."""
+    if not PERSONA_SYSTEM_INSTRUCTIONS:
+        return _PersonaModel(_get_shared_model(route), inline_prefix=True)
+
+    # Cached contexts belong to the key that created them, so they are only used with a single key
+    if (_model_factory is None and PERSONA_CONTEXT_CACHE_MIN_CHARS and len(get_router().keys) == 1
+            and len(compiled.system_instruction) >= PERSONA_CONTEXT_CACHE_MIN_CHARS):
+        try:
+            genai = _configured_sdk()
+            cached_context = genai.caching.CachedContent.create(
+                model=route.model_name,
+                display_name=f"persona-{compiled.digest}",
+                system_instruction=compiled.system_instruction,
+                ttl=datetime.timedelta(seconds=PERSONA_CONTEXT_CACHE_TTL_SECONDS),
+            )
+            logger.info(f"Registered cached context for persona prompt {compiled.digest} ({route.model_name}).")
+            # Refresh a little before the server drops the context
+            expires_at = time.time() + PERSONA_CONTEXT_CACHE_TTL_SECONDS * 0.9
+            return _PersonaModel(genai.GenerativeModel.from_cached_content(cached_context), False, expires_at)
+        except Exception as e:
+            logger.warning(f"Could not create cached context for persona prompt {compiled.digest}: {e}")
+
+    try:
+        return _PersonaModel(_create_model(compiled.system_instruction, route), inline_prefix=False)
+    except Exception as e:
+        # Older SDKs don't support system_instruction
+        logger.warning(f"System instructions unavailable, sending persona prompt inline: {e}")
+        return _PersonaModel(_get_shared_model(route), inline_prefix=True)
+
+
+def _get_shared_model(route: Route):
+    """Returns the persona-less model handle for a route (the shared model for the default route)."""
+    if route is get_router().default_route:
+        return _require_model()
+    cache_key = (route.key_name, route.model_name)
+    shared_model = _route_models.get(cache_key)
+    if shared_model is None:
+        shared_model = _create_model(None, route)
+        with _persona_models_lock:
+            _route_models[cache_key] = shared_model
+    return shared_model
+
+
+def _require_model():
+    """Returns the shared model, raising instead of returning None so a broken handle is never cached."""
+    shared_model = get_model()
+    if shared_model is None:
+        raise RuntimeError("Gemini client is not initialized.")
+    return shared_model
+# --- End per-persona models ---
+
+
+# --- Response helpers (shared by the blocking and streaming paths) ---
+def _validate_request(caller: str, backstory: str, user_prompt: str) -> GenerationResult | None:
+    """Returns an invalid result if the client or inputs are not usable, otherwise None."""
+    if get_model() is None:
+        logger.error(f"{caller} called but Gemini client is not initialized.")
+        return GenerationResult("Error: Gemini client is not initialized. Please check API key and configuration logs.", STATUS_INVALID)
+    if not backstory:
+        logger.warning(f"{caller} called without backstory.")
+        return GenerationResult("Error: Please provide a user backstory.", STATUS_INVALID)
+    if not user_prompt:
+        logger.warning(f"{caller} called without user_prompt.")
+        return GenerationResult("Error: Please provide a user prompt.", STATUS_INVALID)
+    return None
+
+
+def _result_from_response(response, model_name: str | None = None) -> GenerationResult:
+    """Interprets a complete (non-streaming) response from model_name."""
+    # Handle potential safety blocks or empty responses
+    if not response.parts:
+        return _with_usage(_blocked_or_empty_result(response), _token_usage(response))
+
+    # Accessing response.text is simpler if parts exist
+    generated_text = response.text
+    logger.info("Received response from Gemini.")
+    return GenerationResult(generated_text.strip(), STATUS_OK, *_token_usage(response), model_name=model_name)
+
+
+class _StreamAccumulator:
+    """Collects streamed chunks and turns them into partial/final GenerationResults."""
+
+    __slots__ = ("text", "usage", "model_name")
+
+    def __init__(self):
+        self.text = ""
+        self.usage = (None, None)
+        self.model_name = None # Set once the stream's route is known
+
+    def add(self, chunk) -> GenerationResult:
+        usage = _token_usage(chunk)
+        if usage != (None, None):
+            # Each chunk reports the running totals, so the latest one wins
+            self.usage = usage
+        chunk_text = _chunk_text(chunk)
+        if chunk_text:
+            self.text += chunk_text
+            return GenerationResult(self.text, STATUS_PARTIAL)
+        if _is_blocked(chunk):
+            # Blocked before or part-way through the answer - don't leave half an insult on screen
+            return _with_usage(_blocked_or_empty_result(chunk), self.usage)
+        return GenerationResult(self.text, STATUS_PARTIAL)
+
+    def finish(self, response) -> GenerationResult:
+        if not self.text.strip():
+            # Stream finished without producing any text
+            return _with_usage(_blocked_or_empty_result(response), self.usage)
+        logger.info("Finished streaming response from Gemini.")
+        # Final result with surrounding whitespace removed, matching generate_response
+        return GenerationResult(self.text.strip(), STATUS_OK, *self.usage, model_name=self.model_name)
+
+
+def _token_usage(response) -> tuple[int | None, int | None]:
+    """Returns (prompt_tokens, response_tokens) from a response's usage_metadata, if reported."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return None, None
+    prompt_tokens = getattr(usage, "prompt_token_count", None)
+    response_tokens = getattr(usage, "candidates_token_count", None)
+    return prompt_tokens or None, response_tokens or None
+
+
+def _with_usage(result: GenerationResult, usage: tuple) -> GenerationResult:
+    result.prompt_tokens, result.response_tokens = usage
+    return result
+
+
+def _chunk_text(response) -> str:
+    """Returns the text contained in a (possibly partial) response, or "" if it has no text parts."""
+    try:
+        parts = response.parts
+    except Exception:
+        # .parts raises if the response has no usable candidate
+        return ""
+    return "".join(getattr(part, "text", "") or "" for part in parts)
+
+
+def _block_reason(response):
+    """Returns the prompt block reason or the candidate's safety finish reason, if any."""
+    # Check for prompt_feedback existence before accessing block_reason
+    prompt_feedback = getattr(response, 'prompt_feedback', None)
+    if prompt_feedback and prompt_feedback.block_reason:
+        return prompt_feedback.block_reason
+
+    # A candidate can also be stopped part-way through generation
+    for candidate in getattr(response, 'candidates', None) or []:
+        finish_reason = getattr(candidate, 'finish_reason', None)
+        if getattr(finish_reason, 'name', None) in BLOCKING_FINISH_REASONS:
+            return finish_reason.name
+    return None
+
+
+def _is_blocked(response) -> bool:
+    return _block_reason(response) is not None
+
+
+def _blocked_or_empty_result(response) -> GenerationResult:
+    """Builds the user-facing result for a response without any text."""
+    block_reason = _block_reason(response)
+    if block_reason:
+        return _blocked_result(block_reason)
+    # If not blocked, it's likely just an empty response
+    logger.warning("Gemini returned an empty response with no blocking reason.")
+    return GenerationResult(EMPTY_RESPONSE_MESSAGE, STATUS_EMPTY)
+
+
+def _blocked_result(block_reason) -> GenerationResult:
+    logger.warning(f"Gemini response blocked. Reason: {block_reason}")
+    # Provide a more user-friendly message if possible
+    return GenerationResult(
+        f"My response was blocked due to safety settings ({block_reason}). Please try phrasing your request differently.",
+        STATUS_BLOCKED,
+    )
+# --- End response helpers ---
 
 # Example usage (optional, for testing this module directly)
 # Note: Running this directly will fail because of the relative import '.config'
@@ -1,68 +1,43 @@
 # c:\Users\1134931\chat_bot\app\gradio_interface.py
+import asyncio
 import gradio as gr
-import json
+import html
 import os
 import logging
+import time
 # Assuming gemini_client.py handles text generation based on backstory
-from .gemini_client import generate_response
+from .gemini_client import (
+    GenerationResult, STATUS_ERROR, STATUS_INVALID, STATUS_OK, STATUS_PARTIAL,
+    generate_result, primary_model_names, stream_results_async,
+)
+from .config import (
+    GRADIO_CONCURRENCY_LIMIT, GRADIO_QUEUE_MAX_SIZE,
+    IMAGE_BASE_PATH, PERSONA_IMAGE_URL_PREFIX, PERSONA_THUMBNAIL_DIR,
+)
+from .response_cache import get_response_cache, make_cache_key
+from .near_duplicates import near_duplicate_index
+from .persona_store import persona_store
+from .persona_images import persona_images
+from .chat_sessions import chat_sessions, stream_chat_reply
+from .transcripts import transcript_log
+from .logging_setup import configure_logging
+from .metrics import (
+    IMAGE_LOOKUP_LATENCY, PROMPT_TOKENS, REQUEST_LATENCY, REQUESTS, REQUESTS_IN_FLIGHT,
+    RESPONSE_TOKENS, TIME_TO_FIRST_TOKEN,
+)
 # We are not using imagen_client anymore for this approach
 # from .imagen_client import generate_image_from_text
 
 # Get logger instance
 logger = logging.getLogger(__name__)
 
-# --- Configuration ---
-# Define the base path for relative image paths in backstories.json
-# Assuming 'images' folder is at the root of the chat_bot project
-IMAGE_BASE_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), 'images'))
-logger.info(f"Image base path set to: {IMAGE_BASE_PATH}")
-
-
-# --- Load Backstories ---
-BACKSTORIES_FILE_PATH = os.path.join(os.path.dirname(__file__), "backstories.json")
-# backstories_data will store the full object: {"backstory": "...", "image": "..."}
-backstories_data = {}
-persona_names = []
-default_persona_info = None # Store the info for the default persona
-
-try:
-    if os.path.exists(BACKSTORIES_FILE_PATH):
-        with open(BACKSTORIES_FILE_PATH, 'r', encoding='utf-8') as f:
-            loaded_json = json.load(f)
-            if isinstance(loaded_json, dict):
-                # Validate structure slightly - ensure values are dicts with 'backstory'
-                valid_data = {}
-                for name, data in loaded_json.items():
-                    if isinstance(data, dict) and "backstory" in data:
-                        valid_data[name] = data # Store the whole dict {backstory, image?}
-                    else:
-                         logger.warning(f"Skipping persona '{name}': Invalid format or missing 'backstory' key in backstories.json.")
-
-                backstories_data = valid_data
-                persona_names = list(backstories_data.keys())
-
-                # Get info for the default persona (first valid one)
-                if persona_names:
-                    default_persona_info = backstories_data.get(persona_names[0])
-
-                if not persona_names:
-                    logger.warning(f"{BACKSTORIES_FILE_PATH} is empty or has no valid personas.")
-                else:
-                    logger.info(f"Successfully loaded {len(persona_names)} personas from {BACKSTORIES_FILE_PATH}.")
-            else:
-                 logger.error(f"Invalid format in {BACKSTORIES_FILE_PATH}. Expected a JSON object (dictionary).")
-                 persona_names = ["Error: Invalid JSON format"]
-
-    else:
-        logger.error(f"Backstories file not found at: {BACKSTORIES_FILE_PATH}")
-        persona_names = ["Error: backstories.json not found"]
-except json.JSONDecodeError:
-    logger.error(f"Error decoding JSON from {BACKSTORIES_FILE_PATH}.", exc_info=True)
-    persona_names = ["Error: Invalid JSON in backstories.json"]
-except Exception as e:
-    logger.error(f"An unexpected error occurred loading backstories: {e}", exc_info=True)
-    persona_names = ["Error: Could not load backstories"]
-# --- End Load Backstories ---
+# --- Personas ---
+# Personas live in a PersonaStore that reloads backstories.json when it changes,
+# so adding a persona doesn't need a restart
+BACKSTORIES_FILE_PATH = persona_store.path
+# Regenerate persona thumbnails whenever a new set of personas is loaded
+persona_store.add_reload_listener(persona_images.warm)
+# --- End Personas ---
 
 
 def handle_submission(selected_persona_name: str, user_prompt: str) -> str:
@@ -70,61 +45,293 @@ def handle_submission(selected_persona_name: str, user_prompt: str) -> str:
     Wrapper function to get the backstory text based on the selected name
     and then call the actual generation function.
     """
-    if not selected_persona_name or "Error:" in selected_persona_name:
+    started = time.perf_counter()
+    persona = persona_store.get(selected_persona_name)
+    result = None
+    with REQUESTS_IN_FLIGHT.track_in_progress():
+        try:
+            result = _generate_for_persona(persona, selected_persona_name, user_prompt)
+        finally:
+            _record_submission("sync", persona, user_prompt, result, started)
+    return result.text
+
+
+def _generate_for_persona(persona, selected_persona_name: str, user_prompt: str) -> GenerationResult:
+    # persona is None for empty, unknown or error placeholder selections
+    if persona is None:
         logger.warning("Submission attempt with invalid persona selection.")
-        return "Error: Please select a valid persona from the dropdown."
+        return GenerationResult("Error: Please select a valid persona from the dropdown.", STATUS_INVALID)
     if not user_prompt:
         logger.warning("Submission attempt with empty prompt.")
         # Let generate_response handle the specific error message
-        return generate_response("", user_prompt) # Pass empty backstory
-
-    # Get the persona data object
-    persona_info = backstories_data.get(selected_persona_name)
+        return generate_result("", user_prompt) # Pass empty backstory
 
-    if not isinstance(persona_info, dict) or "backstory" not in persona_info:
-        logger.error(f"Incomplete or invalid data for persona '{selected_persona_name}'.")
-        return f"Error: Internal mismatch. Could not find backstory details for '{selected_persona_name}'."
+    backstory_text = persona.backstory
 
-    backstory_text = persona_info["backstory"]
+    cached = _cached_result(selected_persona_name, backstory_text, user_prompt)
+    if cached is not None:
+        return cached
 
     logger.info(f"Generating response for persona '{selected_persona_name}'.")
-    return generate_response(backstory_text, user_prompt)
+    result = generate_result(backstory_text, user_prompt)
+    # Only real replies are cached - never blocked, empty or error messages
+    if result.ok:
+        _cache_reply(selected_persona_name, backstory_text, user_prompt, result)
+    return result
+
+async def handle_submission_stream(selected_persona_name: str, user_prompt: str):
+    """
+    Streaming counterpart of handle_submission, used by the submit button.
+    Yields the response text received so far so the output textbox fills in
+    progressively instead of waiting for the complete reply. Runs on the event
+    loop via the async Gemini client, so it doesn't tie up a worker thread and
+    is subject to the client's concurrency limits.
+    """
+    started = time.perf_counter()
+    persona = persona_store.get(selected_persona_name)
+    result = None
+    first_token_seen = False
+    with REQUESTS_IN_FLIGHT.track_in_progress():
+        try:
+            async for result in _stream_for_persona(persona, selected_persona_name, user_prompt):
+                if not first_token_seen and result.text and result.status in _TEXT_STATUSES:
+                    first_token_seen = True
+                    TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - started, handler="stream")
+                yield result.text
+        finally:
+            # Also runs when the client disconnects and Gradio closes the generator
+            if result is not None and result.status == STATUS_PARTIAL:
+                result = GenerationResult(result.text, STATUS_CANCELLED)
+            _record_submission("stream", persona, user_prompt, result, started)
+
+
+async def _stream_for_persona(persona, selected_persona_name: str, user_prompt: str):
+    if persona is None:
+        logger.warning("Submission attempt with invalid persona selection.")
+        yield GenerationResult("Error: Please select a valid persona from the dropdown.", STATUS_INVALID)
+        return
+    if not user_prompt:
+        logger.warning("Submission attempt with empty prompt.")
+        # Let the client handle the specific error message
+        async for result in stream_results_async("", user_prompt):
+            yield result
+        return
+
+    backstory_text = persona.backstory
+
+    # The cache may read and write SQLite; keep that off the event loop
+    cached = await asyncio.to_thread(_cached_result, selected_persona_name, backstory_text, user_prompt)
+    if cached is not None:
+        yield cached
+        return
+
+    logger.info(f"Streaming response for persona '{selected_persona_name}'.")
+    result = None
+    async for result in stream_results_async(backstory_text, user_prompt):
+        yield result
+    # Only complete replies are cached - never blocked, empty, error or busy messages
+    if result is not None and result.ok:
+        await asyncio.to_thread(_cache_reply, selected_persona_name, backstory_text, user_prompt, result)
+
+
+def _cached_result(persona_name: str, backstory: str, user_prompt: str) -> GenerationResult | None:
+    """
+    Looks the prompt up in the response cache under each primary model, then
+    among near-duplicate earlier prompts. Returns the cached result, or None on a
+    miss (or when caching is disabled). Replies from a fallback model are cached
+    under that model and so never served here.
+    Blocking - async callers run it in a thread.
+    """
+    response_cache = get_response_cache()
+    if response_cache is None:
+        return None
+    for model_name in primary_model_names():
+        cached_reply = response_cache.get(make_cache_key(persona_name, backstory, model_name, user_prompt))
+        if cached_reply is not None:
+            logger.info(f"Serving cached response for persona '{persona_name}'.")
+            return GenerationResult(cached_reply, STATUS_CACHED, model_name=model_name)
+    similar_reply = _near_duplicate_reply(persona_name, backstory, user_prompt)
+    if similar_reply is not None:
+        return GenerationResult(similar_reply, STATUS_SIMILAR)
+    return None
+
+
+def _near_duplicate_reply(persona_name: str, backstory: str, user_prompt: str) -> str | None:
+    """The cached reply of a nearly identical earlier prompt of the persona, or None."""
+    if near_duplicate_index is None:
+        return None
+    response_cache = get_response_cache()
+    found = near_duplicate_index.find_reply(
+        persona_name, backstory, user_prompt,
+        lambda key: response_cache.get(key, record_stats=False), response_cache.contains,
+    )
+    if found is None:
+        return None
+    reply, similarity = found
+    logger.info(f"Serving cached response of a similar prompt (similarity {similarity:.2f}) for persona '{persona_name}'.")
+    return reply
+
+
+def _cache_reply(persona_name: str, backstory: str, user_prompt: str, result: GenerationResult) -> None:
+    """Caches a complete reply under the model that produced it."""
+    response_cache = get_response_cache()
+    if response_cache is None or result.model_name is None:
+        return
+    cache_key = make_cache_key(persona_name, backstory, result.model_name, user_prompt)
+    response_cache.put(cache_key, result.text)
+    # Near-duplicate lookups serve whatever the key resolves to, so only primary-model replies are indexed
+    if near_duplicate_index is not None and result.model_name in primary_model_names():
+        near_duplicate_index.add(persona_name, backstory, user_prompt, cache_key)
+
+
+# --- Chat mode ---
+async def handle_chat_message(selected_persona_name: str, user_message: str, chat_history: list | None,
+                              session_id: str | None):
+    """
+    Sends one message in multi-turn chat mode.
+
+    The browser only holds the session id (in gr.State) and the displayed
+    transcript; the history sent to the model is kept server-side in
+    chat_sessions, bounded by a token budget with older turns summarized.
+
+    Yields:
+        (chat transcript as [user, reply] pairs, cleared input box, session id)
+    """
+    started = time.perf_counter()
+    chat_history = [list(pair) for pair in chat_history or []]
+    persona = persona_store.get(selected_persona_name)
+    if not user_message:
+        yield chat_history, user_message, session_id
+        return
+    if persona is None:
+        logger.warning("Chat message with invalid persona selection.")
+        chat_history.append([user_message, "Error: Please select a valid persona from the dropdown."])
+        yield chat_history, "", session_id
+        return
+
+    session = chat_sessions.get_or_create(session_id, persona.name, persona.backstory)
+    chat_history.append([user_message, ""])
+    yield chat_history, "", session.session_id
+
+    result = None
+    first_token_seen = False
+    with REQUESTS_IN_FLIGHT.track_in_progress():
+        try:
+            async for result in stream_chat_reply(session, user_message):
+                if not first_token_seen and result.text and result.status in _TEXT_STATUSES:
+                    first_token_seen = True
+                    TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - started, handler="chat")
+                chat_history[-1][1] = result.text
+                yield chat_history, "", session.session_id
+        finally:
+            if result is not None and result.status == STATUS_PARTIAL:
+                result = GenerationResult(result.text, STATUS_CANCELLED)
+            _record_submission("chat", persona, user_message, result, started)
+
+
+def reset_chat(session_id: str | None = None):
+    """Forgets the server-side history of a chat session and clears the transcript."""
+    chat_sessions.drop(session_id)
+    return [], None
+# --- End chat mode ---
+
+
+# --- Submission metrics ---
+STATUS_CACHED = "cached" # Served from the response cache, Gemini not called
+STATUS_SIMILAR = "similar" # Served the cached reply of a near-duplicate prompt
+STATUS_CANCELLED = "cancelled" # Stream closed before the reply was complete
+# Statuses whose text is an actual reply (counts towards time to first token)
+_TEXT_STATUSES = {STATUS_PARTIAL, STATUS_OK, STATUS_CACHED, STATUS_SIMILAR}
+
+
+def _record_submission(handler: str, persona, user_prompt: str, result: GenerationResult | None, started: float) -> None:
+    """Records latency, outcome and token usage of one submission, and its transcript if enabled."""
+    latency = time.perf_counter() - started
+    REQUEST_LATENCY.observe(latency, handler=handler)
+    # Only known persona names are used as labels, so arbitrary input can't add series
+    persona_label = persona.name if persona is not None else "unknown"
+    status = result.status if result is not None else STATUS_ERROR
+    REQUESTS.inc(persona=persona_label, status=status)
+    if result is not None:
+        if result.prompt_tokens:
+            PROMPT_TOKENS.inc(result.prompt_tokens, persona=persona_label)
+        if result.response_tokens:
+            RESPONSE_TOKENS.inc(result.response_tokens, persona=persona_label)
+    if transcript_log is not None:
+        transcript_log.record(
+            handler, persona_label, user_prompt or "", result.text if result is not None else "", status, latency,
+            result.prompt_tokens if result is not None else None,
+            result.response_tokens if result is not None else None,
+        )
+# --- End submission metrics ---
 
 # --- Function to update the image display ---
-def update_local_image(selected_persona_name: str) -> tuple[str | None, gr.update]:
+def update_local_image(selected_persona_name: str, image_url_prefix: str = PERSONA_IMAGE_URL_PREFIX) -> tuple[str, gr.update]:
     """
-    Gets the local image path for the selected persona, if available and valid.
-    Returns the image path (or None) and a Gradio update object for visibility.
+    Gets the thumbnail for the selected persona, if available and valid.
+    Returns the <img> markup (or "") and a Gradio update object for visibility.
+
+    Thumbnails are generated once and looked up in memory, and the browser
+    loads them directly from image_url_prefix (a static route with long-lived
+    cache headers) rather than through Gradio's file cache.
     """
-    image_path_to_load = None
+    with IMAGE_LOOKUP_LATENCY.time():
+        return _persona_image_update(selected_persona_name, image_url_prefix)
+
+
+def _persona_image_update(selected_persona_name: str, image_url_prefix: str) -> tuple[str, gr.update]:
+    image_html = ""
     is_visible = False
 
-    if selected_persona_name and "Error:" not in selected_persona_name:
-        persona_info = backstories_data.get(selected_persona_name)
-        if isinstance(persona_info, dict):
-            relative_image_path = persona_info.get("image") # Get the path like "images/bartek.jpg"
-            if relative_image_path:
-                # Construct full path relative to the defined base path
-                full_image_path = os.path.join(IMAGE_BASE_PATH, os.path.normpath(relative_image_path))
-                logger.debug(f"Checking for image at: {full_image_path}")
-                if os.path.exists(full_image_path):
-                    image_path_to_load = full_image_path
-                    is_visible = True
-                    logger.info(f"Found local image for '{selected_persona_name}': {full_image_path}")
-                else:
-                    logger.warning(f"Image path specified for '{selected_persona_name}' but file not found: {full_image_path}")
-            else:
-                 logger.debug(f"No 'image' key found for persona '{selected_persona_name}'.")
+    if selected_persona_name:
+        persona = persona_store.get(selected_persona_name)
+        if persona is not None:
+            thumbnail = persona_images.get(persona.image)
+            if thumbnail is not None:
+                image_url = html.escape(thumbnail.url(image_url_prefix), quote=True)
+                image_alt = html.escape(persona.name, quote=True)
+                image_html = f'<img src="{image_url}" alt="{image_alt}">'
+                is_visible = True
+            elif persona.image:
+                logger.debug(f"No thumbnail available for '{selected_persona_name}'.")
         else:
              logger.warning(f"Could not find persona data for '{selected_persona_name}' when updating image.")
 
-    # Return the path (or None) and the visibility update
-    return image_path_to_load, gr.update(visible=is_visible)
+    # Return the markup and the visibility update
+    return image_html, gr.update(visible=is_visible)
 # --- End image update function ---
 
 
-def create_chatbot_interface():
-    """Creates the Gradio interface for the chatbot."""
+def refresh_persona_choices(selected_persona_name: str | None = None):
+    """
+    Returns a dropdown update with the store's current personas, picking up any
+    changes to backstories.json. Keeps the current selection if it still exists.
+    """
+    snapshot = persona_store.snapshot
+    if snapshot.get(selected_persona_name) is not None:
+        value = selected_persona_name
+    else:
+        value = snapshot.default_name
+    return gr.update(choices=snapshot.dropdown_choices(), value=value)
+
+
+def create_chatbot_interface(concurrency_limit: int | None = None, max_size: int | None = None,
+                             image_url_prefix: str = PERSONA_IMAGE_URL_PREFIX):
+    """
+    Creates the Gradio interface for the chatbot.
+
+    Args:
+        concurrency_limit: Maximum number of submissions processed at once.
+            Defaults to GRADIO_CONCURRENCY_LIMIT from config.
+        max_size: Maximum number of submissions waiting in the Gradio queue before
+            new ones are rejected. Defaults to GRADIO_QUEUE_MAX_SIZE from config.
+        image_url_prefix: URL path persona thumbnails are served from. Defaults to
+            the static route in main.py; run.py passes Gradio's file route instead.
+    """
+    if concurrency_limit is None:
+        concurrency_limit = GRADIO_CONCURRENCY_LIMIT
+    if max_size is None:
+        max_size = GRADIO_QUEUE_MAX_SIZE
 
     custom_css = """
     /* ... (your existing CSS rules) ... */
@@ -145,11 +352,18 @@ def create_chatbot_interface():
     }
     """
 
+    personas = persona_store.snapshot
+    # Picks up backstories.json edits in the background (main.py restarts it in each worker)
+    persona_store.start_watcher()
+
+    def update_persona_image(selected_persona_name: str):
+        return update_local_image(selected_persona_name, image_url_prefix)
+
     # --- Determine initial image state ---
-    initial_image_path, initial_visibility = None, gr.update(visible=False)
-    if default_persona_info:
+    initial_image_html, initial_visibility = "", gr.update(visible=False)
+    if personas.default_name:
         # Use the update function to get initial state based on default selection
-        initial_image_path, initial_visibility = update_local_image(persona_names[0])
+        initial_image_html, initial_visibility = update_persona_image(personas.default_name)
     # --- End initial image state ---
 
 
@@ -160,68 +374,133 @@ def create_chatbot_interface():
             "incorporating the persona's hidden backstory into its answer."
         )
 
-        with gr.Row():
-            # --- Left Column ---
-            with gr.Column(scale=1):
-                persona_selector = gr.Dropdown(
-                    label="Select Persona",
-                    choices=persona_names,
-                    value=persona_names[0] if persona_names and "Error:" not in persona_names[0] else None,
-                    info="Choose the user persona.",
-                    elem_id="persona-dropdown"
-                )
-                prompt_input = gr.Textbox(
-                    label="User Prompt",
-                    placeholder="e.g., Give me a simple recipe for salmon.",
-                    lines=5,
-                    info="What does the user want to ask or know?"
-                )
-
-                # --- Add the Image component for local files ---
-                # Place it here, below the prompt in the left column
-                persona_local_image = gr.Image(
-                    label="Persona Image",
-                    value=initial_image_path, # Set initial image
-                    visible=initial_visibility['visible'], # Set initial visibility
-                    elem_id="persona-local-image",
-                    show_label=False, # Hide label if desired
-                    interactive=False,
-                    type="filepath" # Expecting a file path
-                )
-                # --- End Image component ---
-
-            # --- Right Column ---
-            with gr.Column(scale=2):
-                output_response = gr.Textbox(
-                    label="Chatbot Response",
-                    lines=15, # Adjusted lines slightly
-                    interactive=False
-                )
+        with gr.Tabs():
+            with gr.Tab("Single prompt"):
+                with gr.Row():
+                    # --- Left Column ---
+                    with gr.Column(scale=1):
+                        persona_selector = gr.Dropdown(
+                            label="Select Persona",
+                            choices=personas.dropdown_choices(),
+                            value=personas.default_name,
+                            info="Choose the user persona.",
+                            elem_id="persona-dropdown"
+                        )
+                        prompt_input = gr.Textbox(
+                            label="User Prompt",
+                            placeholder="e.g., Give me a simple recipe for salmon.",
+                            lines=5,
+                            info="What does the user want to ask or know?"
+                        )
+
+                        # --- Persona image ---
+                        # Place it here, below the prompt in the left column. Plain HTML so the
+                        # browser fetches the cached thumbnail URL instead of a Gradio upload copy.
+                        persona_local_image = gr.HTML(
+                            value=initial_image_html, # Set initial image
+                            visible=initial_visibility['visible'], # Set initial visibility
+                            elem_id="persona-local-image"
+                        )
+                        # --- End persona image ---
+
+                    # --- Right Column ---
+                    with gr.Column(scale=2):
+                        output_response = gr.Textbox(
+                            label="Chatbot Response",
+                            lines=15, # Adjusted lines slightly
+                            interactive=False
+                        )
+
+                submit_button = gr.Button("Get Response", variant="primary") # Moved button definition here for clarity
+
+            # --- Chat tab ---
+            # Multi-turn mode: the transcript is shown in a Chatbot, while the history
+            # sent to the model lives server-side (see chat_sessions.py)
+            with gr.Tab("Chat"):
+                with gr.Row():
+                    with gr.Column(scale=1):
+                        chat_persona_selector = gr.Dropdown(
+                            label="Select Persona",
+                            choices=personas.dropdown_choices(),
+                            value=personas.default_name,
+                            info="Changing persona starts a new conversation.",
+                            elem_id="chat-persona-dropdown"
+                        )
+                        chat_clear_button = gr.Button("New Conversation")
+                    with gr.Column(scale=2):
+                        chatbot = gr.Chatbot(label="Conversation", height=400)
+                        chat_input = gr.Textbox(
+                            label="Message",
+                            placeholder="e.g., And what should I serve with it?",
+                            lines=2
+                        )
+                        chat_send_button = gr.Button("Send", variant="primary")
+                # Per-browser-session id of the server-side chat history
+                chat_session_id = gr.State(None)
+            # --- End chat tab ---
 
         # --- Event Listeners ---
         # Update image when dropdown selection changes
         persona_selector.change(
-            fn=update_local_image,
+            fn=update_persona_image,
             inputs=persona_selector,
-            # Output path to the image value, and visibility update to the image component itself
+            # Output the image markup, and visibility update to the image component itself
             outputs=[persona_local_image, persona_local_image]
         )
 
+        # Refresh persona choices on page load and when the dropdown is opened,
+        # so personas added to backstories.json show up without a restart
+        interface.load(fn=refresh_persona_choices, outputs=persona_selector)
+        persona_selector.focus(
+            fn=refresh_persona_choices,
+            inputs=persona_selector,
+            outputs=persona_selector,
+            show_progress="hidden"
+        )
+
         # Handle text generation on button click
-        submit_button = gr.Button("Get Response", variant="primary") # Moved button definition here for clarity
+        # The streaming handler is a generator, so Gradio updates the textbox as chunks arrive
         submit_button.click(
-            fn=handle_submission,
+            fn=handle_submission_stream,
             inputs=[persona_selector, prompt_input],
             outputs=output_response,
-            show_progress="minimal"
+            show_progress="minimal",
+            concurrency_limit=concurrency_limit,
+            concurrency_id="generation"
+        )
+
+        # Chat mode: send on button click or Enter; the handler streams into the Chatbot
+        # and clears the input box. Chat turns share the submit button's concurrency limit.
+        chat_event_args = dict(
+            fn=handle_chat_message,
+            inputs=[chat_persona_selector, chat_input, chatbot, chat_session_id],
+            outputs=[chatbot, chat_input, chat_session_id],
+            show_progress="minimal",
+            concurrency_limit=concurrency_limit,
+            concurrency_id="generation"
+        )
+        chat_send_button.click(**chat_event_args)
+        chat_input.submit(**chat_event_args)
+        chat_clear_button.click(fn=reset_chat, inputs=chat_session_id, outputs=[chatbot, chat_session_id])
+        chat_persona_selector.change(fn=reset_chat, inputs=chat_session_id, outputs=[chatbot, chat_session_id])
+        interface.load(fn=refresh_persona_choices, outputs=chat_persona_selector)
+        chat_persona_selector.focus(
+            fn=refresh_persona_choices,
+            inputs=chat_persona_selector,
+            outputs=chat_persona_selector,
+            show_progress="hidden"
         )
         # --- End Event Listeners ---
 
+    # Bound the Gradio queue so bursts get rejected quickly instead of waiting indefinitely
+    interface.queue(max_size=max_size)
+    logger.info(f"Gradio queue configured (concurrency_limit={concurrency_limit}, max_size={max_size}).")
+
     return interface
 
 # Main block remains the same
 if __name__ == "__main__":
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    configure_logging()
     print("Launching Gradio interface directly for testing...")
     # Make sure the 'images' directory exists relative to the project root if needed
     if not os.path.exists(IMAGE_BASE_PATH):
@@ -229,8 +508,8 @@ if __name__ == "__main__":
          # os.makedirs(IMAGE_BASE_PATH) # Optionally create it
 
     try:
-        app = create_chatbot_interface()
-        app.launch()
+        app = create_chatbot_interface(image_url_prefix=f"/file={PERSONA_THUMBNAIL_DIR}")
+        app.launch(allowed_paths=[PERSONA_THUMBNAIL_DIR])
     except ImportError as e:
         print(f"ImportError: {e}. Running this file directly might fail.")
         print("Try running using 'python run.py' from the 'chat_bot' parent directory.")
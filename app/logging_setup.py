@@ -0,0 +1,94 @@
+# c:\Users\1134931\chat_bot\app\logging_setup.py
+import atexit
+import copy
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+
+from .config import LOG_LEVEL, LOG_FORMAT, LOG_FILE, LOG_QUEUE_SIZE
+from .metrics import registry
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+_LOG_RECORDS_DROPPED = registry.counter(
+    "chatbot_log_records_dropped_total", "Log records dropped because the log writer fell behind.")
+
+_listener: logging.handlers.QueueListener | None = None # Set once configured
+_configure_lock = threading.Lock()
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the background writer without ever waiting: when the queue
+    is full the record is dropped and counted instead of blocking the request.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Only what can't wait is done here: the message is merged with its args (they
+        # may change after the call returns) and tracebacks are rendered (they hold
+        # frames). Formatting happens on the writer thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _LOG_RECORDS_DROPPED.inc()
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # The stop marker must get through even when the queue is full
+        self.queue.put(self._sentinel)
+
+
+def configure_logging(level: str | int | None = None) -> None:
+    """
+    Sets up logging for the process: the root logger gets a queue handler and a
+    background thread writes the records to the console (and LOG_FILE, if set).
+
+    Safe to call more than once; only the first call has an effect. Entry points
+    (run.py, app/main.py, batch.py) call it instead of logging.basicConfig.
+    """
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        formatter = logging.Formatter(LOG_FORMAT)
+        handlers = [logging.StreamHandler()]
+        if LOG_FILE:
+            log_dir = os.path.dirname(os.path.abspath(LOG_FILE))
+            os.makedirs(log_dir, exist_ok=True)
+            handlers.append(logging.FileHandler(LOG_FILE, encoding="utf-8"))
+        for handler in handlers:
+            handler.setFormatter(formatter)
+
+        log_queue = queue.Queue(maxsize=max(1, LOG_QUEUE_SIZE))
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_NonBlockingQueueHandler(log_queue))
+        root.setLevel(level or LOG_LEVEL)
+
+        _listener = _Listener(log_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    logger.info(f"Logging configured (level={logging.getLevelName(root.level)}, file={LOG_FILE or 'none'}).")
+
+
+def shutdown_logging() -> None:
+    """Writes out the records still queued and stops the background writer."""
+    global _listener
+    with _configure_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
@@ -1,37 +1,183 @@
 # c:\Users\1134931\chat_bot\app\main.py
-from flask import Flask
+"""
+ASGI application for production serving (uvicorn or gunicorn with uvicorn workers).
+
+    uvicorn app.main:create_app --factory --host 0.0.0.0 --port 7860
+    gunicorn -c gunicorn.conf.py app.main:app
+    python run.py --production
+
+Each worker process builds the app once: personas are parsed and the Gemini
+client is set up at startup, not per request. On SIGTERM the worker reports
+not ready but keeps serving for SERVER_SHUTDOWN_DELAY_SECONDS, so the load
+balancer takes it out of rotation first; then the server stops accepting
+connections and gives the generations in flight up to
+SERVER_GRACEFUL_SHUTDOWN_SECONDS to finish.
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import signal
+import threading
+import time
+
 import gradio as gr
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from fastapi.staticfiles import StaticFiles
+
+from . import gemini_client
+from .config import PERSONA_IMAGE_URL_PREFIX, PERSONA_THUMBNAIL_DIR, SERVER_SHUTDOWN_DELAY_SECONDS
 from .gradio_interface import create_chatbot_interface
-import logging
+from .logging_setup import configure_logging
+from .metrics import registry as metrics_registry
+from .persona_store import persona_store
+from .response_cache import get_response_cache
+
+# Servers import this module directly, so it sets up logging itself (a no-op if run.py already did)
+configure_logging()
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+
+class _ImmutableStaticFiles(StaticFiles):
+    """Static files that browsers may cache forever (thumbnail names contain a content hash)."""
+
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
+
+
+class _WorkerState:
+    """Lifecycle of this worker process, as seen by the readiness check."""
+
+    __slots__ = ("started", "draining")
+
+    def __init__(self):
+        self.started = False
+        self.draining = False
+
+
+def _initialize_worker() -> None:
+    """One-time, per-process setup, so the first requests don't pay for it."""
+    started = time.perf_counter()
+    snapshot = persona_store.snapshot # Parses backstories.json and precompiles persona prompts
+    persona_store.start_watcher() # Hot reload runs in this thread, never on a request
+    if gemini_client.get_model() is None:
+        # Not fatal: the client retries on use, and readiness reports it until then
+        logger.error("Gemini client could not be initialized at startup.")
+    get_response_cache() # Opens (and for SQLite, creates) the cache database
+    logger.info(f"Worker {os.getpid()} initialized {len(snapshot.names)} personas in {time.perf_counter() - started:.2f}s.")
+
+
+def _install_shutdown_hook(state: _WorkerState, delay: float):
+    """
+    Wraps the server's SIGTERM handler (uvicorn installs it before the app starts):
+    the signal marks the worker as draining right away and reaches the server
+    `delay` seconds later, which is when it stops accepting connections. Until
+    then /ready answers 503 while requests are still served. A second signal,
+    or a delay of 0, goes straight through.
+
+    Returns a function that restores the wrapped handler, or None if no hook
+    was installed (signals can only be handled in the main thread).
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return None
+    loop = asyncio.get_running_loop()
+    server_handler = signal.getsignal(signal.SIGTERM)
+    if not callable(server_handler):
+        return None
+
+    def on_sigterm(sig, frame):
+        if state.draining or delay <= 0:
+            state.draining = True
+            server_handler(sig, frame)
+            return
+        state.draining = True
+        logger.info(f"Received SIGTERM; reporting not ready for {delay:.0f}s before shutting down.")
+        loop.call_soon_threadsafe(loop.call_later, delay, server_handler, sig, None)
+
+    signal.signal(signal.SIGTERM, on_sigterm)
+    return lambda: signal.signal(signal.SIGTERM, server_handler)
+
+
+def create_app() -> FastAPI:
+    """
+    Builds the ASGI app: the Gradio interface at '/' plus the operational routes
+    (/health, /ready, /metrics, /cache/stats and the persona thumbnails).
+    """
+    state = _WorkerState()
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Blocking file and SDK setup, kept off the event loop
+        await asyncio.to_thread(_initialize_worker)
+        restore_signal_handler = _install_shutdown_hook(state, SERVER_SHUTDOWN_DELAY_SECONDS)
+        state.started = True
+        yield
+        # The server has stopped accepting connections and waited for open ones by now
+        state.draining = True
+        if restore_signal_handler is not None:
+            restore_signal_handler()
+        await asyncio.to_thread(persona_store.stop_watcher)
+
+    app = FastAPI(lifespan=lifespan)
+
+    @app.get("/health")
+    def health_check():
+        """Liveness: the process is up and serving."""
+        return PlainTextResponse("OK")
+
+    @app.get("/ready")
+    def readiness_check():
+        """Readiness: personas are loaded, the Gemini client is set up and the worker is not shutting down."""
+        checks = {
+            "started": state.started,
+            "draining": state.draining,
+            "personas": len(persona_store.snapshot.names),
+            "model_client": gemini_client.get_model() is not None,
+        }
+        ready = checks["started"] and not checks["draining"] and checks["personas"] > 0 and checks["model_client"]
+        if gemini_client.circuit_breaker is not None:
+            # Reported, but not a reason to take the worker out of rotation - every worker shares the upstream
+            checks["circuit_breaker"] = gemini_client.circuit_breaker.stats()["state"]
+        return JSONResponse({"ready": ready, **checks}, status_code=200 if ready else 503)
+
+    @app.get("/metrics")
+    def metrics():
+        """Latency, throughput, token and cache metrics in the Prometheus text format."""
+        return Response(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    @app.get("/cache/stats")
+    def cache_stats():
+        """Response cache hit/miss counters for dashboards."""
+        response_cache = get_response_cache()
+        if response_cache is None:
+            return {"enabled": False}
+        return {"enabled": True, **response_cache.stats()}
+
+    os.makedirs(PERSONA_THUMBNAIL_DIR, exist_ok=True)
+    app.mount(PERSONA_IMAGE_URL_PREFIX, _ImmutableStaticFiles(directory=PERSONA_THUMBNAIL_DIR), name="persona-images")
+
+    # Mounted last: the Gradio app at '/' would otherwise shadow the routes above
+    logger.info("Creating Gradio interface...")
+    gradio_interface = create_chatbot_interface()
+    gr.mount_gradio_app(app, gradio_interface, path="/")
+    logger.info("Gradio interface mounted successfully at path '/'")
+    return app
+
+
+_app: FastAPI | None = None
+
 
-# Configure logging (ensure it's configured only once, e.g., here or in run.py)
-# If run.py also configures it, you might remove this line to avoid potential conflicts.
-# However, having it here ensures main.py can log even if run differently.
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-
-# Create the Flask app instance
-flask_app = Flask(__name__) # Use a different variable name initially to avoid confusion
-
-# Create the Gradio interface
-logging.info("Creating Gradio interface...")
-gradio_interface = create_chatbot_interface()
-logging.info("Gradio interface created.")
-
-# Mount the Gradio interface onto the Flask app at the root path '/'
-# Call the function without reassigning the flask_app variable
-logging.info("Mounting Gradio interface onto Flask app...")
-gr.mount_gradio_app(flask_app, gradio_interface, path="/")
-logging.info("Gradio interface mounted successfully at path '/'")
-
-# You can add other Flask routes here if needed, using flask_app
-@flask_app.route("/health")
-def health_check():
-    """A simple health check endpoint."""
-    logging.info("Health check endpoint accessed.")
-    return "OK", 200
-
-# Rename the final variable back to 'app' so run.py can import it
-app = flask_app
-logging.info("Flask app setup complete.")
-
-# Note: We don't run app.run() here; that's handled by run.py or a WSGI server.
+def __getattr__(name: str):
+    # For servers that import an app object (gunicorn app.main:app). Built on first access,
+    # so importing this module (or using create_app as a factory) doesn't build a second one.
+    global _app
+    if name == "app":
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,256 @@
+# c:\Users\1134931\chat_bot\app\metrics.py
+import bisect
+import contextlib
+import logging
+import math
+import threading
+import time
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from cache hits up to slow model replies
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+
+
+def _format_labels(label_names: tuple, label_values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, label_values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Base class: a named metric family with a fixed set of label names."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict | None) -> tuple:
+        if not self.label_names:
+            return ()
+        labels = labels or {}
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._render_samples())
+        return lines
+
+    def _render_samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing count, per label set."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> dict[tuple, float]:
+        """Current value of every label set, keyed by the tuple of label values."""
+        with self._lock:
+            return dict(self._values)
+
+    def _render_samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, per label set."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = ()):
+        super().__init__(name, documentation, label_names)
+        self._values: dict[tuple, float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    @contextlib.contextmanager
+    def track_in_progress(self, **labels):
+        """Increments the gauge for the duration of the block."""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _render_samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in fixed cumulative buckets, per label set."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts (+Inf last), sum, count]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[key] = state
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observes the wall-clock duration of the block."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state[2] if state else 0
+
+    def _render_samples(self) -> list[str]:
+        with self._lock:
+            items = [(key, (list(state[0]), state[1], state[2])) for key, state in self._values.items()]
+        lines = []
+        for key, (bucket_counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), bucket_counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds the app's metrics and renders them in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, label_names: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, label_names))
+
+    def gauge(self, name: str, documentation: str, label_names: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, label_names))
+
+    def histogram(self, name: str, documentation: str, label_names: tuple = (), buckets: tuple = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, label_names, buckets))
+
+    def add_collector(self, collector) -> None:
+        """Registers collector(), called before each render to refresh gauges computed elsewhere."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}", exc_info=True)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric: _Metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+
+# --- App metrics ---
+registry = MetricsRegistry()
+
+# Submission handlers (handle_submission / handle_submission_stream)
+REQUESTS = registry.counter(
+    "chatbot_requests_total", "Submissions by persona and outcome status.", ("persona", "status"))
+REQUEST_LATENCY = registry.histogram(
+    "chatbot_request_latency_seconds", "Total submission latency, including cache hits.", ("handler",))
+TIME_TO_FIRST_TOKEN = registry.histogram(
+    "chatbot_time_to_first_token_seconds", "Time from submission to the first text shown to the user.", ("handler",))
+REQUESTS_IN_FLIGHT = registry.gauge(
+    "chatbot_requests_in_flight", "Submissions currently being handled.")
+
+# Upstream Gemini calls (one observation per attempt)
+UPSTREAM_LATENCY = registry.histogram(
+    "gemini_upstream_latency_seconds", "Latency of individual Gemini calls (streams: until the first chunk).", ("outcome",))
+UPSTREAM_IN_FLIGHT = registry.gauge(
+    "gemini_upstream_calls_in_flight", "Gemini calls currently in progress.")
+PROMPT_TOKENS = registry.counter(
+    "gemini_prompt_tokens_total", "Prompt tokens reported in response usage metadata.", ("persona",))
+RESPONSE_TOKENS = registry.counter(
+    "gemini_response_tokens_total", "Response (candidate) tokens reported in response usage metadata.", ("persona",))
+
+# Persona image lookups
+IMAGE_LOOKUP_LATENCY = registry.histogram(
+    "chatbot_image_lookup_seconds", "Latency of update_local_image.", (), buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5))
+
+# Near-duplicate prompt lookups (after an exact response cache miss)
+NEAR_DUPLICATE_LOOKUPS = registry.counter(
+    "chatbot_near_duplicate_lookups_total", "Near-duplicate prompt lookups by outcome (hit, miss).", ("outcome",))
+NEAR_DUPLICATE_LOOKUP_LATENCY = registry.histogram(
+    "chatbot_near_duplicate_lookup_seconds", "Latency of near-duplicate prompt lookups.", (),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05))
+# --- End app metrics ---
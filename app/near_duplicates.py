@@ -0,0 +1,472 @@
+# c:\Users\1134931\chat_bot\app\near_duplicates.py
+import bisect
+import hashlib
+import logging
+import math
+import operator
+import random
+import re
+import threading
+import time
+import zlib
+from array import array
+from itertools import compress
+from typing import Callable
+
+from .config import (
+    NEAR_DUPLICATE_ENABLED, NEAR_DUPLICATE_THRESHOLD, NEAR_DUPLICATE_NGRAM, NEAR_DUPLICATE_NUM_PERM,
+    NEAR_DUPLICATE_BANDS, NEAR_DUPLICATE_ROWS, NEAR_DUPLICATE_MIN_NGRAMS, NEAR_DUPLICATE_MAX_ENTRIES,
+    RESPONSE_CACHE_ENABLED,
+)
+from .metrics import NEAR_DUPLICATE_LOOKUP_LATENCY, NEAR_DUPLICATE_LOOKUPS, registry
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+_WORD_PATTERN = re.compile(r"\w+")
+# Tokens that change what a prompt asks for while barely changing its n-grams
+_GUARD_PATTERN = re.compile(r"\d+(?:[.,]\d+)*|\b(?:no|not|never|none|nor|without|cannot)\b|n't\b")
+# Words a rewording may add without asking something else; every other word of a
+# prompt must appear in the indexed prompt it matches (see prompt_word_bits)
+_FILLER_WORDS = frozenset((
+    "a", "an", "the", "please", "pls", "me", "my", "i", "you", "can", "could", "would", "will", "do", "some",
+    "just", "really", "quick", "quickly", "simple", "for", "to", "of", "so", "now", "hey", "hi", "hello", "thanks",
+))
+_WORD_BITS = 64
+_MAX_HASH = 0xFFFFFFFF
+_EMPTY_BIN = _MAX_HASH + 1
+# Added per bin of distance when an empty signature bin borrows a neighbour's value
+_DENSIFY_OFFSET = 0x9E3779B1
+_BAND_HASH_MASK = 0xFFFFFFFFFFFFFFFF
+# Band buckets with more entries than this are skipped in lookups
+_MAX_BUCKET_SIZE = 16
+# Stored payloads are SHA-256 hex digests (response cache keys), kept as raw bytes
+_KEY_BYTES = 32
+# New band entries are buffered unsorted and merged in batches of at least this many
+# (or the square root of the band size, whichever is larger)
+_MIN_BAND_BUFFER = 64
+
+
+def prompt_ngrams(text: str, n: int) -> set[str]:
+    """
+    Character n-grams of each word (padded with spaces), after dropping case and
+    punctuation. Working per word makes the set insensitive to word order.
+    """
+    ngrams = set()
+    for word in _WORD_PATTERN.findall(text.casefold()):
+        padded = f" {word} "
+        if len(padded) <= n:
+            ngrams.add(padded)
+            continue
+        for start in range(len(padded) - n + 1):
+            ngrams.add(padded[start:start + n])
+    return ngrams
+
+
+def prompt_tag(text: str) -> int:
+    """
+    Hash of the numbers and negations in a prompt. Prompts only match if their
+    tags are equal: "what is 12 times 7" and "what is 13 times 7", or a recipe
+    "with lemon" and one "without lemon", are near-identical as text but need
+    different replies.
+    """
+    return zlib.crc32(" ".join(sorted(_GUARD_PATTERN.findall(text.casefold()))).encode("utf-8"))
+
+
+def prompt_word_bits(text: str) -> int:
+    """
+    The prompt's words, filler words left out, as a 64-bit Bloom filter (two bits
+    per word). A prompt only matches an indexed one if it adds no word: n-gram
+    similarity alone can't tell "a recipe for baked salmon" from "a recipe for
+    baked chicken". A new word whose bits are both set already slips through
+    now and then.
+    """
+    bits = 0
+    for word in set(_WORD_PATTERN.findall(text.casefold())) - _FILLER_WORDS:
+        word_hash = zlib.crc32(word.encode("utf-8"))
+        bits |= 1 << (word_hash % _WORD_BITS) | 1 << ((word_hash >> 16) % _WORD_BITS)
+    return bits
+
+
+class MinHasher:
+    """
+    MinHash signatures of prompts, using one-permutation hashing: each n-gram is
+    hashed once, assigned to one of num_perm bins and each bin keeps its minimum.
+    Empty bins copy the next non-empty bin to their right, offset by the distance
+    (densification), so every position is comparable. The share of equal
+    positions in two signatures estimates the Jaccard similarity of their n-gram
+    sets, at the cost of one hash per n-gram instead of num_perm of them.
+    """
+
+    def __init__(self, num_perm: int, ngram: int, min_ngrams: int = 1, seed: int = 1):
+        self.num_perm = num_perm
+        self.ngram = ngram
+        self.min_ngrams = min_ngrams
+        rng = random.Random(seed)
+        self._value_seed = rng.getrandbits(32)
+        self._bin_seed = rng.getrandbits(32)
+
+    def signature(self, text: str) -> array | None:
+        """The prompt's signature, or None if it has too few n-grams to compare."""
+        ngrams = prompt_ngrams(text, self.ngram)
+        if len(ngrams) < self.min_ngrams:
+            return None
+        num_perm = self.num_perm
+        bins = [_EMPTY_BIN] * num_perm
+        for ngram in ngrams:
+            encoded = ngram.encode("utf-8")
+            value = zlib.crc32(encoded, self._value_seed)
+            position = zlib.crc32(encoded, self._bin_seed) % num_perm
+            if value < bins[position]:
+                bins[position] = value
+        signature = list(bins)
+        for position in range(num_perm):
+            if bins[position] != _EMPTY_BIN:
+                continue
+            for distance in range(1, num_perm):
+                borrowed = bins[(position + distance) % num_perm]
+                if borrowed != _EMPTY_BIN:
+                    signature[position] = (borrowed + distance * _DENSIFY_OFFSET) & _MAX_HASH
+                    break
+        return array("I", signature)
+
+
+class _Band:
+    """
+    One LSH band: band hashes kept sorted, with the entry id at the same position.
+    New entries go to an unsorted buffer that is merged in batches, so an add
+    doesn't shift the sorted arrays each time.
+    """
+
+    __slots__ = ("hashes", "ids", "pending_hashes", "pending_ids")
+
+    def __init__(self, hashes: array | None = None, ids: array | None = None):
+        self.hashes = hashes if hashes is not None else array("Q")
+        self.ids = ids if ids is not None else array("I")
+        self.pending_hashes = array("Q")
+        self.pending_ids = array("I")
+
+    def add(self, band_hash: int, entry_id: int) -> None:
+        self.pending_hashes.append(band_hash)
+        self.pending_ids.append(entry_id)
+        if len(self.pending_hashes) >= max(_MIN_BAND_BUFFER, math.isqrt(len(self.hashes))):
+            self.merge()
+
+    def find(self, band_hash: int) -> array:
+        start = bisect.bisect_left(self.hashes, band_hash)
+        end = bisect.bisect_right(self.hashes, band_hash, start)
+        found = self.ids[start:end]
+        if band_hash in self.pending_hashes:
+            found.extend(entry_id for pending_hash, entry_id in zip(self.pending_hashes, self.pending_ids)
+                         if pending_hash == band_hash)
+        return found
+
+    def merge(self) -> None:
+        """Moves the buffered entries into the sorted arrays, copying each array once."""
+        if not self.pending_hashes:
+            return
+        hashes, ids = self.hashes, self.ids
+        merged_hashes, merged_ids = array("Q"), array("I")
+        copied = 0
+        for band_hash, entry_id in sorted(zip(self.pending_hashes, self.pending_ids)):
+            position = bisect.bisect_right(hashes, band_hash, copied)
+            merged_hashes.extend(hashes[copied:position])
+            merged_ids.extend(ids[copied:position])
+            merged_hashes.append(band_hash)
+            merged_ids.append(entry_id)
+            copied = position
+        merged_hashes.extend(hashes[copied:])
+        merged_ids.extend(ids[copied:])
+        self.hashes, self.ids = merged_hashes, merged_ids
+        self.pending_hashes, self.pending_ids = array("Q"), array("I")
+
+    def renumbered(self, new_ids: list[int]) -> "_Band":
+        """
+        A band holding only the entries with new_ids[entry_id] >= 0, under their new ids.
+        Filtering keeps the hashes sorted, so nothing is re-sorted or rehashed.
+        """
+        self.merge()
+        ids = list(map(new_ids.__getitem__, self.ids))
+        kept = list(map((-1).__lt__, ids))
+        return _Band(array("Q", compress(self.hashes, kept)), array("I", compress(ids, kept)))
+
+    @property
+    def memory_bytes(self) -> int:
+        return ((len(self.hashes) + len(self.pending_hashes)) * self.hashes.itemsize
+                + (len(self.ids) + len(self.pending_ids)) * self.ids.itemsize)
+
+
+class SimilarityIndex:
+    """
+    Thread-safe MinHash/LSH index of prompts, each mapped to a 32-byte key.
+
+    Everything lives in flat arrays (signatures, keys, prompt tags and word bits,
+    sorted band hashes): 12 bytes per prompt per band plus 4 bytes per signature
+    value and 45 bytes of key, tag, word bits and flags, with no per-entry Python objects. A lookup hashes the prompt, finds the entries
+    sharing at least one band (binary search per band) and estimates their
+    similarity from the stored signatures.
+    """
+
+    def __init__(self, hasher: MinHasher, bands: int, rows: int, max_entries: int):
+        if bands * rows > hasher.num_perm:
+            raise ValueError(f"{bands} bands x {rows} rows need at least {bands * rows} permutations")
+        self.hasher = hasher
+        self.bands = bands
+        self.rows = rows
+        self.max_entries = max(2, max_entries)
+        self._lock = threading.Lock()
+        self._reset()
+
+    def add(self, text: str, key: str) -> bool:
+        """Adds a prompt and its key (a SHA-256 hex digest). Returns False if the prompt is too short to index."""
+        signature = self.hasher.signature(text)
+        if signature is None:
+            return False
+        key_bytes = bytes.fromhex(key)
+        with self._lock:
+            if self._has_entry(signature, key_bytes):
+                return True # Same prompt and key already indexed (e.g. another reply variant)
+            if self._count >= self.max_entries:
+                self._drop_oldest_half()
+            self._append(signature, key_bytes, prompt_tag(text), prompt_word_bits(text))
+        return True
+
+    def find(self, text: str, threshold: float) -> list[tuple[float, int, str]]:
+        """
+        Returns the indexed prompts with an estimated similarity of at least threshold
+        (and the same numbers, negations and words, see prompt_tag and prompt_word_bits),
+        as (similarity, entry_id, key) tuples, most similar first.
+        """
+        signature = self.hasher.signature(text)
+        if signature is None:
+            return []
+        num_perm = self.hasher.num_perm
+        tag = prompt_tag(text)
+        words = prompt_word_bits(text)
+        matches = []
+        with self._lock:
+            candidates = set()
+            for band, band_hash in zip(self._bands, self._band_hashes(signature)):
+                bucket = band.find(band_hash)
+                # An overfull bucket only means a common phrasing ("how do i ..."); close
+                # prompts share other bands as well, so it is skipped to bound lookup time
+                if len(bucket) <= _MAX_BUCKET_SIZE:
+                    candidates.update(bucket)
+            for entry_id in candidates:
+                if not self._alive[entry_id] or self._tags[entry_id] != tag:
+                    continue
+                if words & ~self._word_bits[entry_id]:
+                    continue # Asks about a word the indexed prompt doesn't have (dropping words is fine)
+                offset = entry_id * num_perm
+                stored = self._signatures[offset:offset + num_perm]
+                similarity = sum(map(operator.eq, signature, stored)) / num_perm
+                if similarity >= threshold:
+                    matches.append((similarity, entry_id, self._key_at(entry_id)))
+        matches.sort(reverse=True)
+        return matches
+
+    def discard(self, entry_id: int, key: str) -> None:
+        """Stops returning an entry (e.g. its reply is no longer cached)."""
+        with self._lock:
+            # The key check guards against ids reassigned by a rebuild since the lookup
+            if entry_id < self._count and self._alive[entry_id] and self._key_at(entry_id) == key:
+                self._alive[entry_id] = 0
+                self._live -= 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def __len__(self) -> int:
+        return self._live
+
+    @property
+    def memory_bytes(self) -> int:
+        """Approximate bytes held by the index arrays."""
+        with self._lock:
+            total = (len(self._signatures) * self._signatures.itemsize + len(self._keys)
+                     + len(self._tags) * self._tags.itemsize + len(self._word_bits) * self._word_bits.itemsize
+                     + len(self._alive))
+            return total + sum(band.memory_bytes for band in self._bands)
+
+    # --- Internal helpers (caller holds the lock) ---
+    def _reset(self) -> None:
+        self._signatures = array("I")
+        self._keys = bytearray()
+        self._tags = array("I")
+        self._word_bits = array("Q")
+        self._alive = bytearray()
+        self._bands = [_Band() for _ in range(self.bands)]
+        self._count = 0
+        self._live = 0
+
+    def _append(self, signature: array, key: bytes, tag: int, word_bits: int) -> None:
+        entry_id = self._count
+        self._signatures.extend(signature)
+        self._keys.extend(key)
+        self._tags.append(tag)
+        self._word_bits.append(word_bits)
+        self._alive.append(1)
+        for band, band_hash in zip(self._bands, self._band_hashes(signature)):
+            band.add(band_hash, entry_id)
+        self._count += 1
+        self._live += 1
+
+    def _key_at(self, entry_id: int) -> str:
+        return self._keys[entry_id * _KEY_BYTES:(entry_id + 1) * _KEY_BYTES].hex()
+
+    def _has_entry(self, signature: array, key: bytes) -> bool:
+        num_perm = self.hasher.num_perm
+        for entry_id in self._bands[0].find(self._band_hashes(signature)[0]):
+            if (self._alive[entry_id] and self._keys[entry_id * _KEY_BYTES:(entry_id + 1) * _KEY_BYTES] == key
+                    and self._signatures[entry_id * num_perm:(entry_id + 1) * num_perm] == signature):
+                return True
+        return False
+
+    def _band_hashes(self, signature: array) -> list[int]:
+        rows = self.rows
+        return [
+            hash(tuple(signature[start:start + rows])) & _BAND_HASH_MASK
+            for start in range(0, self.bands * rows, rows)
+        ]
+
+    def _drop_oldest_half(self) -> None:
+        """
+        Rebuilds the index from the newer half of its live entries (amortized over max_entries / 2 adds).
+        Each array is copied once and the bands are filtered in hash order, so this stays linear.
+        """
+        num_perm = self.hasher.num_perm
+        signatures, keys, tags, word_bits, alive, bands = (
+            self._signatures, self._keys, self._tags, self._word_bits, self._alive, self._bands
+        )
+        new_ids = [-1] * self._count
+        self._reset()
+        for entry_id in range(len(alive) // 2, len(alive)):
+            if not alive[entry_id]:
+                continue
+            new_ids[entry_id] = self._count
+            self._signatures.extend(signatures[entry_id * num_perm:(entry_id + 1) * num_perm])
+            self._keys.extend(keys[entry_id * _KEY_BYTES:(entry_id + 1) * _KEY_BYTES])
+            self._tags.append(tags[entry_id])
+            self._word_bits.append(word_bits[entry_id])
+            self._alive.append(1)
+            self._count += 1
+        self._live = self._count
+        self._bands = [band.renumbered(new_ids) for band in bands]
+
+
+class NearDuplicateIndex:
+    """
+    Per-persona SimilarityIndex over prompts whose replies are in the response
+    cache. Each indexed prompt points at the cache key of its reply, so replies
+    are stored (and expire, or get evicted) in one place: the response cache.
+    """
+
+    def __init__(self, threshold: float, ngram: int, num_perm: int, bands: int, rows: int,
+                 min_ngrams: int, max_entries: int):
+        if bands * rows > num_perm:
+            raise ValueError(f"{bands} bands x {rows} rows need at least {bands * rows} permutations")
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, ngram, min_ngrams)
+        self.bands = bands
+        self.rows = rows
+        self.max_entries = max_entries
+        self._indexes: dict[str, SimilarityIndex] = {}
+        self._lock = threading.Lock()
+
+    def add(self, persona_name: str, backstory: str, user_prompt: str, cache_key: str) -> None:
+        """Indexes a prompt whose reply was stored in the response cache under cache_key."""
+        self._index_for(persona_name, backstory).add(user_prompt, cache_key)
+
+    def find_reply(self, persona_name: str, backstory: str, user_prompt: str,
+                   resolve: Callable[[str], str | None], exists: Callable[[str], bool]) -> tuple[str, float] | None:
+        """
+        Looks for an indexed prompt similar enough to user_prompt.
+
+        Args:
+            resolve: Returns a reply to serve from a cache key, or None (gone, or not
+                servable yet - e.g. still collecting reply variants).
+            exists: True if anything is still stored under a cache key. Entries are
+                only dropped when it returns False.
+
+        Returns:
+            (reply, similarity) for the most similar prompt whose reply is still
+            cached, or None.
+        """
+        started = time.perf_counter()
+        index = self._index_for(persona_name, backstory, create=False)
+        found = None
+        if index is not None:
+            for similarity, entry_id, cache_key in index.find(user_prompt, self.threshold):
+                reply = resolve(cache_key)
+                if reply is not None:
+                    found = (reply, similarity)
+                    break
+                if not exists(cache_key):
+                    index.discard(entry_id, cache_key) # Expired or evicted from the response cache
+        NEAR_DUPLICATE_LOOKUPS.inc(outcome="hit" if found else "miss")
+        NEAR_DUPLICATE_LOOKUP_LATENCY.observe(time.perf_counter() - started)
+        return found
+
+    def clear(self) -> None:
+        with self._lock:
+            self._indexes.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            indexes = list(self._indexes.values())
+        return {
+            "personas": len(indexes),
+            "entries": sum(len(index) for index in indexes),
+            "bytes": sum(index.memory_bytes for index in indexes),
+        }
+
+    def _index_for(self, persona_name: str, backstory: str, create: bool = True) -> SimilarityIndex | None:
+        # Keyed by backstory too: replies written for an old backstory must not be matched
+        backstory_hash = hashlib.sha256(backstory.encode("utf-8")).hexdigest()
+        index_key = f"{persona_name}\x1f{backstory_hash}"
+        with self._lock:
+            index = self._indexes.get(index_key)
+            if index is None and create:
+                index = SimilarityIndex(self.hasher, self.bands, self.rows, self.max_entries)
+                self._indexes[index_key] = index
+            return index
+
+
+def create_near_duplicate_index() -> NearDuplicateIndex | None:
+    """Builds the near-duplicate index, or returns None when it (or the response cache) is disabled."""
+    if not NEAR_DUPLICATE_ENABLED or not RESPONSE_CACHE_ENABLED:
+        logger.info("Near-duplicate prompt matching disabled.")
+        return None
+    try:
+        index = NearDuplicateIndex(
+            NEAR_DUPLICATE_THRESHOLD, NEAR_DUPLICATE_NGRAM, NEAR_DUPLICATE_NUM_PERM, NEAR_DUPLICATE_BANDS,
+            NEAR_DUPLICATE_ROWS, NEAR_DUPLICATE_MIN_NGRAMS, NEAR_DUPLICATE_MAX_ENTRIES,
+        )
+    except ValueError as e:
+        logger.error(f"Invalid near-duplicate settings, matching disabled: {e}")
+        return None
+    logger.info(
+        f"Near-duplicate prompt matching enabled (threshold={NEAR_DUPLICATE_THRESHOLD}, "
+        f"{NEAR_DUPLICATE_BANDS} bands x {NEAR_DUPLICATE_ROWS} rows of {NEAR_DUPLICATE_NUM_PERM} permutations)."
+    )
+    return index
+
+
+# Shared index for the app (None when disabled)
+near_duplicate_index = create_near_duplicate_index()
+
+
+# --- Metrics ---
+_INDEX_STATS = registry.gauge(
+    "chatbot_near_duplicate_index", "Near-duplicate prompt index size (personas, entries, bytes).", ("stat",))
+
+
+def _collect_index_metrics() -> None:
+    for stat, value in near_duplicate_index.stats().items():
+        _INDEX_STATS.set(value, stat=stat)
+
+
+if near_duplicate_index is not None:
+    registry.add_collector(_collect_index_metrics)
+# --- End metrics ---
@@ -0,0 +1,147 @@
+# c:\Users\1134931\chat_bot\app\persona_images.py
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from .config import IMAGE_BASE_PATH, PERSONA_THUMBNAIL_DIR, PERSONA_THUMBNAIL_HEIGHT, PERSONA_IMAGE_URL_PREFIX
+
+try:
+    from PIL import Image
+except ImportError: # Pillow ships with Gradio, but thumbnails are optional
+    Image = None
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+
+class PersonaThumbnail:
+    """A generated thumbnail. `filename` contains a content hash, so it never changes meaning."""
+
+    __slots__ = ("filename", "path")
+
+    def __init__(self, filename: str, path: str):
+        self.filename = filename
+        self.path = path
+
+    def url(self, url_prefix: str = PERSONA_IMAGE_URL_PREFIX) -> str:
+        return f"{url_prefix.rstrip('/')}/{self.filename}"
+
+
+class PersonaImageCache:
+    """
+    Generates a thumbnail per persona image once and remembers the result.
+
+    Lookups are answered from memory, so dropdown changes don't touch the
+    filesystem. Entries are keyed by the image path plus the source file's
+    mtime and size; they are refreshed when the persona store reloads (see
+    warm), which is also when new personas get their thumbnails.
+
+    Thumbnail names are `<stem>-<hash>.<ext>` where the hash covers the source
+    bytes and the target height, so they can be cached by browsers forever.
+    """
+
+    def __init__(self, source_dir: str, thumbnail_dir: str, height: int):
+        self.source_dir = source_dir
+        self.thumbnail_dir = thumbnail_dir
+        self.height = height
+        # relative image path -> (source stat key, thumbnail or None if missing)
+        self._entries: dict[str, tuple[tuple | None, PersonaThumbnail | None]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, relative_image_path: str | None) -> PersonaThumbnail | None:
+        """Returns the thumbnail for an image path from backstories.json, generating it on first use."""
+        if not relative_image_path:
+            return None
+        entry = self._entries.get(relative_image_path)
+        if entry is not None:
+            return entry[1]
+        return self._refresh(relative_image_path)
+
+    def warm(self, snapshot) -> None:
+        """Re-checks every persona image in a PersonaSnapshot, generating missing thumbnails."""
+        image_paths = {persona.image for persona in snapshot.by_name.values() if persona.image}
+        for relative_image_path in image_paths:
+            self._refresh(relative_image_path)
+        with self._lock:
+            # Forget images no persona refers to any more
+            for stale_path in set(self._entries) - image_paths:
+                del self._entries[stale_path]
+        if image_paths:
+            logger.info(f"Persona thumbnails ready for {len(image_paths)} images in {self.thumbnail_dir}.")
+
+    def _refresh(self, relative_image_path: str) -> PersonaThumbnail | None:
+        source_path = self._source_path(relative_image_path)
+        try:
+            stat = os.stat(source_path) if source_path else None
+        except OSError:
+            stat = None
+
+        if stat is None:
+            logger.warning(f"Image path specified but file not found: {source_path or relative_image_path}")
+            with self._lock:
+                self._entries[relative_image_path] = (None, None)
+            return None
+
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        entry = self._entries.get(relative_image_path)
+        if entry is not None and entry[0] == stat_key:
+            return entry[1]
+
+        try:
+            thumbnail = self._generate(source_path)
+        except Exception as e:
+            logger.error(f"Could not create thumbnail for {source_path}: {e}", exc_info=True)
+            thumbnail = None
+        with self._lock:
+            self._entries[relative_image_path] = (stat_key, thumbnail)
+        return thumbnail
+
+    def _source_path(self, relative_image_path: str) -> str | None:
+        """Resolves a path from backstories.json, refusing anything outside the images folder."""
+        full_path = os.path.normpath(os.path.join(self.source_dir, relative_image_path))
+        if os.path.commonpath([full_path, self.source_dir]) != self.source_dir:
+            logger.warning(f"Ignoring image path outside {self.source_dir}: {relative_image_path}")
+            return None
+        return full_path
+
+    def _generate(self, source_path: str) -> PersonaThumbnail:
+        with open(source_path, 'rb') as f:
+            source_bytes = f.read()
+        digest = hashlib.sha256(source_bytes + f"|h={self.height}".encode()).hexdigest()[:16]
+        stem, extension = os.path.splitext(os.path.basename(source_path))
+        filename = f"{stem}-{digest}{extension.lower()}"
+        thumbnail_path = os.path.join(self.thumbnail_dir, filename)
+
+        # Another worker (or an earlier run) may already have produced it
+        if not os.path.exists(thumbnail_path):
+            os.makedirs(self.thumbnail_dir, exist_ok=True)
+            # Write to a temp file and rename, so other workers never see a partial file
+            fd, temp_path = tempfile.mkstemp(dir=self.thumbnail_dir, suffix=extension)
+            os.close(fd)
+            try:
+                self._write_thumbnail(source_path, temp_path)
+                os.replace(temp_path, thumbnail_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            logger.info(f"Created thumbnail {thumbnail_path} for {source_path}.")
+        return PersonaThumbnail(filename, thumbnail_path)
+
+    def _write_thumbnail(self, source_path: str, target_path: str) -> None:
+        if Image is None:
+            logger.warning("Pillow is not installed; serving the original image without resizing.")
+            shutil.copyfile(source_path, target_path)
+            return
+        with Image.open(source_path) as image:
+            image_format = image.format
+            if image.height > self.height:
+                width = max(1, round(image.width * self.height / image.height))
+                image = image.resize((width, self.height), Image.LANCZOS)
+            image.save(target_path, format=image_format, optimize=True)
+
+
+# Shared thumbnail cache for the app
+persona_images = PersonaImageCache(IMAGE_BASE_PATH, PERSONA_THUMBNAIL_DIR, PERSONA_THUMBNAIL_HEIGHT)
@@ -0,0 +1,51 @@
+# c:\Users\1134931\chat_bot\app\persona_prompts.py
+import functools
+import hashlib
+import logging
+
+from .config import SYSTEM_PROMPT_TEMPLATE, USER_PROMPT_TEMPLATE, PERSONA_PROMPT_CACHE_SIZE
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+
+class CompiledPersonaPrompt:
+    """
+    The static part of the prompt for one backstory, rendered once.
+
+    `system_instruction` is the persona preamble sent as the model's system
+    instruction (or prepended to the request when system instructions are
+    disabled). `digest` identifies the preamble, e.g. for per-persona model handles.
+    """
+
+    __slots__ = ("digest", "system_instruction")
+
+    def __init__(self, digest: str, system_instruction: str):
+        self.digest = digest
+        self.system_instruction = system_instruction
+
+    def __repr__(self) -> str:
+        return f"CompiledPersonaPrompt(digest={self.digest!r}, chars={len(self.system_instruction)})"
+
+
+@functools.lru_cache(maxsize=PERSONA_PROMPT_CACHE_SIZE)
+def compile_persona_prompt(backstory: str) -> CompiledPersonaPrompt:
+    """
+    Renders the persona preamble for a backstory.
+
+    Results are memoized, so repeat requests for the same persona reuse the
+    rendered text instead of formatting the whole template again.
+    """
+    system_instruction = SYSTEM_PROMPT_TEMPLATE.format(backstory=backstory)
+    digest = hashlib.sha256(system_instruction.encode("utf-8")).hexdigest()[:16]
+    return CompiledPersonaPrompt(digest, system_instruction)
+
+
+def render_user_prompt(user_prompt: str) -> str:
+    """Renders the per-request part of the prompt."""
+    return USER_PROMPT_TEMPLATE.format(user_prompt=user_prompt)
+
+
+def render_full_prompt(compiled: CompiledPersonaPrompt, user_prompt: str) -> str:
+    """Single-string prompt for when the preamble can't be sent as a system instruction."""
+    return compiled.system_instruction + render_user_prompt(user_prompt)
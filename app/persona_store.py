@@ -0,0 +1,238 @@
+# c:\Users\1134931\chat_bot\app\persona_store.py
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from .config import BACKSTORIES_FILE_PATH, PERSONA_RELOAD_CHECK_SECONDS
+from .persona_prompts import CompiledPersonaPrompt, compile_persona_prompt
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+
+class Persona:
+    """One validated persona from backstories.json."""
+
+    __slots__ = ("name", "backstory", "image", "prompt")
+
+    def __init__(self, name: str, backstory: str, image: str | None, prompt: CompiledPersonaPrompt):
+        self.name = name
+        self.backstory = backstory
+        self.image = image # Path relative to the images folder, e.g. "Bartek.png"
+        self.prompt = prompt # Precompiled prompt prefix
+
+    def __repr__(self) -> str:
+        return f"Persona(name={self.name!r}, image={self.image!r})"
+
+
+class PersonaSnapshot:
+    """
+    Immutable view of backstories.json at one point in time.
+
+    A reload builds a new snapshot and swaps it in with a single assignment, so
+    requests already holding the old one keep a consistent view.
+    """
+
+    __slots__ = ("names", "by_name", "checksum", "error", "loaded_at")
+
+    def __init__(self, personas: list[Persona], checksum: str | None = None, error: str | None = None):
+        self.names = tuple(persona.name for persona in personas)
+        self.by_name = {persona.name: persona for persona in personas}
+        self.checksum = checksum
+        self.error = error # User-facing load error, shown in the dropdown instead of names
+        self.loaded_at = time.time()
+
+    def get(self, name: str | None) -> Persona | None:
+        return self.by_name.get(name) if name else None
+
+    @property
+    def default_name(self) -> str | None:
+        return self.names[0] if self.names else None
+
+    def dropdown_choices(self) -> list[str]:
+        """Persona names for the dropdown, or the load error if there are none."""
+        if self.names:
+            return list(self.names)
+        return [self.error or "Error: No personas available"]
+
+
+class PersonaStore:
+    """
+    Loads personas from backstories.json and reloads them when the file changes.
+
+    Change detection is cheap: every check_interval seconds a background
+    thread (start_watcher) compares the file's mtime and size with the last
+    load, and only if they differ is the file read and checksummed. The JSON is
+    parsed only if the checksum changed. Requests never check or reload - they
+    only read the current snapshot, so parsing, prompt compilation and the
+    reload listeners never run on the request path.
+    """
+
+    def __init__(self, path: str, check_interval: float = PERSONA_RELOAD_CHECK_SECONDS):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot: PersonaSnapshot | None = None
+        self._reload_lock = threading.Lock()
+        self._stat_key = None # (mtime_ns, size) of the file behind the current snapshot
+        self._next_check = 0.0
+        self._listeners = []
+        self._watcher: threading.Thread | None = None
+        self._stop_watching = threading.Event()
+
+    def add_reload_listener(self, listener) -> None:
+        """
+        Registers listener(snapshot), called after every snapshot swap (including
+        the initial load) from the thread that performed it - the watcher thread
+        for reloads.
+        """
+        self._listeners.append(listener)
+        if self._snapshot is not None:
+            listener(self._snapshot)
+
+    @property
+    def snapshot(self) -> PersonaSnapshot:
+        """The current snapshot, loading the file on first access. Changes are picked up by the watcher."""
+        if self._snapshot is None:
+            # First access: wait for the initial load
+            with self._reload_lock:
+                if self._snapshot is None:
+                    self._next_check = time.monotonic() + self.check_interval
+                    self._reload()
+        return self._snapshot
+
+    def get(self, name: str | None) -> Persona | None:
+        """Looks up a persona by name (O(1)); None if it doesn't exist."""
+        return self.snapshot.get(name)
+
+    def maybe_reload(self, force: bool = False) -> bool:
+        """
+        Reloads the file if it changed since the last load.
+
+        Returns:
+            True if a new snapshot was swapped in.
+        """
+        now = time.monotonic()
+        if not force and now < self._next_check:
+            return False
+        if not self._reload_lock.acquire(blocking=False):
+            return False # Another thread is already checking
+        try:
+            self._next_check = now + self.check_interval
+            return self._reload()
+        finally:
+            self._reload_lock.release()
+
+    def start_watcher(self) -> None:
+        """
+        Starts the background thread that checks the file every check_interval
+        seconds (a no-op if it is running or check_interval is 0). Call it in each
+        worker process: threads don't survive a fork, so a new one is started there.
+        """
+        if self.check_interval <= 0 or (self._watcher is not None and self._watcher.is_alive()):
+            return
+        self._stop_watching.clear()
+        self._watcher = threading.Thread(target=self._watch, name="persona-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self, timeout: float = 5.0) -> None:
+        """Stops the background thread, waiting for a reload in progress to finish."""
+        self._stop_watching.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout)
+            self._watcher = None
+
+    def _watch(self) -> None:
+        while not self._stop_watching.wait(self.check_interval):
+            try:
+                self.maybe_reload(force=True) # The wait already spaced the checks
+            except Exception as e:
+                logger.error(f"Persona reload check failed: {e}", exc_info=True)
+
+    # --- Internal helpers (caller holds _reload_lock) ---
+    def _reload(self) -> bool:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            logger.error(f"Backstories file not found at: {self.path}")
+            return self._swap_error("Error: backstories.json not found")
+        except OSError as e:
+            logger.error(f"Could not stat {self.path}: {e}")
+            return self._swap_error("Error: Could not load backstories")
+
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        if self._snapshot is not None and stat_key == self._stat_key:
+            return False
+
+        try:
+            with open(self.path, 'rb') as f:
+                raw = f.read()
+        except OSError as e:
+            logger.error(f"Could not read {self.path}: {e}", exc_info=True)
+            return self._swap_error("Error: Could not load backstories")
+
+        checksum = hashlib.blake2b(raw, digest_size=16).hexdigest()
+        self._stat_key = stat_key
+        if self._snapshot is not None and checksum == self._snapshot.checksum:
+            # Touched but not changed
+            return False
+
+        try:
+            loaded_json = json.loads(raw.decode('utf-8'))
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            logger.error(f"Error decoding JSON from {self.path}.", exc_info=True)
+            return self._swap_error("Error: Invalid JSON in backstories.json")
+
+        if not isinstance(loaded_json, dict):
+            logger.error(f"Invalid format in {self.path}. Expected a JSON object (dictionary).")
+            return self._swap_error("Error: Invalid JSON format")
+
+        personas = _validate_personas(loaded_json)
+        if not personas:
+            logger.warning(f"{self.path} is empty or has no valid personas.")
+        snapshot = PersonaSnapshot(personas, checksum=checksum)
+        is_reload = self._snapshot is not None
+        self._snapshot = snapshot # Atomic swap
+        logger.info(f"Successfully {'reloaded' if is_reload else 'loaded'} {len(personas)} personas from {self.path}.")
+        self._notify(snapshot)
+        return True
+
+    def _swap_error(self, message: str) -> bool:
+        """Keeps serving the last good snapshot if there is one; otherwise installs an error snapshot."""
+        if self._snapshot is not None and self._snapshot.names:
+            logger.warning(f"Keeping previously loaded personas after load failure ({message}).")
+            return False
+        self._stat_key = None
+        self._snapshot = PersonaSnapshot([], error=message)
+        self._notify(self._snapshot)
+        return True
+
+    def _notify(self, snapshot: PersonaSnapshot) -> None:
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as e:
+                logger.error(f"Persona reload listener failed: {e}", exc_info=True)
+
+
+def _validate_personas(loaded_json: dict) -> list[Persona]:
+    """Builds Persona objects, skipping entries that aren't {"backstory": str, "image": str?}."""
+    personas = []
+    for name, data in loaded_json.items():
+        if not isinstance(data, dict) or not isinstance(data.get("backstory"), str) or not data["backstory"].strip():
+            logger.warning(f"Skipping persona '{name}': Invalid format or missing 'backstory' key in backstories.json.")
+            continue
+        image = data.get("image")
+        if image is not None and not isinstance(image, str):
+            logger.warning(f"Ignoring invalid 'image' value for persona '{name}'.")
+            image = None
+        backstory = data["backstory"]
+        # Memoized, so unchanged personas reuse their compiled prompt across reloads
+        personas.append(Persona(name, backstory, image or None, compile_persona_prompt(backstory)))
+    return personas
+
+
+# Shared store for the app's backstories.json
+persona_store = PersonaStore(BACKSTORIES_FILE_PATH)
@@ -0,0 +1,173 @@
+# c:\Users\1134931\chat_bot\app\resilience.py
+import asyncio
+import collections
+import logging
+import random
+import threading
+import time
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+# HTTP status codes of transient upstream failures (rate limited, server error, unavailable, timeout)
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# google.api_core exception class names for the same conditions; matched by name so the
+# SDK doesn't have to be imported to classify errors
+RETRYABLE_EXCEPTION_NAMES = {
+    "ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "InternalServerError",
+    "DeadlineExceeded", "GatewayTimeout", "BadGateway", "Aborted", "RetryError",
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling upstream while the circuit breaker is open."""
+
+
+class CallTimeoutError(TimeoutError):
+    """Raised when a single upstream call exceeds its deadline."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """True for transient errors (429/5xx, timeouts, connection problems) that are worth retrying."""
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError, ConnectionError)):
+        return True
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and code in RETRYABLE_STATUS_CODES:
+        return True
+    return type(error).__name__ in RETRYABLE_EXCEPTION_NAMES
+
+
+class RetryPolicy:
+    """Jittered exponential backoff ("full jitter") with a cap on attempts and total time."""
+
+    def __init__(self, max_retries: int, base_delay: float, max_delay: float, total_deadline: float | None = None):
+        self.max_retries = max(0, max_retries)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.total_deadline = total_deadline
+
+    def next_delay(self, retry_number: int, started: float) -> float | None:
+        """
+        Delay before retry number `retry_number` (1-based), or None if no retry
+        should be made because attempts or the total deadline are exhausted.
+        """
+        if retry_number > self.max_retries:
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (retry_number - 1))))
+        if self.total_deadline is not None and time.monotonic() - started + delay >= self.total_deadline:
+            return None
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker over a sliding time window.
+
+    closed:    calls go through; outcomes are recorded. Once the window holds at
+               least `min_calls` outcomes and the failure ratio reaches
+               `failure_ratio`, the breaker opens.
+    open:      calls fail fast with CircuitOpenError for `cooldown` seconds.
+    half-open: one probe call is let through; success closes the breaker,
+               failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, window_seconds: float, min_calls: int, failure_ratio: float, cooldown: float, name: str = "gemini"):
+        self.window_seconds = window_seconds
+        self.min_calls = max(1, min_calls)
+        self.failure_ratio = failure_ratio
+        self.cooldown = cooldown
+        self.name = name
+        self._outcomes = collections.deque() # (timestamp, failed)
+        self._failures = 0
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+        self.times_opened = 0
+        self.rejected_calls = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._update_state(time.monotonic())
+            return self._state
+
+    def before_call(self) -> None:
+        """Raises CircuitOpenError if the call must not be made right now."""
+        with self._lock:
+            now = time.monotonic()
+            self._update_state(now)
+            if self._state == self.CLOSED:
+                return
+            # A probe that never reported back (e.g. abandoned by its caller) is replaced after a cooldown
+            probe_stale = self._probe_in_flight and now - self._probe_started >= self.cooldown
+            if self._state == self.HALF_OPEN and (not self._probe_in_flight or probe_stale):
+                self._probe_in_flight = True
+                self._probe_started = now
+                logger.info(f"Circuit '{self.name}' half-open, letting a probe call through.")
+                return
+            self.rejected_calls += 1
+            remaining = max(0.0, self.cooldown - (now - self._opened_at))
+            raise CircuitOpenError(f"Circuit '{self.name}' is open (retry in {remaining:.1f}s)")
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                logger.info(f"Circuit '{self.name}' probe succeeded, closing.")
+                self._state = self.CLOSED
+                self._probe_in_flight = False
+                self._outcomes.clear()
+                self._failures = 0
+            self._record(time.monotonic(), failed=False)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if self._state == self.HALF_OPEN:
+                self._open(now, "probe failed")
+                return
+            self._record(now, failed=True)
+            total = len(self._outcomes)
+            if self._state == self.CLOSED and total >= self.min_calls and self._failures / total >= self.failure_ratio:
+                self._open(now, f"{self._failures}/{total} calls failed in the last {self.window_seconds:g}s")
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._update_state(time.monotonic())
+            return {
+                "state": self._state,
+                "window_calls": len(self._outcomes),
+                "window_failures": self._failures,
+                "times_opened": self.times_opened,
+                "rejected_calls": self.rejected_calls,
+            }
+
+    # --- Internal helpers (caller holds the lock) ---
+    def _record(self, now: float, failed: bool) -> None:
+        self._outcomes.append((now, failed))
+        self._failures += 1 if failed else 0
+        cutoff = now - self.window_seconds
+        while self._outcomes and self._outcomes[0][0] < cutoff:
+            _, old_failed = self._outcomes.popleft()
+            self._failures -= 1 if old_failed else 0
+
+    def _open(self, now: float, reason: str) -> None:
+        logger.warning(f"Circuit '{self.name}' opening for {self.cooldown:g}s: {reason}.")
+        self._state = self.OPEN
+        self._opened_at = now
+        self._probe_in_flight = False
+        self._outcomes.clear()
+        self._failures = 0
+        self.times_opened += 1
+
+    def _update_state(self, now: float) -> None:
+        if self._state == self.OPEN and now - self._opened_at >= self.cooldown:
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = False
@@ -0,0 +1,530 @@
+# c:\Users\1134931\chat_bot\app\response_cache.py
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .config import (
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_VARIANTS,
+    RESPONSE_CACHE_BACKEND, RESPONSE_CACHE_PATH,
+    RESPONSE_CACHE_SQLITE_MMAP_BYTES, RESPONSE_CACHE_SWEEP_INTERVAL_SECONDS,
+)
+from .metrics import registry
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+
+def normalize_prompt(user_prompt: str) -> str:
+    """Collapses whitespace and case so trivially different prompts share a cache entry."""
+    return " ".join(user_prompt.split()).casefold()
+
+
+def make_cache_key(persona_name: str, backstory: str, model_name: str, user_prompt: str) -> str:
+    """
+    Builds the cache key for a reply.
+
+    The backstory is included as a hash so editing a persona's backstory
+    invalidates its cached replies even if the name stays the same.
+    """
+    backstory_hash = hashlib.sha256(backstory.encode("utf-8")).hexdigest()
+    raw_key = "\x1f".join((persona_name, backstory_hash, model_name, normalize_prompt(user_prompt)))
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+
+# --- Storage backends ---
+class CacheBackend:
+    """
+    Storage interface used by ResponseCache.
+
+    A backend maps a key to a list of reply variants. Entries expire ttl_seconds
+    after they were first stored, and the backend keeps its total size under
+    its own byte cap by evicting the least recently used entries.
+    """
+
+    def get(self, key: str) -> list[str] | None:
+        """Returns the stored variants for the key, or None if absent or expired."""
+        raise NotImplementedError
+
+    def add_variant(self, key: str, reply: str, max_variants: int, ttl_seconds: float) -> None:
+        """Appends a reply to the key's variants unless it is already stored or the key is full."""
+        raise NotImplementedError
+
+    def sweep_expired(self) -> int:
+        """Removes all expired entries in one pass and returns how many were removed."""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        raise NotImplementedError
+
+
+class _MemoryEntry:
+    __slots__ = ("variants", "expires_at", "size")
+
+    def __init__(self, expires_at: float):
+        self.variants: list[str] = []
+        self.expires_at = expires_at
+        self.size = 0
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Thread-safe LRU dictionary local to the current process."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _MemoryEntry]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> list[str] | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires_at <= now:
+                self._remove(key)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return list(entry.variants)
+
+    def add_variant(self, key: str, reply: str, max_variants: int, ttl_seconds: float) -> None:
+        reply_size = len(reply.encode("utf-8"))
+        if reply_size + len(key) > self.max_bytes:
+            logger.debug("Reply too large to cache; skipping.")
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= now:
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                entry = _MemoryEntry(now + ttl_seconds)
+                entry.size = len(key)
+                self._entries[key] = entry
+                self._size += entry.size
+            self._entries.move_to_end(key)
+            if reply in entry.variants or len(entry.variants) >= max_variants:
+                return
+
+            entry.variants.append(reply)
+            entry.size += reply_size
+            self._size += reply_size
+            self._evict()
+
+    def sweep_expired(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            expired_keys = [key for key, entry in self._entries.items() if entry.expires_at <= now]
+            for key in expired_keys:
+                self._remove(key)
+            self.expirations += len(expired_keys)
+            return len(expired_keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "max_bytes": self.max_bytes,
+            }
+
+    # --- Internal helpers (caller holds the lock) ---
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._size -= entry.size
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and self._entries:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Cache stored in a SQLite file so every worker process on the node shares it.
+
+    The database runs in WAL mode (readers never block the writer) with a
+    memory-mapped read path. Writes use BEGIN IMMEDIATE plus a busy timeout, so
+    concurrent writers from several processes queue up instead of failing.
+    Expiry uses wall-clock time because entries are shared between processes.
+
+    Any SQLite error is logged and treated as a cache miss - the cache must
+    never stop a reply from being served.
+    """
+
+    # Last-access times are only rewritten when older than this, so cache hits
+    # don't turn every read into a write
+    TOUCH_INTERVAL_SECONDS = 60.0
+    # Check the total size against the cap every N writes rather than on each one
+    SIZE_CHECK_EVERY_WRITES = 50
+
+    def __init__(self, path: str, max_bytes: int, mmap_bytes: int = 0,
+                 sweep_interval: float = 300.0, busy_timeout: float = 5.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.mmap_bytes = mmap_bytes
+        self.sweep_interval = sweep_interval
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._counter_lock = threading.Lock()
+        self._writes_since_size_check = 0
+        self._last_sweep = time.time()
+        self.evictions = 0
+        self.expirations = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._transaction() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    variants TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_expires_at ON responses (expires_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)")
+        logger.info(f"SQLite response cache ready at {path}.")
+
+    def get(self, key: str) -> list[str] | None:
+        now = time.time()
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT variants, expires_at, last_access FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            variants_json, expires_at, last_access = row
+            if expires_at <= now:
+                # Left for the next sweep; deleting here would make reads write
+                return None
+            if last_access < now - self.TOUCH_INTERVAL_SECONDS:
+                self._touch(conn, key, now)
+            return json.loads(variants_json)
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"SQLite cache read failed, treating as miss: {e}")
+            return None
+
+    def add_variant(self, key: str, reply: str, max_variants: int, ttl_seconds: float) -> None:
+        now = time.time()
+        try:
+            with self._transaction() as conn:
+                row = conn.execute(
+                    "SELECT variants, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] > now:
+                    variants, expires_at = json.loads(row[0]), row[1]
+                else:
+                    variants, expires_at = [], now + ttl_seconds
+                if reply in variants or len(variants) >= max_variants:
+                    return
+
+                variants.append(reply)
+                variants_json = json.dumps(variants, ensure_ascii=False)
+                size = len(key) + len(variants_json.encode("utf-8"))
+                if size > self.max_bytes:
+                    logger.debug("Reply too large to cache; skipping.")
+                    return
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, variants, size, expires_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, variants_json, size, expires_at, now),
+                )
+            self._after_write(now)
+        except (sqlite3.Error, ValueError) as e:
+            logger.warning(f"SQLite cache write failed, reply not cached: {e}")
+
+    def sweep_expired(self) -> int:
+        try:
+            with self._transaction() as conn:
+                removed = conn.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),)).rowcount
+        except sqlite3.Error as e:
+            logger.warning(f"SQLite cache sweep failed: {e}")
+            return 0
+        with self._counter_lock:
+            self.expirations += removed
+        if removed:
+            logger.info(f"Swept {removed} expired entries from the SQLite response cache.")
+        return removed
+
+    def enforce_size_cap(self) -> int:
+        """Evicts least recently used entries until the total size is under max_bytes."""
+        try:
+            with self._transaction() as conn:
+                total_size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                excess = total_size - self.max_bytes
+                if excess <= 0:
+                    return 0
+                victims = []
+                for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+                    victims.append((key,))
+                    excess -= size
+                    if excess <= 0:
+                        break
+                conn.executemany("DELETE FROM responses WHERE key = ?", victims)
+        except sqlite3.Error as e:
+            logger.warning(f"SQLite cache size enforcement failed: {e}")
+            return 0
+        with self._counter_lock:
+            self.evictions += len(victims)
+        return len(victims)
+
+    def clear(self) -> None:
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM responses")
+
+    def stats(self) -> dict:
+        try:
+            entries, total_size = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"SQLite cache stats failed: {e}")
+            entries, total_size = None, None
+        with self._counter_lock:
+            return {
+                "backend": "sqlite",
+                "path": self.path,
+                # Evictions/expirations are counted by this process only
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "entries": entries,
+                "bytes": total_size,
+                "max_bytes": self.max_bytes,
+            }
+
+    # --- Internal helpers ---
+    def _connection(self) -> sqlite3.Connection:
+        """Returns this thread's connection, reopening it after a fork."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            # isolation_level=None: autocommit, transactions are managed explicitly
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+            conn.execute(f"PRAGMA mmap_size={int(self.mmap_bytes)}")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self):
+        return _ImmediateTransaction(self._connection())
+
+    def _touch(self, conn: sqlite3.Connection, key: str, now: float) -> None:
+        """
+        Records a read for LRU eviction. Best effort: while another connection is
+        writing, the update is skipped instead of waiting out the busy timeout.
+        """
+        conn.execute("PRAGMA busy_timeout=0")
+        try:
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        except sqlite3.OperationalError as e:
+            logger.debug(f"Skipped last-access update of a cached reply: {e}")
+        finally:
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+
+    def _after_write(self, now: float) -> None:
+        """Runs the periodic size check and expiry sweep."""
+        with self._counter_lock:
+            self._writes_since_size_check += 1
+            check_size = self._writes_since_size_check >= self.SIZE_CHECK_EVERY_WRITES
+            if check_size:
+                self._writes_since_size_check = 0
+            sweep = now - self._last_sweep >= self.sweep_interval
+            if sweep:
+                self._last_sweep = now
+        if sweep:
+            self.sweep_expired()
+        if check_size:
+            self.enforce_size_cap()
+
+
+class _ImmediateTransaction:
+    """Context manager wrapping BEGIN IMMEDIATE ... COMMIT/ROLLBACK on a connection."""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        # Take the write lock up front so two writers can't both read-then-write
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
+# --- End storage backends ---
+
+
+class ResponseCache:
+    """
+    Cache of generated replies in front of the Gemini client.
+
+    Each key can hold up to `variants` different replies; until a key has all
+    of them, get() reports a miss so the caller generates (and stores) another
+    one. Later hits pick one of the stored variants at random.
+
+    Only successful model replies should be stored - callers are responsible for
+    not passing blocked, empty or error messages to put().
+    """
+
+    def __init__(self, backend: CacheBackend, ttl_seconds: float, variants: int = 1):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.variants = max(1, variants)
+        self._lock = threading.Lock()
+        # Counters for dashboards (per process), see stats()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, record_stats: bool = True) -> str | None:
+        """
+        Returns a cached reply for the key, or None on a miss. Lookups on behalf of
+        another one (e.g. near-duplicate matching after a miss) pass record_stats=False.
+        """
+        stored_variants = self.backend.get(key)
+        if not stored_variants or len(stored_variants) < self.variants:
+            if record_stats:
+                with self._lock:
+                    self.misses += 1
+            return None
+        if record_stats:
+            with self._lock:
+                self.hits += 1
+        return random.choice(stored_variants) if self.variants > 1 else stored_variants[0]
+
+    def contains(self, key: str) -> bool:
+        """
+        True if the key holds at least one unexpired reply, even if get() still misses
+        because it has fewer than `variants` of them. Not counted in the hit/miss stats.
+        """
+        return bool(self.backend.get(key))
+
+    def put(self, key: str, reply: str) -> None:
+        """Stores a reply (as another variant if the key already has some)."""
+        self.backend.add_variant(key, reply, self.variants, self.ttl_seconds)
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        """Snapshot of the cache counters."""
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "ttl_seconds": self.ttl_seconds,
+            "variants": self.variants,
+            **self.backend.stats(),
+        }
+
+
+def create_response_cache() -> ResponseCache | None:
+    """Builds the response cache selected in config, or returns None when caching is disabled."""
+    if not RESPONSE_CACHE_ENABLED:
+        logger.info("Response cache disabled.")
+        return None
+
+    if RESPONSE_CACHE_BACKEND == "sqlite":
+        try:
+            backend = SQLiteCacheBackend(
+                RESPONSE_CACHE_PATH,
+                RESPONSE_CACHE_MAX_BYTES,
+                mmap_bytes=RESPONSE_CACHE_SQLITE_MMAP_BYTES,
+                sweep_interval=RESPONSE_CACHE_SWEEP_INTERVAL_SECONDS,
+            )
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f"Could not open SQLite response cache at {RESPONSE_CACHE_PATH}, using memory: {e}", exc_info=True)
+            backend = MemoryCacheBackend(RESPONSE_CACHE_MAX_BYTES)
+    else:
+        if RESPONSE_CACHE_BACKEND != "memory":
+            logger.warning(f"Unknown RESPONSE_CACHE_BACKEND '{RESPONSE_CACHE_BACKEND}', using memory.")
+        backend = MemoryCacheBackend(RESPONSE_CACHE_MAX_BYTES)
+
+    logger.info(
+        f"Response cache enabled (backend={type(backend).__name__}, max_bytes={RESPONSE_CACHE_MAX_BYTES}, "
+        f"ttl={RESPONSE_CACHE_TTL_SECONDS}s, variants={RESPONSE_CACHE_VARIANTS})."
+    )
+    return ResponseCache(backend, RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_VARIANTS)
+
+
+# --- Shared cache ---
+# Created on first use rather than at import (opening the SQLite backend touches the disk),
+# like the Gemini client; app/main.py opens it during worker startup
+_response_cache: ResponseCache | None = None
+_response_cache_created = False
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache | None:
+    """Returns the app's shared response cache, creating it on first use. None when caching is disabled."""
+    global _response_cache, _response_cache_created
+    if _response_cache_created:
+        return _response_cache
+    with _response_cache_lock:
+        if not _response_cache_created:
+            _response_cache = create_response_cache()
+            _response_cache_created = True
+        return _response_cache
+
+
+def __getattr__(name: str):
+    # response_cache used to be created at import time; keep it readable (lazily)
+    if name == "response_cache":
+        return get_response_cache()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+# --- End shared cache ---
+
+
+# --- Metrics ---
+_CACHE_STATS = registry.gauge(
+    "chatbot_response_cache", "Response cache counters (hits, misses, evictions, expirations, entries, bytes).", ("stat",))
+
+
+def _collect_cache_metrics() -> None:
+    cache = _response_cache
+    if cache is None:
+        return # Disabled, or not created yet
+    stats = cache.stats()
+    for stat in ("hits", "misses", "evictions", "expirations", "entries", "bytes"):
+        if stats.get(stat) is not None:
+            _CACHE_STATS.set(stats[stat], stat=stat)
+
+
+registry.add_collector(_collect_cache_metrics)
+# --- End metrics ---
@@ -0,0 +1,298 @@
+# c:\Users\1134931\chat_bot\app\routing.py
+import logging
+import random
+import threading
+import time
+
+from .rate_limit import TokenBucket
+from .resilience import is_retryable
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+# Errors meaning "this key is over its quota" (as opposed to upstream being unwell)
+RATE_LIMIT_STATUS_CODES = {429}
+RATE_LIMIT_EXCEPTION_NAMES = {"ResourceExhausted", "TooManyRequests"}
+# Weight of the newest sample in a model's moving-average response time
+LATENCY_EWMA_ALPHA = 0.2
+
+
+def is_rate_limited(error: BaseException) -> bool:
+    code = getattr(error, "code", None)
+    if isinstance(code, int) and code in RATE_LIMIT_STATUS_CODES:
+        return True
+    return type(error).__name__ in RATE_LIMIT_EXCEPTION_NAMES
+
+
+class ApiKeySpec:
+    """One API key from keys.json. `name` is used in logs and metrics; the key itself never is."""
+
+    __slots__ = ("name", "key", "requests_per_minute", "weight")
+
+    def __init__(self, name: str, key: str | None, requests_per_minute: float = 0.0, weight: float = 1.0):
+        self.name = name
+        self.key = key
+        self.requests_per_minute = requests_per_minute
+        self.weight = weight
+
+
+class ModelSpec:
+    """One model from keys.json. Primary models share traffic by weight; fallbacks are tried in order."""
+
+    __slots__ = ("name", "weight", "fallback", "requests_per_minute")
+
+    def __init__(self, name: str, weight: float = 1.0, fallback: bool = False, requests_per_minute: float | None = None):
+        self.name = name
+        self.weight = weight
+        self.fallback = fallback
+        # Overrides the key's budget for this model (quotas are per model)
+        self.requests_per_minute = requests_per_minute
+
+
+def parse_routing_config(config: dict, default_model: str, fallback_model: str,
+                         default_requests_per_minute: float) -> tuple[list[ApiKeySpec], list[ModelSpec]]:
+    """
+    Builds key and model specs from a keys.json dict (see config.get_keys_config).
+
+    Returns:
+        (keys, models). keys is empty if none are configured. Without a "models"
+        list, the default model is the primary and fallback_model (if any) the fallback.
+    """
+    entries = list(config.get("gemini_api_keys") or [])
+    if not entries and config.get("gemini_api_key"):
+        entries = [config["gemini_api_key"]]
+    keys = []
+    for index, entry in enumerate(entries, start=1):
+        if isinstance(entry, str):
+            entry = {"key": entry}
+        if not isinstance(entry, dict) or not entry.get("key"):
+            logger.warning(f"Ignoring API key entry {index} in keys.json: no key.")
+            continue
+        keys.append(ApiKeySpec(
+            str(entry.get("name") or f"key-{index}"),
+            entry["key"],
+            float(entry.get("requests_per_minute", default_requests_per_minute) or 0),
+            max(0.01, float(entry.get("weight", 1.0))),
+        ))
+
+    models = []
+    for entry in config.get("models") or []:
+        if isinstance(entry, str):
+            entry = {"name": entry}
+        if not isinstance(entry, dict) or not entry.get("name"):
+            logger.warning("Ignoring model entry without a name in keys.json.")
+            continue
+        requests_per_minute = entry.get("requests_per_minute")
+        models.append(ModelSpec(
+            entry["name"],
+            max(0.01, float(entry.get("weight", 1.0))),
+            bool(entry.get("fallback", False)),
+            float(requests_per_minute) if requests_per_minute is not None else None,
+        ))
+    if not any(not model.fallback for model in models):
+        if models:
+            logger.warning("keys.json lists only fallback models; using the default model as primary.")
+        models.insert(0, ModelSpec(default_model))
+        if fallback_model and not any(model.name == fallback_model for model in models):
+            models.append(ModelSpec(fallback_model, fallback=True))
+    return keys, models
+
+
+class Route:
+    """A (key, model) pair and its live accounting."""
+
+    __slots__ = (
+        "key", "model", "bucket", "in_flight", "cooldown_until", "consecutive_failures",
+        "requests", "failures", "rate_limited", "prompt_tokens", "response_tokens",
+    )
+
+    def __init__(self, key: ApiKeySpec, model: ModelSpec):
+        self.key = key
+        self.model = model
+        requests_per_minute = model.requests_per_minute if model.requests_per_minute is not None else key.requests_per_minute
+        # One minute's budget may be used in a burst; None = no local budget
+        self.bucket = TokenBucket(requests_per_minute / 60.0, requests_per_minute) if requests_per_minute > 0 else None
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.failures = 0
+        self.rate_limited = 0
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+
+    @property
+    def model_name(self) -> str:
+        return self.model.name
+
+    @property
+    def key_name(self) -> str:
+        return self.key.name
+
+    def __repr__(self) -> str:
+        return f"Route(key={self.key.name!r}, model={self.model.name!r})"
+
+
+class _ModelHealth:
+    __slots__ = ("latency", "last_attempt")
+
+    def __init__(self):
+        self.latency = None # Moving average of response time, None until measured
+        self.last_attempt = 0.0
+
+
+class ModelRouter:
+    """
+    Thread-safe router over API keys x models.
+
+    acquire() picks a model (primaries by weight, then fallbacks) and, for it,
+    the least-loaded key that is not cooling down and still has request budget
+    (token bucket). A primary model is skipped when no key has budget for it
+    (saturated) or its recent response time is above slow_seconds (slow), in
+    which case the fallback models are used. release() feeds back the outcome.
+    """
+
+    def __init__(self, keys: list[ApiKeySpec], models: list[ModelSpec], cooldown_seconds: float,
+                 failure_threshold: int, slow_seconds: float, slow_probe_seconds: float):
+        if not keys:
+            raise ValueError("At least one API key is required")
+        self.keys = keys
+        self.models = models
+        self.cooldown_seconds = cooldown_seconds
+        self.failure_threshold = max(1, failure_threshold)
+        self.slow_seconds = slow_seconds
+        self.slow_probe_seconds = slow_probe_seconds
+        self._primaries = [model for model in models if not model.fallback]
+        self._fallbacks = [model for model in models if model.fallback]
+        self._routes = {model.name: [Route(key, model) for key in keys] for model in models}
+        self._health = {model.name: _ModelHealth() for model in models}
+        self._lock = threading.Lock()
+        self.fallbacks_used = 0
+
+    @property
+    def default_route(self) -> Route:
+        """The first key with the first primary model (used for the shared model handle)."""
+        return self._routes[self._primaries[0].name][0]
+
+    @property
+    def primary_model_names(self) -> tuple[str, ...]:
+        """Models requests normally go to (fallbacks excluded)."""
+        return tuple(model.name for model in self._primaries)
+
+    def can_route(self) -> bool:
+        """True if some key of some model is not cooling down and has budget; reserves nothing."""
+        now = time.monotonic()
+        with self._lock:
+            return any(
+                route.cooldown_until <= now and (route.bucket is None or route.bucket.available >= 1)
+                for routes in self._routes.values()
+                for route in routes
+            )
+
+    def acquire(self) -> Route | None:
+        """Reserves a route for one call, or returns None if every key is cooling down or out of budget."""
+        now = time.monotonic()
+        with self._lock:
+            for model in self._candidate_models(now):
+                route = self._pick_key(model, now)
+                if route is not None:
+                    route.in_flight += 1
+                    route.requests += 1
+                    self._health[model.name].last_attempt = now
+                    if model.fallback:
+                        self.fallbacks_used += 1
+                    return route
+        return None
+
+    def release(self, route: Route, latency: float, error: BaseException | None = None) -> None:
+        """Records the outcome of a call made on a route returned by acquire()."""
+        now = time.monotonic()
+        with self._lock:
+            route.in_flight -= 1
+            if error is not None and not isinstance(error, Exception):
+                return # Cancelled by the caller - says nothing about the key or model
+            if error is None:
+                route.consecutive_failures = 0
+                self._observe_latency(route.model, latency)
+                return
+            route.failures += 1
+            if is_rate_limited(error):
+                route.rate_limited += 1
+                self._cool_down(route, now, "rate limited")
+            elif is_retryable(error):
+                route.consecutive_failures += 1
+                if isinstance(error, TimeoutError):
+                    self._observe_latency(route.model, latency)
+                if route.consecutive_failures >= self.failure_threshold:
+                    self._cool_down(route, now, f"{route.consecutive_failures} failures in a row")
+
+    def record_usage(self, route: Route, prompt_tokens: int | None, response_tokens: int | None) -> None:
+        with self._lock:
+            route.prompt_tokens += prompt_tokens or 0
+            route.response_tokens += response_tokens or 0
+
+    def stats(self) -> list[dict]:
+        """Per-route counters, for metrics and dashboards."""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                {
+                    "key": route.key.name,
+                    "model": route.model.name,
+                    "fallback": route.model.fallback,
+                    "in_flight": route.in_flight,
+                    "cooling_down": route.cooldown_until > now,
+                    "budget_available": route.bucket.available if route.bucket is not None else None,
+                    "requests": route.requests,
+                    "failures": route.failures,
+                    "rate_limited": route.rate_limited,
+                    "prompt_tokens": route.prompt_tokens,
+                    "response_tokens": route.response_tokens,
+                    "model_latency": self._health[route.model.name].latency,
+                }
+                for routes in self._routes.values()
+                for route in routes
+            ]
+
+    # --- Internal helpers (caller holds the lock) ---
+    def _candidate_models(self, now: float) -> list[ModelSpec]:
+        if len(self._primaries) > 1:
+            first = random.choices(self._primaries, weights=[model.weight for model in self._primaries])[0]
+            others = sorted((m for m in self._primaries if m is not first), key=lambda m: -m.weight)
+            primaries = [first] + others
+        else:
+            primaries = list(self._primaries)
+        if not self._fallbacks:
+            return primaries
+        fast = [model for model in primaries if not self._is_slow(model, now)]
+        slow = [model for model in primaries if model not in fast]
+        # Slow primaries are still used if the fallbacks have nothing left
+        return fast + self._fallbacks + slow
+
+    def _is_slow(self, model: ModelSpec, now: float) -> bool:
+        health = self._health[model.name]
+        if health.latency is None or health.latency <= self.slow_seconds:
+            return False
+        # Let a request through now and then to find out whether it has recovered
+        return now - health.last_attempt < self.slow_probe_seconds
+
+    def _pick_key(self, model: ModelSpec, now: float) -> Route | None:
+        candidates = [route for route in self._routes[model.name] if route.cooldown_until <= now]
+        # Least loaded first (in-flight calls relative to the key's weight), random among equals
+        candidates.sort(key=lambda route: (route.in_flight / route.key.weight, random.random()))
+        for route in candidates:
+            if route.bucket is None or route.bucket.try_acquire():
+                return route
+        return None
+
+    def _observe_latency(self, model: ModelSpec, latency: float) -> None:
+        health = self._health[model.name]
+        if health.latency is None:
+            health.latency = latency
+        else:
+            health.latency += LATENCY_EWMA_ALPHA * (latency - health.latency)
+
+    def _cool_down(self, route: Route, now: float, reason: str) -> None:
+        route.cooldown_until = now + self.cooldown_seconds
+        route.consecutive_failures = 0
+        logger.warning(f"API key '{route.key.name}' ({route.model.name}) {reason}; cooling down for {self.cooldown_seconds}s.")
@@ -0,0 +1,271 @@
+# c:\Users\1134931\chat_bot\app\single_flight.py
+import asyncio
+import logging
+import threading
+from typing import AsyncIterator, Awaitable, Callable, Hashable, Iterator
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+
+def _identity(value):
+    return value
+
+
+# --- Thread-based single flight ---
+class _Call:
+    """One in-flight blocking call and everything it produced so far."""
+
+    __slots__ = ("condition", "items", "done", "error", "abandoned", "followers")
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.items = []
+        self.done = False
+        self.error = None
+        # The leader stopped consuming before the stream finished (streams only)
+        self.abandoned = False
+        self.followers = 0
+
+
+class SingleFlight:
+    """
+    Deduplicates concurrent identical calls across threads: the first caller
+    for a key (the leader) runs the call, callers arriving while it is in
+    flight wait for it and get the same result, items or exception. The key
+    is forgotten as soon as the call finishes, so nothing is cached.
+
+    `share` is applied to values handed to followers (e.g. to strip data that
+    only the leader should account for); `on_follow` is called whenever a
+    caller attaches to a call in flight. A stream follower that gets no new
+    item for `stall_timeout` seconds stops waiting for the leader (which may
+    have been dropped without being closed) and restarts the stream itself.
+    """
+
+    def __init__(self, share: Callable = _identity, on_follow: Callable[[], None] | None = None,
+                 stall_timeout: float | None = None):
+        self.share = share
+        self.on_follow = on_follow
+        self.stall_timeout = stall_timeout
+        self._calls: dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+        self.takeovers = 0
+
+    def do(self, key: Hashable, fn: Callable[[], object]):
+        """Returns fn(), or the result of an identical call already in flight."""
+        call, is_leader = self._join(key)
+        if not is_leader:
+            with call.condition:
+                call.condition.wait_for(lambda: call.done)
+            if call.error is not None:
+                raise call.error
+            return self.share(call.items[0])
+
+        try:
+            result = fn()
+            call.items.append(result)
+            return result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(key, call)
+
+    def stream(self, key: Hashable, make_iterator: Callable[[], Iterator]) -> Iterator:
+        """
+        Yields the items of make_iterator(), or of an identical stream already
+        in flight (replayed from the start, then live). If the leader stops
+        consuming early, or makes no progress for stall_timeout seconds, its
+        followers start the stream again themselves.
+        """
+        while True:
+            call, is_leader = self._join(key)
+            if is_leader:
+                yield from self._lead_stream(key, call, make_iterator)
+                return
+
+            index = 0
+            while True:
+                with call.condition:
+                    if not call.condition.wait_for(lambda: index < len(call.items) or call.done, self.stall_timeout):
+                        self._detach_stalled(key, call)
+                    pending = call.items[index:]
+                    finished = call.done
+                index += len(pending)
+                for item in pending:
+                    yield self.share(item)
+                if finished and index >= len(call.items):
+                    break
+            if call.error is not None:
+                raise call.error
+            if not call.abandoned:
+                return
+            logger.debug(f"Single-flight leader abandoned stream {key!r}, restarting.")
+
+    def _lead_stream(self, key: Hashable, call: _Call, make_iterator: Callable[[], Iterator]) -> Iterator:
+        completed = False
+        try:
+            for item in make_iterator():
+                with call.condition:
+                    call.items.append(item)
+                    call.condition.notify_all()
+                yield item
+            completed = True
+        except GeneratorExit:
+            raise
+        except BaseException as e:
+            call.error = e
+            completed = True
+            raise
+        finally:
+            if not completed:
+                call.abandoned = True # Never reset: followers may have detached a stalled stream
+            self._finish(key, call)
+
+    def _detach_stalled(self, key: Hashable, call: _Call) -> None:
+        """
+        Gives up on a stream whose leader made no progress: later callers start a
+        new one, and every follower restarts. Caller holds call.condition.
+        """
+        logger.warning(f"Single-flight stream {key!r} made no progress for {self.stall_timeout}s, restarting.")
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+                self.takeovers += 1
+        call.abandoned = True
+        call.done = True
+        call.condition.notify_all()
+
+    def _join(self, key: Hashable) -> tuple[_Call, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            is_leader = call is None
+            if is_leader:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+            else:
+                call.followers += 1
+                self.followers += 1
+        if not is_leader and self.on_follow is not None:
+            self.on_follow()
+        return call, is_leader
+
+    def _finish(self, key: Hashable, call: _Call) -> None:
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+        with call.condition:
+            call.done = True
+            call.condition.notify_all()
+# --- End thread-based single flight ---
+
+
+# --- Asyncio single flight ---
+class _AsyncCall:
+    __slots__ = ("condition", "items", "done", "error", "task", "subscribers")
+
+    def __init__(self):
+        self.condition = asyncio.Condition()
+        self.items = []
+        self.done = False
+        self.error = None
+        self.task = None
+        self.subscribers = 0
+
+
+class AsyncSingleFlight:
+    """
+    Asyncio counterpart of SingleFlight, for use within one event loop.
+
+    The shared call runs in its own task, so a caller that is cancelled (or
+    whose client disconnects) doesn't take it down for the others. A shared
+    stream is cancelled once its last subscriber is gone.
+    """
+
+    def __init__(self, share: Callable = _identity, on_follow: Callable[[], None] | None = None):
+        self.share = share
+        self.on_follow = on_follow
+        self._calls: dict[Hashable, asyncio.Task] = {}
+        self._streams: dict[Hashable, _AsyncCall] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    async def do(self, key: Hashable, make_awaitable: Callable[[], Awaitable]):
+        """Returns await make_awaitable(), or the result of an identical call already in flight."""
+        task = self._calls.get(key)
+        is_leader = task is None
+        if is_leader:
+            self.leaders += 1
+            task = asyncio.ensure_future(make_awaitable())
+            self._calls[key] = task
+            task.add_done_callback(lambda finished: self._forget(self._calls, key, finished))
+        else:
+            self._follow()
+        # shield: cancelling one waiter must not cancel the shared call
+        result = await asyncio.shield(task)
+        return result if is_leader else self.share(result)
+
+    async def stream(self, key: Hashable, make_iterator: Callable[[], AsyncIterator]) -> AsyncIterator:
+        """Yields the items of make_iterator(), or of an identical stream already in flight (replayed, then live)."""
+        call = self._streams.get(key)
+        is_leader = call is None
+        if is_leader:
+            self.leaders += 1
+            call = _AsyncCall()
+            self._streams[key] = call
+            call.task = asyncio.ensure_future(self._produce(key, call, make_iterator))
+        else:
+            self._follow()
+
+        share = _identity if is_leader else self.share
+        call.subscribers += 1
+        index = 0
+        try:
+            while True:
+                async with call.condition:
+                    await call.condition.wait_for(lambda: index < len(call.items) or call.done)
+                    pending = call.items[index:]
+                    finished = call.done
+                index += len(pending)
+                for item in pending:
+                    yield share(item)
+                if finished and index >= len(call.items):
+                    break
+            if call.error is not None:
+                raise call.error
+        finally:
+            call.subscribers -= 1
+            if call.subscribers == 0 and not call.task.done():
+                # Nobody is listening any more - stop the upstream call (later callers start afresh)
+                self._forget(self._streams, key, call)
+                call.task.cancel()
+
+    async def _produce(self, key: Hashable, call: _AsyncCall, make_iterator: Callable[[], AsyncIterator]) -> None:
+        try:
+            async for item in make_iterator():
+                async with call.condition:
+                    call.items.append(item)
+                    call.condition.notify_all()
+        except asyncio.CancelledError:
+            call.error = asyncio.CancelledError()
+        except Exception as e:
+            call.error = e
+        finally:
+            self._forget(self._streams, key, call)
+            call.done = True
+            async with call.condition:
+                call.condition.notify_all()
+
+    def _follow(self) -> None:
+        self.followers += 1
+        if self.on_follow is not None:
+            self.on_follow()
+
+    @staticmethod
+    def _forget(calls: dict, key: Hashable, value) -> None:
+        if calls.get(key) is value:
+            del calls[key]
+# --- End asyncio single flight ---
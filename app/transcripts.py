@@ -0,0 +1,184 @@
+# c:\Users\1134931\chat_bot\app\transcripts.py
+import atexit
+import datetime
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from .config import (
+    TRANSCRIPTS_ENABLED, TRANSCRIPTS_PATH, TRANSCRIPTS_MAX_BYTES, TRANSCRIPTS_BACKUP_COUNT,
+    TRANSCRIPTS_BATCH_SIZE, TRANSCRIPTS_FLUSH_SECONDS, TRANSCRIPTS_QUEUE_SIZE,
+)
+from .metrics import registry
+
+# Get logger instance
+logger = logging.getLogger(__name__)
+
+_TRANSCRIPTS_WRITTEN = registry.counter(
+    "chatbot_transcripts_written_total", "Transcript records written to the transcript log.")
+_TRANSCRIPTS_DROPPED = registry.counter(
+    "chatbot_transcripts_dropped_total", "Transcript records dropped (writer queue full or write failed).")
+
+_STOP = object() # Queue marker telling the writer thread to finish
+_SUFFIX = ".jsonl.gz"
+
+
+class TranscriptLog:
+    """
+    Append-only audit log of submissions as gzip-compressed JSON lines.
+
+    record() only puts the entry on a bounded queue and never waits: when the
+    writer falls behind (e.g. a slow disk) entries are dropped and counted. A
+    background thread (started by the first record()) serializes entries in batches and appends each batch as
+    a complete gzip member, so the file stays readable (zcat, gzip.open) even
+    if the process dies. Once the file reaches max_bytes it is rotated like
+    RotatingFileHandler does: transcripts.jsonl.gz -> transcripts.1.jsonl.gz ...
+    """
+
+    def __init__(self, path: str, max_bytes: int, backup_count: int, batch_size: int,
+                 flush_seconds: float, queue_size: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = max(1, batch_size)
+        self.flush_seconds = flush_seconds
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        self.written = 0
+        self.dropped = 0
+        self._dropped_lock = threading.Lock() # Drops are counted from request threads too
+        self._thread: threading.Thread | None = None # Started on first use, so importing starts nothing
+        self._start_lock = threading.Lock()
+
+    def record(self, handler: str, persona: str, prompt: str, reply: str, status: str, latency: float,
+               prompt_tokens: int | None = None, response_tokens: int | None = None) -> None:
+        """Queues one submission for the log. Never blocks."""
+        entry = {
+            "time": time.time(),
+            "handler": handler,
+            "persona": persona,
+            "status": status,
+            "prompt": prompt,
+            "reply": reply,
+            "latency_s": round(latency, 4),
+            "prompt_tokens": prompt_tokens,
+            "response_tokens": response_tokens,
+        }
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self._drop(1)
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Writes out the queued entries and stops the writer thread."""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            logger.warning("Transcript writer did not keep up; stopping without writing the queued entries.")
+            return
+        self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {"written": self.written, "dropped": self.dropped, "queued": self._queue.qsize()}
+
+    # --- Writer thread ---
+    def _start(self) -> None:
+        with self._start_lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run, name="transcript-writer", daemon=True)
+                thread.start()
+                self._thread = thread
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            entry = self._queue.get()
+            if entry is _STOP:
+                break
+            batch = [entry]
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stopping = True
+                    break
+                batch.append(entry)
+            self._write(batch)
+
+    def _write(self, batch: list[dict]) -> None:
+        lines = []
+        for entry in batch:
+            entry["time"] = datetime.datetime.fromtimestamp(entry["time"], datetime.timezone.utc).isoformat()
+            lines.append(json.dumps(entry, ensure_ascii=False))
+        member = gzip.compress(("\n".join(lines) + "\n").encode("utf-8"))
+        try:
+            self._rotate_if_needed(len(member))
+            with open(self.path, "ab") as f:
+                f.write(member)
+        except OSError as e:
+            logger.error(f"Could not write {len(batch)} transcript records to {self.path}: {e}")
+            self._drop(len(batch))
+            return
+        self.written += len(batch)
+        _TRANSCRIPTS_WRITTEN.inc(len(batch))
+
+    def _rotate_if_needed(self, incoming_bytes: int) -> None:
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            return
+        if size == 0 or size + incoming_bytes <= self.max_bytes:
+            return
+        if self.backup_count <= 0:
+            os.remove(self.path)
+            return
+        for index in range(self.backup_count - 1, 0, -1):
+            older = self._rotated_path(index)
+            if os.path.exists(older):
+                os.replace(older, self._rotated_path(index + 1))
+        os.replace(self.path, self._rotated_path(1))
+        logger.info(f"Rotated transcript log {self.path}.")
+
+    def _rotated_path(self, index: int) -> str:
+        if self.path.endswith(_SUFFIX):
+            return f"{self.path[:-len(_SUFFIX)]}.{index}{_SUFFIX}"
+        return f"{self.path}.{index}"
+
+    def _drop(self, count: int) -> None:
+        with self._dropped_lock:
+            self.dropped += count
+        _TRANSCRIPTS_DROPPED.inc(count)
+
+
+def create_transcript_log() -> TranscriptLog | None:
+    """Creates the transcript log selected in config, or returns None when transcripts are disabled."""
+    if not TRANSCRIPTS_ENABLED:
+        return None
+    # With several worker processes, put {pid} in the path so each writes (and rotates) its own file
+    path = TRANSCRIPTS_PATH.replace("{pid}", str(os.getpid()))
+    log = TranscriptLog(
+        path, TRANSCRIPTS_MAX_BYTES, TRANSCRIPTS_BACKUP_COUNT, TRANSCRIPTS_BATCH_SIZE,
+        TRANSCRIPTS_FLUSH_SECONDS, TRANSCRIPTS_QUEUE_SIZE,
+    )
+    logger.info(f"Writing transcripts to {path} (rotating at {TRANSCRIPTS_MAX_BYTES} bytes, keeping {TRANSCRIPTS_BACKUP_COUNT}).")
+    return log
+
+
+# Shared transcript log for the app (None when disabled)
+transcript_log = create_transcript_log()
+if transcript_log is not None:
+    atexit.register(transcript_log.close)
@@ -0,0 +1,283 @@
+# batch.py
+"""
+Offline batch generation: runs many (persona, prompt) pairs through the Gemini
+client and streams the replies out as JSONL.
+
+Input is a JSONL file with one request per line:
+    {"persona": "Bartek", "prompt": "Give me a simple recipe for salmon.", "id": "optional"}
+
+Each output line repeats the request and adds the reply, its status and the
+latency (including any retries). Results are written in completion order; use the
+"line" field (0-based input line number) to join them back to the input.
+
+The input is read lazily and at most --max-in-flight requests are held in memory
+at once. Progress is checkpointed so an interrupted run can be resumed with the
+same command; requests finished after the last checkpoint may be repeated in the
+output on resume.
+
+Transient Gemini errors are retried by the client itself; --max-retries and the
+--backoff-* flags replace its retry policy for the run, and hedging is off so a
+batch never sends duplicate requests. --rate limits every Gemini call, retries
+included; cache hits don't count.
+
+Usage (from the project root):
+    python batch.py prompts.jsonl replies.jsonl --workers 8 --rate 2
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.logging_setup import configure_logging
+from app import gemini_client
+from app.gemini_client import generate_result, primary_model_names
+from app.metrics import UPSTREAM_LATENCY
+from app.persona_store import persona_store
+from app.rate_limit import TokenBucket
+from app.resilience import RetryPolicy
+from app.response_cache import get_response_cache, make_cache_key
+
+logger = logging.getLogger("batch")
+
+# How a Gemini call can end (the outcome label of UPSTREAM_LATENCY)
+_UPSTREAM_OUTCOMES = ("ok", "timeout", "retryable_error", "error")
+
+
+def upstream_calls() -> int:
+    """Gemini calls made by this process so far, retries included."""
+    return sum(UPSTREAM_LATENCY.count(outcome=outcome) for outcome in _UPSTREAM_OUTCOMES)
+
+
+class Checkpoint:
+    """
+    Tracks which input lines are finished, in bounded memory.
+
+    Everything below `watermark` is done; `done_above` holds finished lines
+    past the watermark (at most about max-in-flight of them, since lines are
+    submitted in order).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.watermark = 0
+        self.done_above: set[int] = set()
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        self.watermark = int(data.get("watermark", 0))
+        self.done_above = {int(line) for line in data.get("done_above", [])}
+        logger.info(f"Resuming from checkpoint {self.path} (watermark={self.watermark}, "
+                    f"{len(self.done_above)} extra lines done).")
+
+    def is_done(self, line_number: int) -> bool:
+        with self._lock:
+            return line_number < self.watermark or line_number in self.done_above
+
+    def mark_done(self, line_number: int) -> None:
+        with self._lock:
+            self.done_above.add(line_number)
+            while self.watermark in self.done_above:
+                self.done_above.remove(self.watermark)
+                self.watermark += 1
+
+    def save(self) -> None:
+        with self._lock:
+            data = {"watermark": self.watermark, "done_above": sorted(self.done_above)}
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(temp_path, self.path) # Atomic, so a crash never leaves a torn checkpoint
+
+
+class Progress:
+    """Thread-safe counters with periodic progress/throughput logging."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.started = time.monotonic()
+        self.completed = 0
+        self.skipped = 0
+        self.failed = 0
+        self.cache_hits = 0
+        self._upstream_calls_at_start = upstream_calls()
+        self._last_report = self.started
+        self._lock = threading.Lock()
+
+    def record(self, status_ok: bool, cache_hit: bool) -> None:
+        with self._lock:
+            self.completed += 1
+            self.failed += 0 if status_ok else 1
+            self.cache_hits += 1 if cache_hit else 0
+
+    def maybe_report(self, force: bool = False) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_report < self.interval:
+                return
+            self._last_report = now
+            elapsed = now - self.started
+            throughput = self.completed / elapsed if elapsed > 0 else 0.0
+            calls = upstream_calls() - self._upstream_calls_at_start
+            logger.info(
+                f"Progress: {self.completed} done ({self.failed} failed, {self.cache_hits} from cache, "
+                f"{calls} Gemini calls incl. retries, {self.skipped} skipped from checkpoint) "
+                f"in {elapsed:.1f}s - {throughput:.2f} requests/s"
+            )
+
+
+def iter_requests(input_path: str):
+    """
+    Yields (line_number, request dict or None, error) for each input line, lazily.
+    Blank lines come through as (line_number, None, None).
+    """
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f):
+            if not line.strip():
+                yield line_number, None, None
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("expected a JSON object")
+                yield line_number, request, None
+            except ValueError as e:
+                yield line_number, None, f"Invalid JSON request: {e}"
+
+
+def run_request(line_number: int, request: dict, args) -> dict:
+    """Generates the reply for one request; the client retries transient failures."""
+    persona_name = request.get("persona")
+    user_prompt = request.get("prompt") or ""
+    record = {"line": line_number, "id": request.get("id"), "persona": persona_name, "prompt": user_prompt}
+
+    persona = persona_store.get(persona_name)
+    if persona is None:
+        record.update(status="invalid", response=f"Error: Unknown persona '{persona_name}'.", latency_s=0.0)
+        return record
+
+    response_cache = get_response_cache() if args.use_cache else None
+    if response_cache is not None:
+        # Fallback-model replies are cached under their own model and not reused here
+        for model_name in primary_model_names():
+            cached_reply = response_cache.get(make_cache_key(persona.name, persona.backstory, model_name, user_prompt))
+            if cached_reply is not None:
+                record.update(status="ok", response=cached_reply, latency_s=0.0, cached=True)
+                return record
+
+    started = time.monotonic()
+    result = generate_result(persona.backstory, user_prompt)
+    if not result.ok:
+        logger.warning(f"Line {line_number}: {result.status}.")
+
+    if response_cache is not None and result.ok and result.model_name is not None:
+        response_cache.put(make_cache_key(persona.name, persona.backstory, result.model_name, user_prompt), result.text)
+    record.update(status=result.status, response=result.text, latency_s=round(time.monotonic() - started, 3))
+    return record
+
+
+def run_batch(args) -> int:
+    # One retry policy (the client's), from the CLI flags; no overall deadline for offline work.
+    # The rate limit is applied there too, so retries can't exceed it.
+    rate_limiter = TokenBucket(args.rate, args.burst) if args.rate > 0 else None
+    gemini_client.configure_retries(
+        RetryPolicy(args.max_retries, args.backoff_base, args.backoff_max), hedge=False, rate_limiter=rate_limiter
+    )
+
+    checkpoint = Checkpoint(args.checkpoint or f"{args.output}.checkpoint.json")
+    if args.restart and os.path.exists(checkpoint.path):
+        os.remove(checkpoint.path)
+    checkpoint.load()
+
+    progress = Progress(args.progress_interval)
+    in_flight = threading.BoundedSemaphore(args.max_in_flight)
+    output_lock = threading.Lock()
+    last_checkpoint_save = [time.monotonic()]
+
+    output_mode = 'w' if args.restart else 'a'
+    with open(args.output, output_mode, encoding='utf-8') as output_file, \
+            ThreadPoolExecutor(max_workers=args.workers, thread_name_prefix="batch") as pool:
+
+        def write_record(record: dict) -> None:
+            with output_lock:
+                output_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                checkpoint.mark_done(record["line"])
+                if time.monotonic() - last_checkpoint_save[0] >= args.checkpoint_interval:
+                    # Flush first so the checkpoint never claims lines that aren't on disk
+                    output_file.flush()
+                    checkpoint.save()
+                    last_checkpoint_save[0] = time.monotonic()
+            progress.record(record["status"] == "ok", record.get("cached", False))
+            progress.maybe_report()
+
+        def on_done(future, line_number: int, request: dict) -> None:
+            try:
+                record = future.result()
+            except Exception as e:
+                logger.error(f"Line {line_number}: unexpected failure: {e}", exc_info=True)
+                record = {"line": line_number, "id": request.get("id"), "persona": request.get("persona"),
+                          "prompt": request.get("prompt"), "status": "error", "response": str(e)}
+            try:
+                write_record(record)
+            finally:
+                in_flight.release()
+
+        for line_number, request, error in iter_requests(args.input):
+            if checkpoint.is_done(line_number):
+                progress.skipped += 1
+                continue
+            if request is None and error is None:
+                # Blank line: nothing to write, but done, so the watermark can move past it
+                checkpoint.mark_done(line_number)
+                continue
+            if error:
+                write_record({"line": line_number, "status": "invalid", "response": error})
+                continue
+            # Blocks while max_in_flight requests are pending, so the input is never read ahead
+            in_flight.acquire()
+            future = pool.submit(run_request, line_number, request, args)
+            future.add_done_callback(lambda f, n=line_number, r=request: on_done(f, n, r))
+
+    # The pool has drained; everything is written
+    checkpoint.save()
+    progress.maybe_report(force=True)
+    return 0 if progress.failed == 0 else 1
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate replies for a JSONL file of persona/prompt pairs.")
+    parser.add_argument("input", help="Input JSONL with {\"persona\", \"prompt\", \"id\"?} per line.")
+    parser.add_argument("output", help="Output JSONL (appended to when resuming).")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent generation threads.")
+    parser.add_argument("--rate", type=float, default=1.0, help="Max Gemini calls per second, retries included (0 = unlimited).")
+    parser.add_argument("--burst", type=float, default=None, help="Token bucket burst size (default: max(1, rate)).")
+    parser.add_argument("--max-retries", type=int, default=3, help="Client retries for transient Gemini errors.")
+    parser.add_argument("--backoff-base", type=float, default=1.0, help="First retry delay ceiling in seconds (jittered).")
+    parser.add_argument("--backoff-max", type=float, default=30.0, help="Largest retry delay ceiling in seconds.")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="Requests held in memory (default: 2 x workers).")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>.checkpoint.json).")
+    parser.add_argument("--checkpoint-interval", type=float, default=5.0, help="Seconds between checkpoint saves.")
+    parser.add_argument("--progress-interval", type=float, default=10.0, help="Seconds between progress reports.")
+    parser.add_argument("--no-cache", dest="use_cache", action="store_false", help="Don't read or fill the response cache.")
+    parser.add_argument("--restart", action="store_true", help="Ignore any checkpoint and overwrite the output.")
+    args = parser.parse_args(argv)
+    if args.max_in_flight is None:
+        args.max_in_flight = args.workers * 2
+    args.max_in_flight = max(args.max_in_flight, args.workers)
+    return args
+
+
+if __name__ == "__main__":
+    configure_logging()
+    try:
+        sys.exit(run_batch(parse_args()))
+    except KeyboardInterrupt:
+        logging.warning("Interrupted; re-run the same command to resume from the last checkpoint.")
+        sys.exit(130)
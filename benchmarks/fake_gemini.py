@@ -0,0 +1,226 @@
+# benchmarks/fake_gemini.py
+"""
+In-process stand-in for the Gemini model, for load tests that must run offline.
+
+FakeGeminiModel implements the parts of genai.GenerativeModel the client uses
+(generate_content / generate_content_async, blocking and streaming, and
+start_chat) and simulates upstream latency, streamed chunks, transient errors
+and safety blocks. install() plugs it into app.gemini_client via
+set_model_factory, so everything above the SDK (persona models, retries,
+circuit breaker, caching, concurrency limits, metrics) runs for real.
+
+Usage:
+    from benchmarks import fake_gemini
+    fake_gemini.install(latency=0.8, error_rate=0.02)
+"""
+import asyncio
+import itertools
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+from app import gemini_client
+
+WORDS = ("sure", "here", "is", "a", "simple", "answer", "that", "you", "could", "have", "found", "yourself")
+
+
+class ServiceUnavailable(Exception):
+    """Transient upstream failure; same name and code as google.api_core's 503 error, so it is retried."""
+
+    code = 503
+
+
+@dataclass
+class FakeGeminiOptions:
+    """Behaviour of the fake backend. Latencies are in seconds."""
+
+    latency: float = 0.5 # Median time for a complete (non-streaming) reply
+    latency_sigma: float = 0.3 # Spread of the log-normal latency distribution (0 = constant)
+    first_chunk_fraction: float = 0.3 # Streaming: share of the latency spent before the first chunk
+    chunks: int = 8 # Streaming: number of chunks per reply
+    words_per_chunk: int = 6
+    error_rate: float = 0.0 # Probability a call fails with ServiceUnavailable
+    block_rate: float = 0.0 # Probability a reply is blocked by the safety filter
+    seed: int | None = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+# --- Fake response objects (just the attributes gemini_client reads) ---
+class _Part:
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _PromptFeedback:
+    __slots__ = ("block_reason",)
+
+    def __init__(self, block_reason):
+        self.block_reason = block_reason
+
+
+class _UsageMetadata:
+    __slots__ = ("prompt_token_count", "candidates_token_count")
+
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class FakeResponse:
+    """A complete response, or one streamed chunk."""
+
+    def __init__(self, text: str, prompt_tokens: int, response_tokens: int, blocked: bool = False):
+        self.parts = [] if blocked else [_Part(text)]
+        self.text = "" if blocked else text
+        self.candidates = []
+        self.prompt_feedback = _PromptFeedback("SAFETY" if blocked else None)
+        self.usage_metadata = _UsageMetadata(prompt_tokens, response_tokens)
+
+
+class _FakeStream:
+    """Streaming response: the first chunk is ready on return, the rest arrive with delays."""
+
+    def __init__(self, chunks: list[FakeResponse], interval: float):
+        self._chunks = chunks
+        self._interval = interval
+
+    def __iter__(self):
+        for index, chunk in enumerate(self._chunks):
+            if index:
+                time.sleep(self._interval)
+            yield chunk
+
+    async def _aiter(self):
+        for index, chunk in enumerate(self._chunks):
+            if index:
+                await asyncio.sleep(self._interval)
+            yield chunk
+
+    def __aiter__(self):
+        return self._aiter()
+# --- End fake response objects ---
+
+
+class FakeChatSession:
+    """Minimal genai ChatSession: each message is sent together with the whole history."""
+
+    def __init__(self, model: "FakeGeminiModel", history=None):
+        self.model = model
+        self.history = list(history or [])
+
+    def send_message(self, content, stream: bool = False, request_options=None):
+        return self.model.generate_content(self.history + [content], stream=stream, request_options=request_options)
+
+    async def send_message_async(self, content, stream: bool = False, request_options=None):
+        return await self.model.generate_content_async(self.history + [content], stream=stream, request_options=request_options)
+
+
+class FakeGeminiModel:
+    """Drop-in replacement for genai.GenerativeModel with simulated behaviour."""
+
+    def __init__(self, options: FakeGeminiOptions, system_instruction: str | None = None, seed: int | None = None):
+        self.options = options
+        self.system_instruction = system_instruction
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def generate_content(self, contents, stream: bool = False, request_options=None):
+        latency, fails, blocked = self._draw()
+        if stream:
+            first_chunk_delay = latency * self.options.first_chunk_fraction
+            time.sleep(first_chunk_delay)
+            if fails:
+                raise ServiceUnavailable("Simulated upstream failure")
+            return self._stream(contents, latency - first_chunk_delay, blocked)
+        time.sleep(latency)
+        if fails:
+            raise ServiceUnavailable("Simulated upstream failure")
+        return self._reply(contents, blocked)
+
+    async def generate_content_async(self, contents, stream: bool = False, request_options=None):
+        latency, fails, blocked = self._draw()
+        if stream:
+            first_chunk_delay = latency * self.options.first_chunk_fraction
+            await asyncio.sleep(first_chunk_delay)
+            if fails:
+                raise ServiceUnavailable("Simulated upstream failure")
+            return self._stream(contents, latency - first_chunk_delay, blocked)
+        await asyncio.sleep(latency)
+        if fails:
+            raise ServiceUnavailable("Simulated upstream failure")
+        return self._reply(contents, blocked)
+
+    def start_chat(self, history=None):
+        return FakeChatSession(self, history)
+
+    # --- Internal helpers ---
+    def _draw(self) -> tuple[float, bool, bool]:
+        """Picks the latency and outcome of one call."""
+        options = self.options
+        with self._random_lock:
+            if options.latency_sigma > 0:
+                latency = options.latency * self._random.lognormvariate(0, options.latency_sigma)
+            else:
+                latency = options.latency
+            fails = self._random.random() < options.error_rate
+            blocked = self._random.random() < options.block_rate
+        return latency, fails, blocked
+
+    def _reply(self, contents, blocked: bool) -> FakeResponse:
+        words = self.options.chunks * self.options.words_per_chunk
+        return FakeResponse(self._text(words), _count_tokens(contents, self.system_instruction), words, blocked)
+
+    def _stream(self, contents, remaining_latency: float, blocked: bool) -> _FakeStream:
+        prompt_tokens = _count_tokens(contents, self.system_instruction)
+        if blocked:
+            return _FakeStream([FakeResponse("", prompt_tokens, 0, blocked=True)], 0)
+        chunk_count = max(1, self.options.chunks)
+        chunks = []
+        for index in range(chunk_count):
+            response_tokens = (index + 1) * self.options.words_per_chunk
+            chunks.append(FakeResponse(self._text(self.options.words_per_chunk) + " ", prompt_tokens, response_tokens))
+        interval = remaining_latency / (chunk_count - 1) if chunk_count > 1 else 0
+        return _FakeStream(chunks, interval)
+
+    def _text(self, words: int) -> str:
+        return " ".join(itertools.islice(itertools.cycle(WORDS), words))
+
+
+def _count_tokens(contents, system_instruction: str | None) -> int:
+    """Rough token count (whitespace-separated words), enough for usage metrics."""
+    return len(str(contents).split()) + len((system_instruction or "").split())
+
+
+def install(options: FakeGeminiOptions | None = None, **overrides) -> FakeGeminiOptions:
+    """
+    Routes all Gemini calls in this process to FakeGeminiModel.
+
+    Args:
+        options: Backend behaviour; defaults to FakeGeminiOptions().
+        **overrides: Individual FakeGeminiOptions fields to change.
+
+    Returns:
+        The options in effect.
+    """
+    options = options or FakeGeminiOptions()
+    for name, value in overrides.items():
+        setattr(options, name, value)
+    # Each persona model gets its own random stream, derived from the seed when one is given
+    model_seeds = itertools.count(options.seed) if options.seed is not None else None
+
+    def factory(system_instruction: str | None, model_name: str | None = None):
+        seed = next(model_seeds) if model_seeds is not None else None
+        return FakeGeminiModel(options, system_instruction, seed)
+
+    gemini_client.set_model_factory(factory)
+    return options
+
+
+def uninstall() -> None:
+    """Restores the real Gemini SDK."""
+    gemini_client.set_model_factory(None)
@@ -0,0 +1,54 @@
+# benchmarks/fake_server.py
+"""
+Serves the production ASGI app (app.main:create_app) under uvicorn with Gemini
+replaced by the fake backend from benchmarks/fake_gemini.py, so the full HTTP,
+Gradio queue and SSE stack can be load tested offline.
+
+benchmarks/load_test.py starts it for you; run it directly to point other tools
+at it (from the project root):
+    python -m benchmarks.fake_server --port 7861 --latency 0.5
+"""
+import argparse
+import sys
+
+
+def add_backend_arguments(parser: argparse.ArgumentParser) -> None:
+    """The fake backend's flags, shared with load_test.py (which passes them through)."""
+    parser.add_argument("--latency", type=float, default=0.5, help="Fake backend: median reply latency in seconds.")
+    parser.add_argument("--latency-sigma", type=float, default=0.3, help="Fake backend: log-normal latency spread.")
+    parser.add_argument("--chunks", type=int, default=8, help="Fake backend: chunks per streamed reply.")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fake backend: probability of a transient error.")
+    parser.add_argument("--block-rate", type=float, default=0.0, help="Fake backend: probability of a blocked reply.")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the fake backend.")
+
+
+def backend_arguments(args) -> list[str]:
+    """Command-line form of the fake backend's flags, for starting this module in a subprocess."""
+    return [
+        "--latency", str(args.latency), "--latency-sigma", str(args.latency_sigma), "--chunks", str(args.chunks),
+        "--error-rate", str(args.error_rate), "--block-rate", str(args.block_rate), "--seed", str(args.seed),
+    ]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Serve the chatbot ASGI app with a fake Gemini backend.")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to bind.")
+    parser.add_argument("--port", type=int, default=7861, help="Port to listen on.")
+    add_backend_arguments(parser)
+    args = parser.parse_args(argv)
+
+    import uvicorn
+    from app.main import create_app
+    from benchmarks import fake_gemini
+
+    # Installed before the app is built, so worker startup already sees the fake model
+    fake_gemini.install(
+        latency=args.latency, latency_sigma=args.latency_sigma, chunks=args.chunks,
+        error_rate=args.error_rate, block_rate=args.block_rate, seed=args.seed,
+    )
+    uvicorn.run(create_app, factory=True, host=args.host, port=args.port, log_level="warning")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+# benchmarks/load_test.py
+"""
+Open-loop load test of the submit endpoint over HTTP, against the fake Gemini backend.
+
+The production ASGI app (app.main:create_app) is started under uvicorn in a
+subprocess with Gemini replaced by the fake backend (benchmarks/fake_server.py),
+and requests go through the same path as the browser's: POST to the Gradio
+queue, then read the streamed reply over SSE. Gradio's own queue applies the
+concurrency limit and max size, so rejections (HTTP 503), queueing and
+streaming overhead are all measured rather than emulated.
+
+Requests arrive at a fixed average rate (Poisson or evenly spaced) whether or
+not earlier ones have finished, the way independent users would. Latency and
+time to first token are measured from the moment a request arrives. Reply
+statuses come from the server's /metrics.
+
+Usage (from the project root):
+    python -m benchmarks.load_test --rate 20 --duration 30 --output load.json
+    python -m benchmarks.load_test --url http://127.0.0.1:7861 # An already running server
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.fake_server import add_backend_arguments, backend_arguments
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Gradio API name of the submit button's event (the handler's function name)
+SUBMIT_API = "handle_submission_stream"
+STATUS_REJECTED = "rejected" # Turned away by the Gradio queue (HTTP 503, queue full)
+STATUS_FAILED = "request_failed" # HTTP or SSE level failure, no reply status from the app
+# Submission statuses that count as successful replies
+SUCCESS_STATUSES = {"ok", "cached", "similar"}
+# Prompts drawn from this many "popular" questions when --repeat-ratio is set
+HOT_PROMPTS = 20
+_STATUS_LABEL = re.compile(r'status="([^"]*)"')
+_OUTCOME_LABEL = re.compile(r'outcome="([^"]*)"')
+
+
+class RequestRecord:
+    """Timings of one request, relative to its arrival time."""
+
+    __slots__ = ("latency", "ttft", "rejected", "failed")
+
+    def __init__(self):
+        self.latency = None
+        self.ttft = None
+        self.rejected = False
+        self.failed = False
+
+
+def arrival_offsets(rate: float, duration: float, arrival: str, rng: random.Random) -> list[float]:
+    """Arrival times (seconds from the start) of all requests in the run."""
+    offsets = []
+    now = 0.0
+    while True:
+        now += rng.expovariate(rate) if arrival == "poisson" else 1.0 / rate
+        if now >= duration:
+            return offsets
+        offsets.append(now)
+
+
+def make_workload(count: int, persona_names: list[str], repeat_ratio: float, rng: random.Random) -> list[tuple[str, str]]:
+    """(persona, prompt) pairs; a repeat_ratio share of them reuse popular prompts."""
+    workload = []
+    for index in range(count):
+        persona_name = persona_names[index % len(persona_names)]
+        if rng.random() < repeat_ratio:
+            prompt = f"Popular benchmark question {rng.randrange(HOT_PROMPTS)}"
+            persona_name = persona_names[0]
+        else:
+            prompt = f"Benchmark question {index}: what should I cook tonight?"
+        workload.append((persona_name, prompt))
+    return workload
+
+
+# --- Server ---
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args, port: int) -> subprocess.Popen:
+    """Starts benchmarks.fake_server; the app reads its configuration from the environment."""
+    env = dict(os.environ)
+    env["RESPONSE_CACHE_BACKEND"] = "memory" # Every run starts with an empty cache
+    env.setdefault("LOG_LEVEL", "WARNING") # Per-request INFO lines would drown the report
+    if args.no_cache:
+        env["RESPONSE_CACHE_ENABLED"] = "0"
+    if args.concurrency:
+        env["GRADIO_CONCURRENCY_LIMIT"] = str(args.concurrency)
+    if args.queue_size is not None:
+        env["GRADIO_QUEUE_MAX_SIZE"] = str(args.queue_size)
+    command = [sys.executable, "-m", "benchmarks.fake_server", "--port", str(port), *backend_arguments(args)]
+    return subprocess.Popen(command, cwd=PROJECT_ROOT, env=env)
+
+
+def stop_server(server: subprocess.Popen, timeout: float = 30.0) -> None:
+    """Stops the server the way a process manager would (SIGTERM, then SIGKILL)."""
+    server.terminate()
+    try:
+        server.wait(timeout)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+async def wait_until_ready(client, base_url: str, timeout: float, server: subprocess.Popen | None = None) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server is not None and server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode} before becoming ready.")
+        try:
+            response = await client.get(f"{base_url}/ready")
+            if response.status_code == 200:
+                return
+        except Exception:
+            pass # Not listening yet
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} was not ready after {timeout:.0f}s.")
+
+
+async def scrape_metrics(client, base_url: str) -> tuple[dict, dict]:
+    """(submissions per status, upstream attempts per outcome) from the server's /metrics."""
+    response = await client.get(f"{base_url}/metrics")
+    response.raise_for_status()
+    statuses, attempts = {}, {}
+    for line in response.text.splitlines():
+        if line.startswith("chatbot_requests_total{"):
+            match, counts = _STATUS_LABEL.search(line), statuses
+        elif line.startswith("gemini_upstream_latency_seconds_count{"):
+            match, counts = _OUTCOME_LABEL.search(line), attempts
+        else:
+            continue
+        if match:
+            counts[match.group(1)] = counts.get(match.group(1), 0) + int(float(line.rsplit(" ", 1)[1]))
+    return statuses, attempts
+
+
+def counts_delta(before: dict, after: dict) -> dict:
+    return {name: value - before.get(name, 0) for name, value in after.items() if value - before.get(name, 0)}
+# --- End server ---
+
+
+async def submit(client, base_url: str, record: RequestRecord, arrived: float, persona_name: str, prompt: str) -> None:
+    """Sends one prompt the way the browser does: join the queue, then read the reply's SSE stream."""
+    try:
+        response = await client.post(f"{base_url}/call/{SUBMIT_API}", json={"data": [persona_name, prompt]})
+        if response.status_code == 503:
+            record.rejected = True
+            return
+        response.raise_for_status()
+        event_id = response.json()["event_id"]
+
+        event = None
+        async with client.stream("GET", f"{base_url}/call/{SUBMIT_API}/{event_id}") as stream:
+            stream.raise_for_status()
+            async for line in stream.aiter_lines():
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                elif line.startswith("data:") and event in ("generating", "complete"):
+                    data = json.loads(line[len("data:"):])
+                    if record.ttft is None and data and data[0]:
+                        record.ttft = time.perf_counter() - arrived
+                    if event == "complete":
+                        record.latency = time.perf_counter() - arrived
+                        return
+                elif line.startswith("data:") and event == "error":
+                    break
+        record.failed = True # The stream ended without a complete event
+    except Exception:
+        record.failed = True
+
+
+async def run_load(base_url: str, workload, offsets, timeout: float) -> tuple[list[RequestRecord], float]:
+    """Fires every request at its arrival time. Returns the records and the elapsed time."""
+    import httpx
+
+    records = [RequestRecord() for _ in workload]
+    # No connection limit: the server's queue, not the client, decides what waits
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=100)
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        tasks = []
+        for record, offset, (persona_name, prompt) in zip(records, offsets, workload):
+            delay = started + offset - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(submit(client, base_url, record, started + offset, persona_name, prompt)))
+        await asyncio.gather(*tasks)
+        return records, time.perf_counter() - started
+
+
+def percentiles(values: list[float]) -> dict | None:
+    """p50/p95/p99 (nearest rank) plus mean and max, or None if there are no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return ordered[max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))]
+
+    return {
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+        "mean": statistics.fmean(ordered),
+        "max": ordered[-1],
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Open-loop HTTP load test of the chatbot against a fake Gemini backend.")
+    parser.add_argument("--url", help="Test a server that is already running instead of starting one (fake flags are ignored).")
+    parser.add_argument("--rate", type=float, default=10.0, help="Average arrival rate (requests per second).")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds during which requests arrive.")
+    parser.add_argument("--arrival", choices=("poisson", "constant"), default="poisson", help="Arrival process.")
+    parser.add_argument("--concurrency", type=int, help="Server's concurrency limit (default: GRADIO_CONCURRENCY_LIMIT).")
+    parser.add_argument("--queue-size", type=int, help="Server's queue size (default: GRADIO_QUEUE_MAX_SIZE).")
+    parser.add_argument("--repeat-ratio", type=float, default=0.0, help="Share of requests reusing popular prompts (cache hits).")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the server's response cache.")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request HTTP timeout in seconds.")
+    parser.add_argument("--startup-timeout", type=float, default=120.0, help="Seconds to wait for the server to be ready.")
+    add_backend_arguments(parser)
+    parser.add_argument("--output", help="Write the JSON report to this file as well as stdout.")
+    args = parser.parse_args(argv)
+
+    from app.persona_store import persona_store
+
+    persona_names = list(persona_store.snapshot.names)
+    if not persona_names:
+        print(f"No personas available in {persona_store.path}.", file=sys.stderr)
+        return 1
+    rng = random.Random(args.seed)
+    offsets = arrival_offsets(args.rate, args.duration, args.arrival, rng)
+    workload = make_workload(len(offsets), persona_names, args.repeat_ratio, rng)
+
+    server = None
+    base_url = args.url.rstrip("/") if args.url else None
+    if base_url is None:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = start_server(args, port)
+    try:
+        records, elapsed, statuses, attempts = asyncio.run(_measure(args, base_url, workload, offsets, server))
+    finally:
+        if server is not None:
+            stop_server(server)
+
+    completed = [record for record in records if record.latency is not None]
+    rejected = sum(1 for record in records if record.rejected)
+    failed = sum(1 for record in records if record.failed)
+    if rejected:
+        statuses[STATUS_REJECTED] = rejected
+    if failed:
+        statuses[STATUS_FAILED] = failed
+    succeeded = sum(count for status, count in statuses.items() if status in SUCCESS_STATUSES)
+
+    report = {
+        "benchmark": "load_test",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {
+            "url": args.url,
+            "arrival": args.arrival,
+            "rate_rps": args.rate,
+            "duration_s": args.duration,
+            "concurrency": args.concurrency,
+            "queue_size": args.queue_size,
+            "repeat_ratio": args.repeat_ratio,
+            "cache_enabled": not args.no_cache,
+            "personas": len(persona_names),
+        },
+        "fake_backend": None if args.url else {
+            "latency": args.latency, "latency_sigma": args.latency_sigma, "chunks": args.chunks,
+            "error_rate": args.error_rate, "block_rate": args.block_rate, "seed": args.seed,
+        },
+        "requests": len(records),
+        "completed": len(completed),
+        "elapsed_s": elapsed,
+        "offered_rps": len(records) / args.duration if args.duration else None,
+        "throughput_rps": len(completed) / elapsed if elapsed else None,
+        "success_rps": succeeded / elapsed if elapsed else None,
+        "error_rate": 1 - succeeded / len(records) if records else 0.0,
+        "statuses": statuses,
+        "latency_s": percentiles([record.latency for record in completed]),
+        "ttft_s": percentiles([record.ttft for record in completed if record.ttft is not None]),
+        "upstream_attempts": attempts,
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    return 0
+
+
+async def _measure(args, base_url: str, workload, offsets, server: subprocess.Popen | None):
+    """Runs the load between two /metrics scrapes. Returns (records, elapsed, statuses, upstream attempts)."""
+    import httpx
+
+    async with httpx.AsyncClient(timeout=10.0) as client:
+        await wait_until_ready(client, base_url, args.startup_timeout, server)
+        statuses_before, attempts_before = await scrape_metrics(client, base_url)
+        records, elapsed = await run_load(base_url, workload, offsets, args.timeout)
+        statuses_after, attempts_after = await scrape_metrics(client, base_url)
+    return records, elapsed, counts_delta(statuses_before, statuses_after), counts_delta(attempts_before, attempts_after)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+# benchmarks/near_duplicates.py
+"""
+Hit rate and lookup latency of the near-duplicate prompt index (app/near_duplicates.py)
+on a synthetic prompt corpus.
+
+The index is filled with --entries distinct prompts (with --max-entries below
+that, it drops its oldest half each time it fills up; add_ms_max shows the
+pause), then queried about the prompts it still holds with:
+
+    paraphrases  indexed prompts with surface edits (case, punctuation, word
+                 order, a dropped or added word) - these should hit, and hit
+                 the prompt they came from
+    novel        unrelated prompts that were never indexed - these should miss
+    variants     indexed prompts with one word replaced by a different content
+                 word - a different question, so a hit here is a wrong answer
+                 (the index's word check rejects these unless the new word's
+                 bits collide)
+
+Runs offline and doesn't touch the response cache.
+
+Usage (from the project root):
+    python -m benchmarks.near_duplicates --entries 200000 --queries 2000 --output near_duplicates.json
+    python -m benchmarks.near_duplicates --entries 300000 --max-entries 200000
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import string
+import sys
+import time
+
+# Words added or dropped by paraphrases without changing the question (all of them are
+# filler words to the index, so adding one doesn't fail its word check)
+FILLER_WORDS = ("please", "simple", "quick", "just", "really", "some", "me", "a")
+PROMPT_OPENERS = ("give me", "how do i", "what is the best", "tell me about", "can you suggest", "explain")
+
+
+def make_vocabulary(size: int, rng: random.Random) -> list[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))))
+    return sorted(words)
+
+
+def make_prompt(vocabulary: list[str], rng: random.Random) -> str:
+    """An opener followed by 3-6 content words, e.g. "how do i plavo mertis quon"."""
+    return f"{rng.choice(PROMPT_OPENERS)} {' '.join(rng.sample(vocabulary, rng.randint(3, 6)))}"
+
+
+def paraphrase(prompt: str, rng: random.Random) -> str:
+    """Applies one or two edits that keep the meaning of a prompt."""
+    words = prompt.split()
+    for _ in range(rng.randint(1, 2)):
+        edit = rng.randrange(4)
+        if edit == 0 and len(words) > 3:
+            i, j = rng.sample(range(len(words)), 2)
+            words[i], words[j] = words[j], words[i]
+        elif edit == 1:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(FILLER_WORDS))
+        elif edit == 2 and len(words) > 4:
+            words.pop(rng.randrange(len(words)))
+        else:
+            words[0] = words[0].capitalize()
+    return " ".join(words) + rng.choice(("", "?", "!", "."))
+
+
+def replace_word(prompt: str, vocabulary: list[str], rng: random.Random) -> str:
+    """Swaps the last content word for another one: same shape, different question."""
+    words = prompt.split()
+    words[-1] = rng.choice(vocabulary)
+    return " ".join(words)
+
+
+def percentiles(values: list[float]) -> dict | None:
+    """p50/p95/p99 (nearest rank) plus mean and max, or None if there are no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return ordered[max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered))) - 1))]
+
+    return {
+        "p50": rank(50),
+        "p95": rank(95),
+        "p99": rank(99),
+        "mean": statistics.fmean(ordered),
+        "max": ordered[-1],
+    }
+
+
+def run_queries(index, queries: list[tuple[str, str | None]], threshold: float) -> dict:
+    """Looks up (prompt, expected key) pairs; returns the hit rate, correct-hit rate and latency in ms."""
+    hits = correct = 0
+    latencies = []
+    for prompt, expected_key in queries:
+        started = time.perf_counter()
+        matches = index.find(prompt, threshold)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if matches:
+            hits += 1
+            correct += matches[0][2] == expected_key
+    return {
+        "queries": len(queries),
+        "hit_rate": hits / len(queries) if queries else 0.0,
+        "correct_hit_rate": correct / len(queries) if queries else 0.0,
+        "lookup_ms": percentiles(latencies),
+    }
+
+
+def main(argv=None) -> int:
+    from app.config import (
+        NEAR_DUPLICATE_THRESHOLD, NEAR_DUPLICATE_NGRAM, NEAR_DUPLICATE_NUM_PERM,
+        NEAR_DUPLICATE_BANDS, NEAR_DUPLICATE_ROWS, NEAR_DUPLICATE_MIN_NGRAMS,
+    )
+
+    parser = argparse.ArgumentParser(description="Hit rate and lookup latency of the near-duplicate prompt index.")
+    parser.add_argument("--entries", type=int, default=100_000, help="Prompts added to the index.")
+    parser.add_argument("--max-entries", type=int, default=0,
+                        help="Index capacity; below --entries, adds trigger evictions (0 = --entries).")
+    parser.add_argument("--queries", type=int, default=2000, help="Queries of each kind.")
+    parser.add_argument("--vocabulary", type=int, default=5000, help="Distinct content words in the corpus.")
+    parser.add_argument("--threshold", type=float, default=NEAR_DUPLICATE_THRESHOLD, help="Similarity threshold.")
+    parser.add_argument("--ngram", type=int, default=NEAR_DUPLICATE_NGRAM, help="Character n-gram length.")
+    parser.add_argument("--num-perm", type=int, default=NEAR_DUPLICATE_NUM_PERM, help="MinHash signature length.")
+    parser.add_argument("--bands", type=int, default=NEAR_DUPLICATE_BANDS, help="LSH bands.")
+    parser.add_argument("--rows", type=int, default=NEAR_DUPLICATE_ROWS, help="Signature values per band.")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the corpus.")
+    parser.add_argument("--output", help="Write the JSON report to this file as well as stdout.")
+    args = parser.parse_args(argv)
+
+    from app.near_duplicates import MinHasher, SimilarityIndex
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+    hasher = MinHasher(args.num_perm, args.ngram, NEAR_DUPLICATE_MIN_NGRAMS)
+    max_entries = args.max_entries or args.entries
+    index = SimilarityIndex(hasher, args.bands, args.rows, max_entries=max_entries)
+
+    prompts = []
+    seen = set()
+    while len(prompts) < args.entries:
+        prompt = make_prompt(vocabulary, rng)
+        if prompt not in seen:
+            seen.add(prompt)
+            prompts.append(prompt)
+    keys = [f"{entry_id:064x}" for entry_id in range(len(prompts))]
+
+    add_ms_max = 0.0
+    started = time.perf_counter()
+    for prompt, key in zip(prompts, keys):
+        add_started = time.perf_counter()
+        index.add(prompt, key)
+        add_ms_max = max(add_ms_max, (time.perf_counter() - add_started) * 1000)
+    build_s = time.perf_counter() - started
+
+    # Evictions drop the oldest prompts, so only the newest len(index) can be found
+    first_indexed = len(prompts) - len(index)
+    sampled = rng.sample(range(first_indexed, len(prompts)), min(args.queries, len(index)))
+    paraphrases = [(paraphrase(prompts[i], rng), keys[i]) for i in sampled]
+    variants = [(replace_word(prompts[i], vocabulary, rng), keys[i]) for i in sampled]
+    novel = []
+    while len(novel) < args.queries:
+        prompt = make_prompt(vocabulary, rng)
+        if prompt not in seen:
+            novel.append((prompt, None))
+
+    report = {
+        "benchmark": "near_duplicates",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {
+            "entries": args.entries,
+            "max_entries": max_entries,
+            "vocabulary": args.vocabulary,
+            "threshold": args.threshold,
+            "ngram": args.ngram,
+            "num_perm": args.num_perm,
+            "bands": args.bands,
+            "rows": args.rows,
+        },
+        "indexed": len(index),
+        "build_s": build_s,
+        "add_ms_mean": build_s / len(prompts) * 1000 if prompts else None,
+        "add_ms_max": add_ms_max,
+        "index_bytes": index.memory_bytes,
+        "bytes_per_entry": index.memory_bytes / len(index) if len(index) else None,
+        "paraphrases": run_queries(index, paraphrases, args.threshold),
+        "novel": run_queries(index, novel, args.threshold),
+        "variants": run_queries(index, variants, args.threshold),
+    }
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
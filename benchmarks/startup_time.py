@@ -0,0 +1,94 @@
+# benchmarks/startup_time.py
+"""
+Measures cold-start cost of the app: importing app.gradio_interface and building
+the interface with create_chatbot_interface(). Each run happens in a fresh
+interpreter so module caches don't hide regressions.
+
+Usage (from the project root):
+    python -m benchmarks.startup_time --runs 5 --output startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the child interpreter and prints one JSON line with its timings
+CHILD_SCRIPT = """
+import json, logging, sys, time
+logging.disable(logging.CRITICAL)
+start = time.perf_counter()
+import app.gradio_interface as gradio_interface
+imported = time.perf_counter()
+gradio_interface.create_chatbot_interface()
+created = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - start,
+    "create_interface_s": created - imported,
+    "total_s": created - start,
+    "gemini_sdk_imported": "google.generativeai" in sys.modules,
+}))
+"""
+
+
+def run_once(python: str) -> dict:
+    """Runs one cold start in a subprocess and returns its timings."""
+    wall_start = time.perf_counter()
+    completed = subprocess.run(
+        [python, "-c", CHILD_SCRIPT],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    wall = time.perf_counter() - wall_start
+    if completed.returncode != 0:
+        raise RuntimeError(f"Startup run failed:\n{completed.stderr}")
+    # The timings are on the last line; libraries may print above it
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["process_wall_s"] = wall
+    return result
+
+
+def summarize(values: list[float]) -> dict:
+    return {
+        "min": min(values),
+        "median": statistics.median(values),
+        "mean": statistics.fmean(values),
+        "max": max(values),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure app import and interface creation time.")
+    parser.add_argument("--runs", type=int, default=5, help="Number of cold starts to measure.")
+    parser.add_argument("--python", default=sys.executable, help="Interpreter to benchmark.")
+    parser.add_argument("--output", help="Write the JSON report to this file as well as stdout.")
+    args = parser.parse_args(argv)
+
+    runs = [run_once(args.python) for _ in range(args.runs)]
+    report = {
+        "benchmark": "startup_time",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "runs": len(runs),
+        "gemini_sdk_imported_at_startup": any(run["gemini_sdk_imported"] for run in runs),
+    }
+    for metric in ("import_s", "create_interface_s", "total_s", "process_wall_s"):
+        report[metric] = summarize([run[metric] for run in runs])
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
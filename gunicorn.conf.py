@@ -0,0 +1,19 @@
+# gunicorn.conf.py
+# Production serving with gunicorn managing uvicorn workers:
+#     gunicorn -c gunicorn.conf.py app.main:app
+# Settings come from app/config.py (SERVER_* environment variables).
+from app.config import (
+    SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_GRACEFUL_SHUTDOWN_SECONDS, SERVER_SHUTDOWN_DELAY_SECONDS,
+)
+
+bind = f"{SERVER_HOST}:{SERVER_PORT}"
+workers = SERVER_WORKERS
+worker_class = "uvicorn.workers.UvicornWorker"
+# Each worker builds its own app, Gemini clients and caches: the SDK's gRPC channels
+# must not be shared across a fork, so the app is not preloaded in the master
+preload_app = False
+# Streamed replies keep a request open for as long as the generation runs
+timeout = 0
+# Time a worker gets after SIGTERM to leave rotation and drain its in-flight generations
+graceful_timeout = SERVER_SHUTDOWN_DELAY_SECONDS + SERVER_GRACEFUL_SHUTDOWN_SECONDS + 5
+keepalive = 5
@@ -1,31 +1,58 @@
 # c:\Users\1134931\chat_bot\run.py
+import argparse
 import logging
+from app.logging_setup import configure_logging
+
+# --- Configure logging centrally ---
+# Before the other app imports, so what they log on import is kept. Records are written by
+# a background thread; LOG_LEVEL, LOG_FILE etc. are set in app/config.py
+configure_logging()
+
 import gradio as gr
 # Import directly from the gradio_interface module
 from app.gradio_interface import create_chatbot_interface
-
-# --- Configure logging centrally ---
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    # Optional: Add a file handler
-    # handlers=[
-    #     logging.FileHandler("chatbot.log"),
-    #     logging.StreamHandler() # Keep console output
-    # ]
+from app.config import (
+    PERSONA_THUMBNAIL_DIR, SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_GRACEFUL_SHUTDOWN_SECONDS,
 )
 
+
+def serve_production(workers: int) -> None:
+    """Serves app.main with uvicorn: one app per worker process, graceful shutdown on SIGTERM."""
+    import uvicorn
+    if workers > 1:
+        logging.warning(
+            f"Starting {workers} workers on one port. Gradio keeps queue and chat state per process and "
+            "the workers don't share it; without session affinity, prefer single-worker instances behind a sticky proxy."
+        )
+    uvicorn.run(
+        "app.main:create_app", factory=True, host=SERVER_HOST, port=SERVER_PORT, workers=workers,
+        timeout_graceful_shutdown=int(SERVER_GRACEFUL_SHUTDOWN_SECONDS), log_config=None,
+    )
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Runs the persona chatbot.")
+    parser.add_argument("--production", action="store_true", help="Serve the ASGI app (app.main) with uvicorn instead of Gradio's dev server.")
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="Worker processes in production mode (default: SERVER_WORKERS).")
+    args = parser.parse_args()
+    if args.production:
+        serve_production(args.workers)
+        raise SystemExit(0)
+
     logging.info("Creating Gradio interface...")
     try:
         # Create the Gradio interface instance
-        chatbot_interface = create_chatbot_interface()
+        # Gradio's own server has no thumbnail route, so serve them through its file route
+        chatbot_interface = create_chatbot_interface(image_url_prefix=f"/file={PERSONA_THUMBNAIL_DIR}")
 
         logging.info("Launching Gradio interface...")
         # Launch the Gradio app using its built-in server
         # Set share=False for local development unless you need a public link
         # Set server_name="0.0.0.0" to make it accessible on your local network
-        chatbot_interface.launch(server_name="0.0.0.0", server_port=7860, share=False)
+        chatbot_interface.launch(
+            server_name="0.0.0.0", server_port=7860, share=False,
+            allowed_paths=[PERSONA_THUMBNAIL_DIR]
+        )
 
     except ImportError as e:
         logging.error(f"Import error: {e}. Please ensure all dependencies are installed and relative imports are correct.", exc_info=True)
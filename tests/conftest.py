@@ -0,0 +1,68 @@
+# tests/conftest.py
+"""
+Shared fixtures. Gemini calls go to the in-process fake backend from
+benchmarks/fake_gemini.py, so the tests run offline and need no API key.
+"""
+import pytest
+
+from app import gemini_client
+from app.resilience import RetryPolicy
+from benchmarks import fake_gemini
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    """
+    Returns install(**options): routes Gemini calls to the fake backend with the
+    given FakeGeminiOptions (instant, constant-latency replies by default).
+
+    Retries are made near-instant and the circuit breaker is switched off, so
+    tests that need them set their own (monkeypatch gemini_client.retry_policy
+    or gemini_client.circuit_breaker).
+    """
+    monkeypatch.setattr(gemini_client, "retry_policy", RetryPolicy(2, 0.001, 0.001))
+    monkeypatch.setattr(gemini_client, "circuit_breaker", None)
+
+    def install(**overrides) -> fake_gemini.FakeGeminiOptions:
+        overrides.setdefault("latency", 0.0)
+        overrides.setdefault("latency_sigma", 0.0)
+        overrides.setdefault("seed", 1)
+        return fake_gemini.install(**overrides)
+
+    yield install
+    fake_gemini.uninstall()
+
+
+class FlakyModel(fake_gemini.FakeGeminiModel):
+    """Fake model whose first `failures` calls raise `error`; counts every call."""
+
+    def __init__(self, options: fake_gemini.FakeGeminiOptions, failures: int, error: Exception):
+        super().__init__(options)
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    def generate_content(self, contents, stream: bool = False, request_options=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return super().generate_content(contents, stream=stream, request_options=request_options)
+
+    async def generate_content_async(self, contents, stream: bool = False, request_options=None):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return await super().generate_content_async(contents, stream=stream, request_options=request_options)
+
+
+@pytest.fixture
+def flaky_model(fake_model):
+    """Returns install(failures, error, **options): every model handle shares one FlakyModel."""
+
+    def install(failures: int, error: Exception, **overrides) -> FlakyModel:
+        options = fake_model(**overrides)
+        model = FlakyModel(options, failures, error)
+        gemini_client.set_model_factory(lambda system_instruction, model_name=None: model)
+        return model
+
+    return install
@@ -0,0 +1,69 @@
+import json
+import time
+
+import pytest
+
+import batch
+from app import gemini_client
+from app.persona_store import PersonaStore
+from benchmarks.fake_gemini import ServiceUnavailable
+
+
+@pytest.fixture
+def run(tmp_path, monkeypatch):
+    """
+    Returns run(*flags, lines=None) -> output records, for the given input lines (by
+    default one request) against a tmp persona file. run.checkpoint() reads the checkpoint.
+    """
+    personas = tmp_path / "backstories.json"
+    personas.write_text(json.dumps({"Bartek": {"backstory": "Can't cook."}}), encoding="utf-8")
+    monkeypatch.setattr(batch, "persona_store", PersonaStore(str(personas)))
+    # Restored afterwards
+    monkeypatch.setattr(gemini_client, "hedge_enabled", gemini_client.hedge_enabled)
+    monkeypatch.setattr(gemini_client, "attempt_rate_limiter", gemini_client.attempt_rate_limiter)
+    input_path = tmp_path / "prompts.jsonl"
+    output_path = tmp_path / "replies.jsonl"
+
+    def run(*flags: str, lines: list[str] | None = None) -> list[dict]:
+        if lines is None:
+            lines = [json.dumps({"persona": "Bartek", "prompt": "Boil an egg?"})]
+        input_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        args = batch.parse_args([str(input_path), str(output_path), "--rate", "0", "--no-cache", "--restart",
+                                 "--backoff-base", "0.001", "--backoff-max", "0.001", *flags])
+        batch.run_batch(args)
+        return [json.loads(line) for line in output_path.read_text(encoding="utf-8").splitlines()]
+
+    run.checkpoint = lambda: json.loads((tmp_path / "replies.jsonl.checkpoint.json").read_text(encoding="utf-8"))
+    return run
+
+
+def test_transient_errors_are_retried_once_per_attempt(flaky_model, run):
+    model = flaky_model(failures=2, error=ServiceUnavailable("overloaded"))
+    [record] = run("--max-retries", "3")
+    assert record["status"] == "ok"
+    assert model.calls == 3 # Two failures and the success - no retries on top of retries
+
+
+def test_max_retries_caps_upstream_calls(flaky_model, run):
+    model = flaky_model(failures=100, error=ServiceUnavailable("overloaded"))
+    [record] = run("--max-retries", "2")
+    assert record["status"] == "error"
+    assert model.calls == 3
+    assert not gemini_client.hedge_enabled
+
+
+def test_rate_limit_applies_to_retries(flaky_model, run):
+    model = flaky_model(failures=2, error=ServiceUnavailable("overloaded"))
+    started = time.monotonic()
+    [record] = run("--rate", "10", "--burst", "1", "--max-retries", "3")
+    assert record["status"] == "ok"
+    assert model.calls == 3
+    assert time.monotonic() - started >= 0.18 # Three attempts at 10/s with no burst
+
+
+def test_blank_lines_do_not_hold_back_the_checkpoint(fake_model, run):
+    fake_model()
+    request = json.dumps({"persona": "Bartek", "prompt": "Boil an egg?"})
+    records = run(lines=[request, "", request, "  ", request])
+    assert sorted(record["line"] for record in records) == [0, 2, 4]
+    assert run.checkpoint() == {"watermark": 5, "done_above": []}
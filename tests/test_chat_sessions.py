@@ -0,0 +1,73 @@
+import asyncio
+import time
+
+from app import chat_sessions
+from app.chat_sessions import ChatSession, stream_chat_reply
+from app.gemini_client import STATUS_OK, GenerationResult
+
+BACKSTORY = "A man who learned to cook from cereal boxes."
+
+
+def _slow_summary(calls: list):
+    async def summarize(prompt: str) -> GenerationResult:
+        calls.append(prompt)
+        await asyncio.sleep(0.3)
+        return GenerationResult("They talked about eggs.", STATUS_OK)
+
+    return summarize
+
+
+async def _send(session: ChatSession, message: str) -> GenerationResult:
+    result = None
+    async for result in stream_chat_reply(session, message):
+        pass
+    return result
+
+
+def test_compaction_runs_after_the_reply(fake_model, monkeypatch):
+    fake_model()
+    summaries = []
+    monkeypatch.setattr(chat_sessions, "generate_text_result_async", _slow_summary(summaries))
+    monkeypatch.setattr(chat_sessions, "CHAT_HISTORY_TOKEN_BUDGET", 1)
+    monkeypatch.setattr(chat_sessions, "CHAT_MIN_RECENT_TURNS", 1)
+
+    async def main():
+        session = ChatSession("s", "Bartek", BACKSTORY)
+        await _send(session, "How do I boil an egg?")
+        started = time.perf_counter()
+        result = await _send(session, "And a soft one?")
+        reply_time = time.perf_counter() - started # Doesn't include the summary call
+        assert session.summary == "" and len(session.turns) == 2
+        await asyncio.gather(*chat_sessions._compactions)
+        return result, reply_time, session
+
+    result, reply_time, session = asyncio.run(main())
+    assert result.status == STATUS_OK
+    assert reply_time < 0.25
+    assert len(summaries) == 1 # The first turn's compaction had nothing to fold yet
+    assert session.summary == "They talked about eggs."
+    assert [turn.user for turn in session.turns] == ["And a soft one?"]
+
+
+def test_next_turn_waits_for_a_running_compaction(fake_model, monkeypatch):
+    fake_model()
+    monkeypatch.setattr(chat_sessions, "generate_text_result_async", _slow_summary([]))
+    monkeypatch.setattr(chat_sessions, "CHAT_HISTORY_TOKEN_BUDGET", 1)
+    monkeypatch.setattr(chat_sessions, "CHAT_MIN_RECENT_TURNS", 1)
+    histories = []
+    original = chat_sessions.stream_chat_results_async
+
+    def record_history(backstory, history, message):
+        histories.append(history)
+        return original(backstory, history, message)
+
+    monkeypatch.setattr(chat_sessions, "stream_chat_results_async", record_history)
+
+    async def main():
+        session = ChatSession("s", "Bartek", BACKSTORY)
+        await _send(session, "How do I boil an egg?")
+        await _send(session, "And a soft one?") # Schedules a compaction
+        await _send(session, "How long for hard?") # Sent with the compacted history
+
+    asyncio.run(main())
+    assert "They talked about eggs." in histories[-1][0]["parts"][0]
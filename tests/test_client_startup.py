@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app import gemini_client
+from benchmarks.fake_gemini import FakeGeminiModel, FakeGeminiOptions
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_the_app_does_not_load_the_sdk():
+    script = (
+        "import importlib.util, sys\n"
+        "import app.gemini_client, app.chat_sessions, app.near_duplicates, app.response_cache, batch\n"
+        "if importlib.util.find_spec('gradio') and importlib.util.find_spec('fastapi'):\n"
+        "    import app.gradio_interface, app.main\n"
+        "loaded = sorted(name for name in sys.modules if name.startswith('google.generativeai'))\n"
+        "assert not loaded, loaded\n"
+    )
+    subprocess.run([sys.executable, "-c", script], cwd=ROOT, check=True)
+
+
+@pytest.fixture
+def failing_once(monkeypatch):
+    """A model factory whose first call raises; returns the list of factory calls."""
+    calls = []
+
+    def factory(system_instruction, model_name=None):
+        calls.append(model_name)
+        if len(calls) == 1:
+            raise RuntimeError("Simulated SDK failure")
+        return FakeGeminiModel(FakeGeminiOptions(latency=0.0, latency_sigma=0.0))
+
+    gemini_client.set_model_factory(factory)
+    yield calls
+    gemini_client.set_model_factory(None)
+
+
+def test_failed_init_is_retried_after_the_delay(failing_once, monkeypatch):
+    monkeypatch.setattr(gemini_client, "GEMINI_CLIENT_RETRY_SECONDS", 60.0)
+    assert gemini_client.get_model() is None
+    assert gemini_client.get_model() is None # Within the retry delay: not attempted again
+    assert len(failing_once) == 1
+
+    monkeypatch.setattr(gemini_client, "GEMINI_CLIENT_RETRY_SECONDS", 0.0)
+    model = gemini_client.get_model()
+    assert model is not None and gemini_client.get_model() is model
+    assert len(failing_once) == 2
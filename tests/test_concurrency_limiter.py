@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from app import gemini_client
+from app.gemini_client import BUSY_MESSAGE, STATUS_BUSY, STATUS_OK, ConcurrencyLimiter, GeminiBusyError
+
+BACKSTORY = "A man who only ever cooks pasta."
+
+
+async def _hold(limiter: ConcurrencyLimiter, release: asyncio.Event) -> None:
+    async with limiter.slot():
+        await release.wait()
+
+
+def test_slots_are_reused_after_release():
+    async def scenario():
+        limiter = ConcurrencyLimiter(max_concurrency=2, max_queue_size=0)
+        for _ in range(5):
+            async with limiter.slot():
+                assert limiter.in_flight == 1
+        assert limiter.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_rejects_when_queue_is_full():
+    async def scenario():
+        limiter = ConcurrencyLimiter(max_concurrency=1, max_queue_size=1)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(limiter, release))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(_hold(limiter, release))
+        await asyncio.sleep(0)
+        assert (limiter.in_flight, limiter.waiting) == (1, 1)
+
+        with pytest.raises(GeminiBusyError):
+            async with limiter.slot():
+                pass
+
+        release.set()
+        await asyncio.gather(holder, waiter)
+        assert (limiter.in_flight, limiter.waiting) == (0, 0)
+
+    asyncio.run(scenario())
+
+
+def test_queued_caller_gives_up_after_queue_timeout():
+    async def scenario():
+        limiter = ConcurrencyLimiter(max_concurrency=1, max_queue_size=4, queue_timeout=0.05)
+        release = asyncio.Event()
+        holder = asyncio.create_task(_hold(limiter, release))
+        await asyncio.sleep(0)
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        with pytest.raises(GeminiBusyError, match="Timed out"):
+            async with limiter.slot():
+                pass
+        assert loop.time() - started >= 0.05
+        assert limiter.waiting == 0
+
+        release.set()
+        await holder
+
+    asyncio.run(scenario())
+
+
+def test_async_client_replies_busy_when_queue_is_full(fake_model, monkeypatch):
+    fake_model(latency=0.2)
+    monkeypatch.setattr(gemini_client, "GEMINI_MAX_CONCURRENCY", 1)
+    monkeypatch.setattr(gemini_client, "GEMINI_MAX_QUEUE_SIZE", 0)
+
+    async def scenario():
+        # Different prompts, so the calls aren't coalesced into one
+        return await asyncio.gather(
+            gemini_client.generate_result_async(BACKSTORY, "What should I cook tonight?"),
+            gemini_client.generate_result_async(BACKSTORY, "How do I boil an egg?"),
+        )
+
+    first, second = asyncio.run(scenario())
+    assert first.status == STATUS_OK
+    assert second.status == STATUS_BUSY
+    assert second.text == BUSY_MESSAGE
+
+
+def test_async_client_waits_for_a_slot_within_the_queue(fake_model, monkeypatch):
+    fake_model(latency=0.05)
+    monkeypatch.setattr(gemini_client, "GEMINI_MAX_CONCURRENCY", 1)
+    monkeypatch.setattr(gemini_client, "GEMINI_MAX_QUEUE_SIZE", 4)
+
+    async def scenario():
+        return await asyncio.gather(*(
+            gemini_client.generate_result_async(BACKSTORY, f"Question number {n}") for n in range(3)
+        ))
+
+    assert [result.status for result in asyncio.run(scenario())] == [STATUS_OK] * 3
@@ -0,0 +1,72 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("gradio")
+
+from app import gemini_client, gradio_interface # noqa: E402
+from app.response_cache import MemoryCacheBackend, ResponseCache # noqa: E402
+
+PERSONA = SimpleNamespace(name="Bartek", backstory="A man who learned to cook from cereal boxes.")
+
+
+class _SlowBackend(MemoryCacheBackend):
+    """Stands in for a SQLite cache waiting on another worker's write lock."""
+
+    def get(self, key):
+        time.sleep(0.2)
+        return super().get(key)
+
+    def add_variant(self, key, reply, max_variants, ttl_seconds):
+        time.sleep(0.2)
+        super().add_variant(key, reply, max_variants, ttl_seconds)
+
+
+def test_cache_lookups_do_not_block_the_event_loop(fake_model, monkeypatch):
+    fake_model()
+    cache = ResponseCache(_SlowBackend(1024 * 1024), ttl_seconds=60)
+    monkeypatch.setattr(gradio_interface, "get_response_cache", lambda: cache)
+    monkeypatch.setattr(gradio_interface, "near_duplicate_index", None)
+
+    async def reply() -> str:
+        results = [result async for result in gradio_interface._stream_for_persona(PERSONA, "Bartek", "Boil an egg?")]
+        return results[-1].status
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        first = await reply() # Slow miss, then a slow write
+        second = await reply() # Slow hit
+        ticker.cancel()
+        return first, second, ticks
+
+    first, second, ticks = asyncio.run(main())
+    assert (first, second) == (gradio_interface.STATUS_OK, gradio_interface.STATUS_CACHED)
+    assert ticks >= 20 # The loop kept running through 0.6s of cache I/O
+
+
+class _RateLimited(Exception):
+    code = 429
+
+
+def test_fallback_replies_are_not_served_as_primary_replies(flaky_model, monkeypatch):
+    monkeypatch.setattr(gemini_client, "GEMINI_MODEL_NAME", "primary-model")
+    monkeypatch.setattr(gemini_client, "GEMINI_FALLBACK_MODEL_NAME", "fallback-model")
+    flaky_model(failures=1, error=_RateLimited("Quota exceeded")) # The one key's primary is rate limited
+    cache = ResponseCache(MemoryCacheBackend(1024 * 1024), ttl_seconds=60)
+    monkeypatch.setattr(gradio_interface, "get_response_cache", lambda: cache)
+    monkeypatch.setattr(gradio_interface, "near_duplicate_index", None)
+
+    first = gradio_interface._generate_for_persona(PERSONA, "Bartek", "Boil an egg?")
+    assert (first.status, first.model_name) == (gradio_interface.STATUS_OK, "fallback-model")
+    second = gradio_interface._generate_for_persona(PERSONA, "Bartek", "Boil an egg?")
+    assert second.status == gradio_interface.STATUS_OK # Not the fallback's cached reply
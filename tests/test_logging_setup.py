@@ -0,0 +1,35 @@
+import logging
+import queue
+
+from app.logging_setup import _LOG_RECORDS_DROPPED, _NonBlockingQueueHandler
+
+
+def _record(msg: str, *args, exc_info=None) -> logging.LogRecord:
+    return logging.LogRecord("test", logging.INFO, __file__, 1, msg, args, exc_info)
+
+
+def test_records_are_dropped_and_counted_when_the_queue_is_full():
+    log_queue = queue.Queue(maxsize=2)
+    handler = _NonBlockingQueueHandler(log_queue)
+    dropped = _LOG_RECORDS_DROPPED.value()
+    for n in range(5):
+        handler.handle(_record(f"Record {n}"))
+    assert log_queue.qsize() == 2
+    assert _LOG_RECORDS_DROPPED.value() - dropped == 3
+    assert [log_queue.get_nowait().msg for _ in range(2)] == ["Record 0", "Record 1"]
+
+
+def test_records_are_queued_with_their_message_and_traceback_rendered():
+    log_queue = queue.Queue(maxsize=10)
+    handler = _NonBlockingQueueHandler(log_queue)
+    args = ["a list changed after the call"]
+    try:
+        raise ValueError("boom")
+    except ValueError as e:
+        handler.handle(_record("Failed with %s", args, exc_info=(type(e), e, e.__traceback__)))
+    args.append("too late")
+
+    queued = log_queue.get_nowait()
+    assert queued.msg == "Failed with ['a list changed after the call']"
+    assert queued.args is None and queued.exc_info is None
+    assert "ValueError: boom" in queued.exc_text
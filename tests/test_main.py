@@ -0,0 +1,31 @@
+import asyncio
+import os
+import signal
+import time
+
+import pytest
+
+pytest.importorskip("gradio")
+
+from app import main # noqa: E402
+
+
+def test_sigterm_reports_not_ready_before_the_server_stops():
+    received = []
+    previous = signal.signal(signal.SIGTERM, lambda sig, frame: received.append(time.monotonic()))
+    try:
+        async def scenario():
+            state = main._WorkerState()
+            restore = main._install_shutdown_hook(state, 0.1)
+            signaled = time.monotonic()
+            os.kill(os.getpid(), signal.SIGTERM)
+            await asyncio.sleep(0.02)
+            assert state.draining and not received # Not ready, still serving
+            await asyncio.sleep(0.15)
+            restore()
+            return signaled
+
+        signaled = asyncio.run(scenario())
+        assert len(received) == 1 and received[0] - signaled >= 0.1
+    finally:
+        signal.signal(signal.SIGTERM, previous)
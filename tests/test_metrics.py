@@ -0,0 +1,71 @@
+import pytest
+
+from app.metrics import MetricsRegistry
+
+
+def test_counter_and_gauge_rendering():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests by status.", ("status",))
+    in_flight = registry.gauge("in_flight", "Requests in flight.")
+    requests.inc(status="ok")
+    requests.inc(2, status="ok")
+    requests.inc(0.5, status="error")
+    with in_flight.track_in_progress():
+        in_flight.inc()
+        rendered = registry.render()
+    assert rendered == (
+        "# HELP requests_total Requests by status.\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{status="ok"} 3\n'
+        'requests_total{status="error"} 0.5\n'
+        "# HELP in_flight Requests in flight.\n"
+        "# TYPE in_flight gauge\n"
+        "in_flight 2\n"
+    )
+    assert in_flight.value() == 1 # The block has ended
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    latency = registry.histogram("latency_seconds", "Latency.", ("handler",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, handler="stream")
+    assert registry.render().splitlines()[2:] == [
+        'latency_seconds_bucket{handler="stream",le="0.1"} 2', # Bounds are inclusive
+        'latency_seconds_bucket{handler="stream",le="1"} 3',
+        'latency_seconds_bucket{handler="stream",le="+Inf"} 4',
+        'latency_seconds_sum{handler="stream"} 3.65',
+        'latency_seconds_count{handler="stream"} 4',
+    ]
+    assert latency.count(handler="stream") == 4
+    assert latency.count(handler="other") == 0
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry()
+    counter = registry.counter("requests_total", "Requests.", ("persona",))
+    counter.inc(persona='Bob "the\\builder"\nJr')
+    assert registry.render().splitlines()[-1] == r'requests_total{persona="Bob \"the\\builder\"\nJr"} 1'
+
+
+def test_collectors_run_before_render_and_failures_are_contained():
+    registry = MetricsRegistry()
+    size = registry.gauge("cache_entries", "Entries.")
+    registry.add_collector(lambda: 1 / 0)
+    registry.add_collector(lambda: size.set(42))
+    assert "cache_entries 42" in registry.render()
+
+
+def test_metrics_route():
+    pytest.importorskip("gradio")
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+    from app import main
+    from app.metrics import REQUESTS
+
+    REQUESTS.inc(persona="Route test", status="ok")
+    response = TestClient(main.create_app()).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE chatbot_requests_total counter" in response.text
+    assert 'chatbot_requests_total{persona="Route test",status="ok"}' in response.text
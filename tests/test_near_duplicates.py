@@ -0,0 +1,158 @@
+import hashlib
+import random
+import time
+from array import array
+
+from app.near_duplicates import (
+    MinHasher, NearDuplicateIndex, SimilarityIndex, prompt_ngrams, prompt_tag, prompt_word_bits,
+)
+from app.response_cache import MemoryCacheBackend, ResponseCache
+from benchmarks.near_duplicates import make_prompt, make_vocabulary
+
+BACKSTORY = "A man who learned to cook from cereal boxes."
+
+
+def _key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _distinct_prompts(count: int) -> list[str]:
+    rng = random.Random(1)
+    vocabulary = make_vocabulary(1000, rng)
+    return list(dict.fromkeys(make_prompt(vocabulary, rng) for _ in range(count * 2)))[:count]
+
+
+def _index(threshold: float = 0.8, max_entries: int = 1000) -> NearDuplicateIndex:
+    return NearDuplicateIndex(threshold, ngram=3, num_perm=64, bands=8, rows=4, min_ngrams=8, max_entries=max_entries)
+
+
+def test_ngrams_ignore_case_punctuation_and_word_order():
+    assert prompt_ngrams("Salmon recipe, please!", 3) == prompt_ngrams("please recipe SALMON", 3)
+
+
+def test_tags_differ_on_numbers_and_negations():
+    assert prompt_tag("a recipe with lemon") == prompt_tag("A recipe WITH lemon!")
+    assert prompt_tag("a recipe with lemon") != prompt_tag("a recipe without lemon")
+    assert prompt_tag("what is 12 times 7") != prompt_tag("what is 13 times 7")
+
+
+def test_word_bits_ignore_filler_words():
+    assert prompt_word_bits("Please give me a quick recipe for salmon") == prompt_word_bits("give recipe salmon")
+    assert prompt_word_bits("give recipe salmon") != prompt_word_bits("give recipe chicken")
+
+
+def test_identical_prompts_have_identical_signatures():
+    hasher = MinHasher(num_perm=64, ngram=3, min_ngrams=8)
+    assert hasher.signature("Give me a simple recipe for salmon") == hasher.signature("give me a simple recipe for SALMON?")
+    assert hasher.signature("hi") is None # Too short to compare
+
+
+def test_rewordings_hit_and_unrelated_prompts_miss():
+    index = _index()
+    prompt = "Give me a simple recipe for baked salmon"
+    index.add("Bartek", BACKSTORY, prompt, _key(prompt))
+    cached = {_key(prompt): "Even you can manage this one."}
+
+    assert index.find_reply("Bartek", BACKSTORY, "give me a simple recipe for baked salmon!!", cached.get, cached.__contains__) == (
+        "Even you can manage this one.", 1.0)
+    reply, similarity = index.find_reply("Bartek", BACKSTORY, "Please give me a simple baked salmon recipe", cached.get, cached.__contains__)
+    assert reply == "Even you can manage this one." and 0.8 <= similarity < 1.0
+    assert index.find_reply("Bartek", BACKSTORY, "How do I change a flat tyre on my bike", cached.get, cached.__contains__) is None
+
+
+def test_prompts_differing_in_numbers_or_negation_miss():
+    index = _index(threshold=0.5)
+    prompt = "a salmon recipe for 2 people with lemon"
+    index.add("Bartek", BACKSTORY, prompt, _key(prompt))
+    cached = {_key(prompt): "reply"}
+    assert index.find_reply("Bartek", BACKSTORY, "a salmon recipe for 4 people with lemon", cached.get, cached.__contains__) is None
+    assert index.find_reply("Bartek", BACKSTORY, "a salmon recipe for 2 people without lemon", cached.get, cached.__contains__) is None
+
+
+def test_matches_are_per_persona_and_backstory():
+    index = _index()
+    prompt = "Give me a simple recipe for baked salmon"
+    index.add("Bartek", BACKSTORY, prompt, _key(prompt))
+    cached = {_key(prompt): "reply"}
+    assert index.find_reply("Someone else", BACKSTORY, prompt, cached.get, cached.__contains__) is None
+    assert index.find_reply("Bartek", "An edited backstory.", prompt, cached.get, cached.__contains__) is None
+
+
+def test_prompts_asking_about_another_word_miss():
+    index = _index(threshold=0.5)
+    prompt = "Give me a simple recipe for baked salmon fillets"
+    index.add("Bartek", BACKSTORY, prompt, _key(prompt))
+    cached = {_key(prompt): "reply"}
+    assert index.find_reply("Bartek", BACKSTORY, "Give me a simple recipe for baked salmon steaks", cached.get,
+                            cached.__contains__) is None
+    assert index.find_reply("Bartek", BACKSTORY, "recipe for baked salmon fillets", cached.get,
+                            cached.__contains__) is not None # Dropping words is fine
+
+
+def test_entries_whose_reply_is_gone_are_dropped():
+    index = _index()
+    prompt = "Give me a simple recipe for baked salmon"
+    index.add("Bartek", BACKSTORY, prompt, _key(prompt))
+    assert index.find_reply("Bartek", BACKSTORY, prompt, lambda key: None, lambda key: False) is None
+    assert index.stats()["entries"] == 0
+
+
+def test_entries_still_collecting_variants_are_kept():
+    cache = ResponseCache(MemoryCacheBackend(1024 * 1024), ttl_seconds=60, variants=2)
+    index = _index()
+    prompt = "Give me a simple recipe for baked salmon"
+    cache.put(_key(prompt), "first variant")
+    index.add("Bartek", BACKSTORY, prompt, _key(prompt))
+
+    lookup = lambda: index.find_reply("Bartek", BACKSTORY, prompt, cache.get, cache.contains) # noqa: E731
+    assert lookup() is None # The key misses until it has both variants
+    assert index.stats()["entries"] == 1
+    cache.put(_key(prompt), "second variant")
+    assert lookup()[0] in ("first variant", "second variant")
+
+
+def test_similarity_index_keeps_the_newest_entries_when_full():
+    index = SimilarityIndex(MinHasher(64, 3, 8), bands=8, rows=4, max_entries=4)
+    prompts = [f"question number {word} about cooking dinner" for word in ("one", "two", "three", "four", "five")]
+    for prompt in prompts:
+        index.add(prompt, _key(prompt))
+    assert len(index) == 3 # The oldest half (2) was dropped to make room for the fifth
+    assert index.find(prompts[0], 0.99) == []
+    assert index.find(prompts[-1], 0.99)[0][2] == _key(prompts[-1])
+
+
+def test_entries_are_found_before_and_after_their_band_buffer_is_merged():
+    index = SimilarityIndex(MinHasher(64, 3, 8), bands=8, rows=4, max_entries=1000)
+    prompts = _distinct_prompts(300)
+    for prompt in prompts:
+        index.add(prompt, _key(prompt))
+    pending = [len(band.pending_hashes) for band in index._bands]
+    assert 0 < max(pending) < len(prompts) # Some entries merged, some still buffered
+    for prompt in prompts:
+        assert _key(prompt) in [key for _, _, key in index.find(prompt, 0.99)]
+
+
+def test_eviction_keeps_live_entries_under_new_ids():
+    index = SimilarityIndex(MinHasher(64, 3, 8), bands=8, rows=4, max_entries=200)
+    prompts = _distinct_prompts(201)
+    for prompt in prompts[:200]:
+        index.add(prompt, _key(prompt))
+    [(_, entry_id, key)] = index.find(prompts[150], 0.99)
+    index.discard(entry_id, key)
+    index.add(prompts[200], _key(prompts[200])) # Full: drops the oldest 100
+    assert len(index) == 100
+    assert index.find(prompts[150], 0.99) == []
+    for prompt in prompts[100:150] + prompts[151:]:
+        [(_, entry_id, key)] = index.find(prompt, 0.99)
+        assert key == _key(prompt) and index._key_at(entry_id) == key
+
+
+def test_eviction_takes_linear_time():
+    index = SimilarityIndex(MinHasher(64, 3, 8), bands=8, rows=4, max_entries=50_000)
+    rng = random.Random(1)
+    for entry_id in range(50_000):
+        index._append(array("I", rng.randbytes(256)), entry_id.to_bytes(32, "big"), 0, 0)
+    started = time.perf_counter()
+    index._drop_oldest_half() # Runs under the index lock, blocking every lookup
+    assert time.perf_counter() - started < 0.5 # ~0.15s; re-adding entry by entry took ~1s
+    assert len(index) == 25_000
@@ -0,0 +1,92 @@
+import os
+from types import SimpleNamespace
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from app.persona_images import PersonaImageCache # noqa: E402
+
+
+@pytest.fixture
+def images(tmp_path):
+    """Returns (cache, source dir); the source dir holds a 300x600 PNG, bartek.png."""
+    source_dir = tmp_path / "images"
+    source_dir.mkdir()
+    Image.new("RGB", (300, 600), "red").save(source_dir / "bartek.png")
+    return PersonaImageCache(str(source_dir), str(tmp_path / "thumbnails"), height=200), source_dir
+
+
+def _snapshot(*image_paths):
+    return SimpleNamespace(by_name={f"persona {n}": SimpleNamespace(image=path) for n, path in enumerate(image_paths)})
+
+
+def test_thumbnail_is_resized_and_named_by_content(images):
+    cache, _ = images
+    thumbnail = cache.get("bartek.png")
+    assert thumbnail.filename.startswith("bartek-") and thumbnail.filename.endswith(".png")
+    assert thumbnail.url("/persona-images") == f"/persona-images/{thumbnail.filename}"
+    with Image.open(thumbnail.path) as image:
+        assert image.size == (100, 200)
+
+
+def test_thumbnail_is_generated_once(images, monkeypatch):
+    cache, _ = images
+    writes = []
+    write_thumbnail = cache._write_thumbnail
+    monkeypatch.setattr(cache, "_write_thumbnail", lambda *args: writes.append(args) or write_thumbnail(*args))
+
+    first = cache.get("bartek.png")
+    assert cache.get("bartek.png") is first # Answered from memory
+    cache.warm(_snapshot("bartek.png")) # Source unchanged: nothing to do
+    assert len(writes) == 1
+
+    # Another process (or restart) finds the file already written
+    fresh = PersonaImageCache(cache.source_dir, cache.thumbnail_dir, cache.height)
+    monkeypatch.setattr(fresh, "_write_thumbnail", lambda *args: writes.append(args))
+    assert fresh.get("bartek.png").filename == first.filename
+    assert len(writes) == 1
+
+
+def test_changed_image_gets_a_new_thumbnail_on_warm(images):
+    cache, source_dir = images
+    first = cache.get("bartek.png")
+    Image.new("RGB", (400, 400), "blue").save(source_dir / "bartek.png")
+    os.utime(source_dir / "bartek.png", ns=(0, os.stat(source_dir / "bartek.png").st_mtime_ns + 10**9))
+    cache.warm(_snapshot("bartek.png"))
+
+    second = cache.get("bartek.png")
+    assert second.filename != first.filename
+    with Image.open(second.path) as image:
+        assert image.size == (200, 200)
+
+
+def test_missing_and_outside_images_have_no_thumbnail(images):
+    cache, _ = images
+    assert cache.get(None) is None
+    assert cache.get("nobody.png") is None
+    assert cache.get("../../etc/passwd") is None
+
+
+def test_warm_forgets_images_no_persona_uses(images):
+    cache, _ = images
+    cache.get("bartek.png")
+    cache.warm(_snapshot())
+    assert cache._entries == {}
+
+
+def test_thumbnails_are_served_with_immutable_caching(tmp_path, monkeypatch):
+    pytest.importorskip("gradio")
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+    from app import main
+
+    monkeypatch.setattr(main, "PERSONA_THUMBNAIL_DIR", str(tmp_path))
+    Image.new("RGB", (10, 20), "green").save(tmp_path / "bartek-0123456789abcdef.png")
+
+    client = TestClient(main.create_app()) # Not entered: the worker startup isn't needed here
+    response = client.get(f"{main.PERSONA_IMAGE_URL_PREFIX}/bartek-0123456789abcdef.png")
+    assert response.status_code == 200
+    assert response.content == (tmp_path / "bartek-0123456789abcdef.png").read_bytes()
+    assert "immutable" in response.headers["cache-control"]
+    assert client.get(f"{main.PERSONA_IMAGE_URL_PREFIX}/nobody.png").status_code == 404
@@ -0,0 +1,107 @@
+import json
+import os
+import time
+
+import pytest
+
+from app.persona_store import PersonaStore
+
+
+def _write(path, personas: dict) -> None:
+    path.write_text(json.dumps(personas), encoding="utf-8")
+
+
+def _bump_mtime(path) -> None:
+    # Make the change visible even on filesystems with coarse timestamps
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+
+@pytest.fixture
+def backstories(tmp_path):
+    path = tmp_path / "backstories.json"
+    _write(path, {"Bartek": {"backstory": "Can't cook.", "image": "Bartek.png"}})
+    return path
+
+
+def test_loads_valid_personas(backstories):
+    _write(backstories, {
+        "Bartek": {"backstory": "Can't cook.", "image": "Bartek.png"},
+        "Broken": {"image": "x.png"},
+        "Anna": {"backstory": "Can't park."},
+    })
+    snapshot = PersonaStore(str(backstories), check_interval=0).snapshot
+    assert snapshot.names == ("Bartek", "Anna")
+    assert snapshot.get("Bartek").image == "Bartek.png"
+    assert snapshot.get("Broken") is None
+    assert snapshot.default_name == "Bartek"
+
+
+def test_reloads_when_the_file_changes(backstories):
+    store = PersonaStore(str(backstories), check_interval=0)
+    reloads = []
+    store.add_reload_listener(reloads.append)
+    assert store.snapshot.names == ("Bartek",)
+
+    _write(backstories, {"Bartek": {"backstory": "Can't cook."}, "Anna": {"backstory": "Can't park."}})
+    _bump_mtime(backstories)
+    assert store.maybe_reload()
+    assert store.snapshot.names == ("Bartek", "Anna")
+    assert [snapshot.names for snapshot in reloads] == [("Bartek",), ("Bartek", "Anna")]
+
+
+def test_unchanged_file_is_not_reparsed(backstories):
+    store = PersonaStore(str(backstories), check_interval=0)
+    first = store.snapshot
+    _bump_mtime(backstories) # Touched, same content
+    assert not store.maybe_reload()
+    assert store.snapshot is first
+
+
+def test_checks_at_most_once_per_interval(backstories):
+    store = PersonaStore(str(backstories), check_interval=3600)
+    store.snapshot
+    _write(backstories, {"Anna": {"backstory": "Can't park."}})
+    _bump_mtime(backstories)
+    assert not store.maybe_reload()
+    assert store.maybe_reload(force=True)
+    assert store.snapshot.names == ("Anna",)
+
+
+def test_requests_only_read_the_current_snapshot(backstories):
+    store = PersonaStore(str(backstories), check_interval=0)
+    first = store.snapshot
+    _write(backstories, {"Anna": {"backstory": "Can't park."}})
+    _bump_mtime(backstories)
+    assert store.snapshot is first
+    assert store.get("Anna") is None
+
+
+def test_watcher_reloads_in_the_background(backstories):
+    store = PersonaStore(str(backstories), check_interval=0.01)
+    store.snapshot
+    store.start_watcher()
+    try:
+        _write(backstories, {"Anna": {"backstory": "Can't park."}})
+        _bump_mtime(backstories)
+        deadline = time.monotonic() + 5
+        while store.get("Anna") is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert store.snapshot.names == ("Anna",)
+    finally:
+        store.stop_watcher()
+
+
+def test_keeps_the_last_good_personas_after_a_bad_edit(backstories):
+    store = PersonaStore(str(backstories), check_interval=0)
+    store.snapshot
+    backstories.write_text("{not json", encoding="utf-8")
+    _bump_mtime(backstories)
+    assert not store.maybe_reload()
+    assert store.snapshot.names == ("Bartek",)
+
+
+def test_missing_file_gives_an_error_snapshot(tmp_path):
+    snapshot = PersonaStore(str(tmp_path / "missing.json")).snapshot
+    assert snapshot.names == ()
+    assert snapshot.dropdown_choices() == ["Error: backstories.json not found"]
@@ -0,0 +1,214 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app import gemini_client
+from app.gemini_client import STATUS_ERROR, STATUS_OK, STATUS_UNAVAILABLE
+from app.resilience import CallTimeoutError, CircuitBreaker, CircuitOpenError, RetryPolicy, is_retryable
+from benchmarks.fake_gemini import ServiceUnavailable
+
+BACKSTORY = "A woman who has never once read the instructions."
+
+
+class BadRequest(Exception):
+    code = 400
+
+
+# --- RetryPolicy ---
+def test_retry_delays_are_jittered_and_capped():
+    policy = RetryPolicy(max_retries=5, base_delay=0.5, max_delay=2.0)
+    started = time.monotonic()
+    for retry_number, ceiling in ((1, 0.5), (2, 1.0), (3, 2.0), (5, 2.0)):
+        delay = policy.next_delay(retry_number, started)
+        assert 0 <= delay <= ceiling
+
+
+def test_no_retry_after_max_retries():
+    policy = RetryPolicy(max_retries=2, base_delay=0.1, max_delay=1.0)
+    assert policy.next_delay(2, time.monotonic()) is not None
+    assert policy.next_delay(3, time.monotonic()) is None
+
+
+def test_no_retry_past_the_total_deadline():
+    policy = RetryPolicy(max_retries=10, base_delay=0.1, max_delay=0.1, total_deadline=1.0)
+    assert policy.next_delay(1, time.monotonic()) is not None
+    assert policy.next_delay(1, time.monotonic() - 1.0) is None
+
+
+def test_retryable_errors():
+    assert is_retryable(ServiceUnavailable())
+    assert is_retryable(CallTimeoutError())
+    assert is_retryable(ConnectionError())
+    assert not is_retryable(BadRequest())
+    assert not is_retryable(CircuitOpenError())
+
+
+# --- Retries around Gemini calls ---
+def test_transient_errors_are_retried(flaky_model):
+    model = flaky_model(failures=2, error=ServiceUnavailable("unavailable"))
+    result = gemini_client.generate_result(BACKSTORY, "How do I iron a shirt?")
+    assert result.status == STATUS_OK
+    assert model.calls == 3
+
+
+def test_gives_up_after_max_retries(flaky_model):
+    model = flaky_model(failures=100, error=ServiceUnavailable("unavailable"))
+    result = gemini_client.generate_result(BACKSTORY, "How do I iron a shirt?")
+    assert result.status == STATUS_ERROR
+    assert model.calls == gemini_client.retry_policy.max_retries + 1
+
+
+def test_non_transient_errors_are_not_retried(flaky_model):
+    model = flaky_model(failures=100, error=BadRequest("bad request"))
+    result = gemini_client.generate_result(BACKSTORY, "How do I iron a shirt?")
+    assert result.status == STATUS_ERROR
+    assert model.calls == 1
+
+
+def test_async_call_past_its_deadline_is_retried(fake_model, monkeypatch):
+    fake_model(latency=0.5)
+    monkeypatch.setattr(gemini_client, "GEMINI_REQUEST_TIMEOUT_SECONDS", 0.02)
+    timeouts_before = gemini_client.UPSTREAM_LATENCY.count(outcome="timeout")
+
+    started = time.monotonic()
+    result = asyncio.run(gemini_client.generate_result_async(BACKSTORY, "How do I fold a fitted sheet?"))
+    assert result.status == STATUS_ERROR
+    assert time.monotonic() - started < 0.5 # Every attempt was cut off at its deadline
+    attempts = gemini_client.retry_policy.max_retries + 1
+    assert gemini_client.UPSTREAM_LATENCY.count(outcome="timeout") - timeouts_before == attempts
+
+
+# --- CircuitBreaker ---
+def _open_breaker(breaker: CircuitBreaker) -> None:
+    for _ in range(breaker.min_calls):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_breaker_opens_on_failure_ratio():
+    breaker = CircuitBreaker(window_seconds=60, min_calls=4, failure_ratio=0.5, cooldown=60)
+    breaker.record_success()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED # 1 of 3 failed, and below min_calls
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN # 2 of 4
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.stats()["rejected_calls"] == 1
+
+
+def test_breaker_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker(window_seconds=60, min_calls=2, failure_ratio=0.5, cooldown=0.05)
+    _open_breaker(breaker)
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_call() # The probe
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_breaker_reopens_when_the_probe_fails():
+    breaker = CircuitBreaker(window_seconds=60, min_calls=2, failure_ratio=0.5, cooldown=0.05)
+    _open_breaker(breaker)
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.times_opened == 2
+
+
+def test_breaker_replaces_a_probe_that_never_reports_back():
+    breaker = CircuitBreaker(window_seconds=60, min_calls=2, failure_ratio=0.5, cooldown=0.05)
+    _open_breaker(breaker)
+    time.sleep(0.06)
+    breaker.before_call() # Probe abandoned by its caller
+    time.sleep(0.06)
+    breaker.before_call()
+
+
+def test_open_breaker_stops_upstream_calls(flaky_model, monkeypatch):
+    model = flaky_model(failures=100, error=ServiceUnavailable("unavailable"))
+    monkeypatch.setattr(gemini_client, "retry_policy", RetryPolicy(0, 0.001, 0.001))
+    monkeypatch.setattr(gemini_client, "circuit_breaker", CircuitBreaker(60, 3, 0.5, 60))
+
+    statuses = [gemini_client.generate_result(BACKSTORY, f"Question {n}").status for n in range(5)]
+    assert statuses == [STATUS_ERROR] * 3 + [STATUS_UNAVAILABLE] * 2
+    assert model.calls == 3
+
+
+# --- Hedged requests ---
+def test_hedge_returns_the_faster_duplicate(monkeypatch):
+    monkeypatch.setattr(gemini_client, "GEMINI_HEDGE_DELAY_SECONDS", 0.02)
+    calls = []
+    lock = threading.Lock()
+
+    def call():
+        with lock:
+            calls.append(None)
+            attempt = len(calls)
+        time.sleep(0.5 if attempt == 1 else 0.0)
+        return attempt
+
+    started = time.monotonic()
+    assert gemini_client._hedged_call(call) == 2
+    assert time.monotonic() - started < 0.4
+
+
+def test_no_hedge_when_the_first_call_is_fast(monkeypatch):
+    monkeypatch.setattr(gemini_client, "GEMINI_HEDGE_DELAY_SECONDS", 0.5)
+    calls = []
+    assert gemini_client._hedged_call(lambda: calls.append(None) or "reply") == "reply"
+    assert len(calls) == 1
+
+
+def test_async_hedge_cancels_the_slower_request(monkeypatch):
+    monkeypatch.setattr(gemini_client, "GEMINI_HEDGE_DELAY_SECONDS", 0.02)
+    cancelled = []
+
+    async def scenario():
+        attempts = 0
+
+        async def call():
+            nonlocal attempts
+            attempts += 1
+            attempt = attempts
+            try:
+                await asyncio.sleep(1.0 if attempt == 1 else 0.0)
+            except asyncio.CancelledError:
+                cancelled.append(attempt)
+                raise
+            return attempt
+
+        result = await gemini_client._hedged_call_async(call)
+        await asyncio.sleep(0) # Let the cancellation land
+        return result
+
+    assert asyncio.run(scenario()) == 2
+    assert cancelled == [1]
+
+
+def test_hedge_raises_when_both_requests_fail(monkeypatch):
+    monkeypatch.setattr(gemini_client, "GEMINI_HEDGE_DELAY_SECONDS", 0.01)
+
+    def call():
+        time.sleep(0.02)
+        raise ServiceUnavailable("unavailable")
+
+    with pytest.raises(ServiceUnavailable):
+        gemini_client._hedged_call(call)
+
+
+def test_hedged_client_call(flaky_model, monkeypatch):
+    model = flaky_model(failures=0, error=None, latency=0.05)
+    monkeypatch.setattr(gemini_client, "hedge_enabled", True)
+    monkeypatch.setattr(gemini_client, "GEMINI_HEDGE_DELAY_SECONDS", 0.01)
+    result = gemini_client.generate_result(BACKSTORY, "What goes with rice?")
+    assert result.status == STATUS_OK
+    assert model.calls == 2
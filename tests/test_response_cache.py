@@ -0,0 +1,175 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+import pytest
+
+from app.response_cache import (
+    MemoryCacheBackend, ResponseCache, SQLiteCacheBackend, make_cache_key, normalize_prompt,
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _key(n: int) -> str:
+    return make_cache_key("Bartek", "backstory", "model", f"prompt {n}")
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_backend(request, tmp_path):
+    """Returns make(max_bytes) for each backend type; SQLite backends of one test share a file."""
+
+    def make(max_bytes: int = 1024 * 1024):
+        if request.param == "memory":
+            return MemoryCacheBackend(max_bytes)
+        return SQLiteCacheBackend(str(tmp_path / "cache.sqlite3"), max_bytes)
+
+    return make
+
+
+def _enforce_cap(backend) -> None:
+    # SQLite checks the cap every SIZE_CHECK_EVERY_WRITES writes; memory on every write
+    if isinstance(backend, SQLiteCacheBackend):
+        backend.enforce_size_cap()
+
+
+def test_keys_ignore_case_and_whitespace():
+    assert normalize_prompt("  Give me   a Recipe ") == "give me a recipe"
+    assert make_cache_key("A", "b", "m", "Give me a recipe") == make_cache_key("A", "b", "m", "give  me a RECIPE")
+    assert make_cache_key("A", "b", "m", "x") != make_cache_key("A", "edited backstory", "m", "x")
+    assert make_cache_key("A", "b", "m", "x") != make_cache_key("A", "b", "other-model", "x")
+
+
+def test_get_returns_stored_reply(make_backend):
+    cache = ResponseCache(make_backend(), ttl_seconds=60)
+    assert cache.get(_key(1)) is None
+    cache.put(_key(1), "Just use the microwave.")
+    assert cache.get(_key(1)) == "Just use the microwave."
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_lookups_on_behalf_of_another_are_not_counted(make_backend):
+    cache = ResponseCache(make_backend(), ttl_seconds=60)
+    cache.put(_key(1), "reply")
+    cache.get(_key(1), record_stats=False)
+    cache.get(_key(2), record_stats=False)
+    assert (cache.hits, cache.misses) == (0, 0)
+
+
+def test_entries_expire_after_ttl(make_backend):
+    backend = make_backend()
+    cache = ResponseCache(backend, ttl_seconds=0.05)
+    cache.put(_key(1), "reply")
+    cache.put(_key(2), "never read again")
+    assert cache.get(_key(1)) == "reply"
+    time.sleep(0.06)
+    assert cache.get(_key(1)) is None
+    backend.sweep_expired()
+    stats = backend.stats()
+    assert stats["entries"] == 0
+    assert stats["expirations"] == 2
+
+
+def test_ttl_counts_from_the_first_variant(make_backend):
+    cache = ResponseCache(make_backend(), ttl_seconds=0.1, variants=2)
+    cache.put(_key(1), "first")
+    time.sleep(0.06)
+    cache.put(_key(1), "second")
+    assert cache.get(_key(1)) in ("first", "second")
+    time.sleep(0.06)
+    assert cache.get(_key(1)) is None
+
+
+def test_least_recently_used_entry_is_evicted(make_backend):
+    reply = "x" * 100
+    entry_size = len(_key(0)) + len(reply) + 4 # SQLite stores the variants as a JSON list
+    backend = make_backend(max_bytes=entry_size * 3)
+    cache = ResponseCache(backend, ttl_seconds=60)
+    for n in range(3):
+        cache.put(_key(n), reply)
+        time.sleep(0.01) # Distinct last-access times
+    if isinstance(backend, SQLiteCacheBackend):
+        backend.TOUCH_INTERVAL_SECONDS = 0 # Record every read
+    assert cache.get(_key(0)) == reply # Now the most recently used
+    time.sleep(0.01)
+
+    cache.put(_key(3), reply)
+    _enforce_cap(backend)
+    assert cache.get(_key(1)) is None
+    assert cache.get(_key(0)) == reply
+    assert cache.get(_key(3)) == reply
+    assert backend.stats()["evictions"] == 1
+
+
+def test_total_size_stays_under_the_byte_cap(make_backend):
+    backend = make_backend(max_bytes=2000)
+    cache = ResponseCache(backend, ttl_seconds=60)
+    for n in range(50):
+        cache.put(_key(n), f"reply {n} " * 10)
+    _enforce_cap(backend)
+    stats = backend.stats()
+    assert 0 < stats["bytes"] <= 2000
+    assert stats["entries"] < 50
+
+
+def test_reply_larger_than_the_cap_is_not_stored(make_backend):
+    cache = ResponseCache(make_backend(max_bytes=100), ttl_seconds=60)
+    cache.put(_key(1), "x" * 200)
+    assert cache.get(_key(1)) is None
+
+
+def test_variants_miss_until_all_are_stored(make_backend):
+    cache = ResponseCache(make_backend(), ttl_seconds=60, variants=3)
+    cache.put(_key(1), "one")
+    cache.put(_key(1), "one") # Duplicates don't count
+    cache.put(_key(1), "two")
+    assert cache.get(_key(1)) is None
+    cache.put(_key(1), "three")
+    cache.put(_key(1), "four") # Key is full
+    assert {cache.get(_key(1)) for _ in range(50)} == {"one", "two", "three"}
+
+
+def test_clear(make_backend):
+    cache = ResponseCache(make_backend(), ttl_seconds=60)
+    cache.put(_key(1), "reply")
+    cache.clear()
+    assert cache.get(_key(1)) is None
+
+
+def test_sqlite_cache_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "shared.sqlite3")
+    writer = ResponseCache(SQLiteCacheBackend(path, 1024 * 1024), ttl_seconds=60)
+    reader = ResponseCache(SQLiteCacheBackend(path, 1024 * 1024), ttl_seconds=60)
+    writer.put(_key(1), "written by another worker")
+    assert reader.get(_key(1)) == "written by another worker"
+
+
+def test_sqlite_reads_do_not_wait_for_a_writer(tmp_path, monkeypatch):
+    path = str(tmp_path / "busy.sqlite3")
+    cache = ResponseCache(SQLiteCacheBackend(path, 1024 * 1024, busy_timeout=2.0), ttl_seconds=60)
+    cache.put(_key(1), "reply")
+    monkeypatch.setattr(SQLiteCacheBackend, "TOUCH_INTERVAL_SECONDS", 0.0)
+
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE") # Another worker holds the write lock
+    try:
+        started = time.monotonic()
+        assert cache.get(_key(1)) == "reply" # The last-access update is skipped
+        assert time.monotonic() - started < 1.0
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+
+
+def test_shared_cache_is_created_on_first_use(tmp_path):
+    path = tmp_path / "lazy.sqlite3"
+    script = (
+        "import os, app.response_cache as m, app.near_duplicates\n"
+        "assert not os.path.exists(os.environ['RESPONSE_CACHE_PATH'])\n"
+        "assert m.get_response_cache() is m.get_response_cache()\n"
+        "assert os.path.exists(os.environ['RESPONSE_CACHE_PATH'])\n"
+    )
+    env = {**os.environ, "RESPONSE_CACHE_BACKEND": "sqlite", "RESPONSE_CACHE_PATH": str(path)}
+    subprocess.run([sys.executable, "-c", script], env=env, cwd=ROOT, check=True)
@@ -0,0 +1,199 @@
+import asyncio
+
+import pytest
+
+from app import gemini_client
+from app.gemini_client import STATUS_OK
+from app.resilience import CircuitBreaker
+from app.routing import ApiKeySpec, ModelRouter, ModelSpec, is_rate_limited, parse_routing_config
+from benchmarks.fake_gemini import FakeGeminiModel, ServiceUnavailable
+
+PRIMARY = "primary-model"
+FALLBACK = "fallback-model"
+
+
+class ResourceExhausted(Exception):
+    """Same name and code as google.api_core's 429 error."""
+
+    code = 429
+
+
+def _router(keys: int = 2, fallback: bool = True, cooldown: float = 60.0, requests_per_minute: float = 0.0,
+            failure_threshold: int = 3) -> ModelRouter:
+    models = [ModelSpec(PRIMARY)] + ([ModelSpec(FALLBACK, fallback=True)] if fallback else [])
+    key_specs = [ApiKeySpec(f"key-{n}", f"secret-{n}", requests_per_minute) for n in range(keys)]
+    return ModelRouter(key_specs, models, cooldown, failure_threshold, slow_seconds=10.0, slow_probe_seconds=5.0)
+
+
+def test_rate_limit_errors():
+    assert is_rate_limited(ResourceExhausted())
+    assert not is_rate_limited(ServiceUnavailable())
+
+
+def test_least_loaded_key_is_picked():
+    router = _router(keys=2)
+    first = router.acquire()
+    second = router.acquire()
+    assert first.key_name != second.key_name
+    assert first.model_name == second.model_name == PRIMARY
+
+
+def test_rate_limited_key_cools_down():
+    router = _router(keys=2)
+    route = router.acquire()
+    router.release(route, 0.1, ResourceExhausted("quota"))
+    for _ in range(5):
+        other = router.acquire()
+        assert other.key_name != route.key_name
+        router.release(other, 0.1)
+    assert router.stats()[0]["rate_limited"] + router.stats()[1]["rate_limited"] == 1
+
+
+def test_key_comes_back_after_the_cooldown(monkeypatch):
+    router = _router(keys=1, fallback=False, cooldown=30.0)
+    route = router.acquire()
+    router.release(route, 0.1, ResourceExhausted("quota"))
+    assert router.acquire() is None
+    monkeypatch.setattr(route, "cooldown_until", 0.0)
+    assert router.acquire() is route
+
+
+def test_repeated_failures_cool_a_key_down():
+    router = _router(keys=1, fallback=False, failure_threshold=2)
+    route = router.acquire()
+    router.release(route, 0.1, ServiceUnavailable())
+    assert router.acquire() is route
+    router.release(route, 0.1, ServiceUnavailable()) # Two in a row
+    assert router.acquire() is None
+
+
+def test_fallback_model_when_every_primary_key_is_cooling_down():
+    router = _router(keys=2)
+    for _ in range(2):
+        route = router.acquire()
+        router.release(route, 0.1, ResourceExhausted("quota"))
+    route = router.acquire()
+    assert route.model_name == FALLBACK
+    assert router.fallbacks_used == 1
+
+
+def test_fallback_model_when_the_primary_budget_is_used_up():
+    router = _router(keys=1, requests_per_minute=2)
+    assert [router.acquire().model_name for _ in range(3)] == [PRIMARY, PRIMARY, FALLBACK]
+
+
+def test_no_route_without_fallback():
+    router = _router(keys=1, fallback=False)
+    router.release(router.acquire(), 0.1, ResourceExhausted("quota"))
+    assert router.acquire() is None
+
+
+def test_cancelled_calls_say_nothing_about_the_key():
+    router = _router(keys=1, fallback=False)
+    route = router.acquire()
+    router.release(route, 0.1, KeyboardInterrupt())
+    assert router.acquire() is route
+
+
+def test_parse_routing_config():
+    keys, models = parse_routing_config(
+        {"gemini_api_keys": [{"name": "team-a", "key": "a", "weight": 2}, "b", {"name": "no-key"}]},
+        PRIMARY, FALLBACK, 60,
+    )
+    assert [(key.name, key.weight, key.requests_per_minute) for key in keys] == [("team-a", 2.0, 60.0), ("key-2", 1.0, 60.0)]
+    assert [(model.name, model.fallback) for model in models] == [(PRIMARY, False), (FALLBACK, True)]
+    _, models = parse_routing_config({"gemini_api_key": "a"}, PRIMARY, "", 0)
+    assert [model.name for model in models] == [PRIMARY]
+
+
+# --- Through the client ---
+class _RateLimitedModel(FakeGeminiModel):
+    def generate_content(self, contents, stream: bool = False, request_options=None):
+        raise ResourceExhausted("Quota exceeded")
+
+    async def generate_content_async(self, contents, stream: bool = False, request_options=None):
+        raise ResourceExhausted("Quota exceeded")
+
+
+@pytest.fixture
+def rate_limited_primary(fake_model, monkeypatch):
+    """The primary model always answers 429; the fallback model works."""
+    options = fake_model()
+    monkeypatch.setattr(gemini_client, "GEMINI_MODEL_NAME", PRIMARY)
+    monkeypatch.setattr(gemini_client, "GEMINI_FALLBACK_MODEL_NAME", FALLBACK)
+    models_by_name = {}
+
+    def factory(system_instruction, model_name=None):
+        model_class = _RateLimitedModel if model_name == PRIMARY else FakeGeminiModel
+        model = model_class(options, system_instruction)
+        models_by_name.setdefault(model_name, []).append(model)
+        return model
+
+    gemini_client.set_model_factory(factory)
+    return models_by_name
+
+
+def test_client_falls_back_after_a_rate_limit(rate_limited_primary):
+    result = gemini_client.generate_result("A man who burns toast.", "How long do I boil pasta?")
+    assert result.status == STATUS_OK
+    stats = {route["model"]: route for route in gemini_client.get_router().stats()}
+    assert stats[PRIMARY]["rate_limited"] == 1
+    assert stats[PRIMARY]["cooling_down"]
+    assert stats[FALLBACK]["requests"] == 1
+
+
+def test_client_reports_the_model_that_replied(rate_limited_primary):
+    result = gemini_client.generate_result("A man who burns toast.", "How long do I boil pasta?")
+    assert result.model_name == FALLBACK
+    streamed = list(gemini_client.stream_results("A man who burns toast.", "How long do I boil rice?"))
+    assert streamed[-1].model_name == FALLBACK
+
+
+def test_no_fallback_model_without_a_name():
+    _, models = parse_routing_config({}, PRIMARY, "", 0.0)
+    assert [(model.name, model.fallback) for model in models] == [(PRIMARY, False)]
+
+
+def test_stream_holds_its_route_until_it_ends(fake_model):
+    fake_model(chunks=4)
+    in_flight = []
+    for result in gemini_client.stream_results("A man who burns toast.", "How do I make soup?"):
+        in_flight.append(sum(route["in_flight"] for route in gemini_client.get_router().stats()))
+    assert result.status == STATUS_OK
+    assert in_flight[:-1] == [1] * (len(in_flight) - 1) # Still reserved while chunks arrive
+    assert sum(route["in_flight"] for route in gemini_client.get_router().stats()) == 0
+
+
+def test_abandoned_stream_releases_its_route(fake_model):
+    fake_model(chunks=4)
+    stream = gemini_client.stream_results("A man who burns toast.", "How do I make stew?")
+    next(stream)
+    stream.close()
+    assert sum(route["in_flight"] for route in gemini_client.get_router().stats()) == 0
+
+
+def test_rate_limit_on_one_key_does_not_trip_the_breaker(flaky_model, monkeypatch):
+    monkeypatch.setattr(gemini_client, "get_keys_config", lambda: {"gemini_api_keys": ["secret-0", "secret-1"]})
+    model = flaky_model(failures=1, error=ResourceExhausted("Quota exceeded"))
+    monkeypatch.setattr(gemini_client, "circuit_breaker", CircuitBreaker(60, 1, 0.5, 60))
+
+    result = gemini_client.generate_result("A man who burns toast.", "How long do I boil pasta?")
+    assert result.status == STATUS_OK
+    assert model.calls == 2 # The retry went to the other key
+    assert gemini_client.circuit_breaker.state == CircuitBreaker.CLOSED
+
+
+def test_async_timeout_counts_against_the_route(fake_model, monkeypatch):
+    fake_model(latency=0.5)
+    monkeypatch.setattr(gemini_client, "GEMINI_REQUEST_TIMEOUT_SECONDS", 0.05)
+    monkeypatch.setattr(gemini_client, "GEMINI_KEY_FAILURE_THRESHOLD", 1)
+    monkeypatch.setattr(gemini_client, "GEMINI_FALLBACK_MODEL_NAME", "")
+    gemini_client.reset_client()
+
+    result = asyncio.run(gemini_client.generate_result_async("A man who burns toast.", "How long do I boil pasta?"))
+    assert not result.ok
+    [route] = gemini_client.get_router().stats()
+    assert route["failures"] > 0
+    assert route["cooling_down"]
+    assert route["model_latency"] is not None # The timeout is a latency sample too
+    assert route["in_flight"] == 0
@@ -0,0 +1,233 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.single_flight import AsyncSingleFlight, SingleFlight
+
+
+def _wait_for(condition, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+# --- Thread-based ---
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight(share=lambda value: f"shared {value}")
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(None)
+        release.wait(2)
+        return "reply"
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        leader = pool.submit(flights.do, "key", work)
+        _wait_for(lambda: calls)
+        followers = [pool.submit(flights.do, "key", work) for _ in range(3)]
+        _wait_for(lambda: flights.followers == 3)
+        release.set()
+        assert leader.result() == "reply"
+        assert [future.result() for future in followers] == ["shared reply"] * 3
+    assert len(calls) == 1
+
+
+def test_different_keys_are_not_coalesced():
+    flights = SingleFlight()
+    assert flights.do("a", lambda: 1) == 1
+    assert flights.do("a", lambda: 2) == 2 # Finished calls are not cached
+    assert flights.leaders == 2
+
+
+def test_error_reaches_every_caller():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def fail():
+        release.wait(2)
+        raise ValueError("upstream failed")
+
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(flights.do, "key", fail)]
+        _wait_for(lambda: flights.leaders == 1)
+        futures += [pool.submit(flights.do, "key", fail) for _ in range(2)]
+        _wait_for(lambda: flights.followers == 2)
+        release.set()
+        for future in futures:
+            with pytest.raises(ValueError, match="upstream failed"):
+                future.result()
+
+
+def test_stream_is_replayed_to_late_followers():
+    flights = SingleFlight()
+    release = threading.Event()
+
+    def items():
+        yield 1
+        yield 2
+        release.wait(2)
+        yield 3
+
+    leader = flights.stream("key", items)
+    assert [next(leader), next(leader)] == [1, 2]
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        follower = pool.submit(lambda: list(flights.stream("key", items)))
+        _wait_for(lambda: flights.followers == 1)
+        release.set()
+        assert list(leader) == [3]
+        assert follower.result() == [1, 2, 3]
+
+
+def test_follower_restarts_a_stream_the_leader_closed():
+    flights = SingleFlight()
+    started = []
+
+    def items():
+        started.append(None)
+        for n in range(3):
+            yield n
+
+    leader = flights.stream("key", items)
+    assert next(leader) == 0
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        follower = pool.submit(lambda: list(flights.stream("key", items)))
+        _wait_for(lambda: flights.followers == 1)
+        leader.close()
+        # Replays the abandoned stream's item, then starts its own
+        assert follower.result() == [0, 0, 1, 2]
+    assert len(started) == 2
+
+
+def test_follower_takes_over_a_stalled_stream():
+    flights = SingleFlight(stall_timeout=0.05)
+    started = []
+
+    def items():
+        started.append(None)
+        for n in range(3):
+            yield n
+
+    leader = flights.stream("key", items)
+    assert next(leader) == 0 # Then dropped without being closed
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        follower = pool.submit(lambda: list(flights.stream("key", items)))
+        assert follower.result(timeout=5) == [0, 0, 1, 2]
+    assert len(started) == 2
+    assert flights.takeovers == 1
+    assert list(leader) == [1, 2] # The old leader can still finish on its own
+
+
+# --- Asyncio ---
+def test_async_callers_share_one_call():
+    async def scenario():
+        flights = AsyncSingleFlight(share=lambda value: f"shared {value}")
+        calls = []
+
+        async def work():
+            calls.append(None)
+            await asyncio.sleep(0.01)
+            return "reply"
+
+        results = await asyncio.gather(*(flights.do("key", work) for _ in range(4)))
+        return results, calls
+
+    results, calls = asyncio.run(scenario())
+    assert results == ["reply"] + ["shared reply"] * 3
+    assert len(calls) == 1
+
+
+def test_async_error_reaches_every_caller():
+    async def scenario():
+        flights = AsyncSingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        return await asyncio.gather(*(flights.do("key", fail) for _ in range(3)), return_exceptions=True)
+
+    assert [type(error) for error in asyncio.run(scenario())] == [ValueError] * 3
+
+
+def test_cancelled_async_leader_does_not_cancel_followers():
+    async def scenario():
+        flights = AsyncSingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.02)
+            return "reply"
+
+        leader = asyncio.create_task(flights.do("key", work))
+        follower = asyncio.create_task(flights.do("key", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == "reply"
+
+
+async def _collect(stream) -> list:
+    return [item async for item in stream]
+
+
+def test_async_stream_fans_out():
+    async def scenario():
+        flights = AsyncSingleFlight()
+        started = []
+
+        async def items():
+            started.append(None)
+            for n in range(3):
+                await asyncio.sleep(0.005)
+                yield n
+
+        results = await asyncio.gather(*(_collect(flights.stream("key", items)) for _ in range(3)))
+        return results, started
+
+    results, started = asyncio.run(scenario())
+    assert results == [[0, 1, 2]] * 3
+    assert len(started) == 1
+
+
+def test_async_stream_continues_when_the_leader_leaves():
+    async def scenario():
+        flights = AsyncSingleFlight()
+
+        async def items():
+            for n in range(3):
+                await asyncio.sleep(0.01)
+                yield n
+
+        leader = flights.stream("key", items)
+        assert await leader.__anext__() == 0
+        follower = asyncio.create_task(_collect(flights.stream("key", items)))
+        await asyncio.sleep(0)
+        await leader.aclose()
+        return await follower
+
+    assert asyncio.run(scenario()) == [0, 1, 2]
+
+
+def test_async_stream_stops_when_every_subscriber_leaves():
+    async def scenario():
+        flights = AsyncSingleFlight()
+        produced = []
+
+        async def items():
+            for n in range(100):
+                await asyncio.sleep(0.001)
+                produced.append(n)
+                yield n
+
+        stream = flights.stream("key", items)
+        await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0.02)
+        return produced
+
+    assert len(asyncio.run(scenario())) < 10
@@ -0,0 +1,58 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app import gemini_client
+from app.gemini_client import STATUS_BLOCKED, STATUS_OK, STATUS_PARTIAL
+from benchmarks.fake_gemini import FakeGeminiModel, FakeResponse, _FakeStream
+
+BACKSTORY = "A man who thinks every question is beneath him."
+
+
+def _safety_stop_chunk():
+    """A streamed chunk whose candidate was stopped by the safety filter, without text."""
+    return SimpleNamespace(
+        parts=[], text="", prompt_feedback=None, usage_metadata=None,
+        candidates=[SimpleNamespace(finish_reason=SimpleNamespace(name="SAFETY"))],
+    )
+
+
+class _StoppedMidStreamModel(FakeGeminiModel):
+    """Streams two chunks of text, then a chunk stopped for SAFETY."""
+
+    def _stream(self, contents, remaining_latency, blocked):
+        return _FakeStream([FakeResponse("Well, first you ", 5, 4), FakeResponse("take the ", 5, 7),
+                            _safety_stop_chunk()], 0)
+
+
+@pytest.fixture
+def stopped_mid_stream(fake_model):
+    options = fake_model()
+    gemini_client.set_model_factory(lambda system_instruction, model_name=None: _StoppedMidStreamModel(options))
+
+
+def _check_blocked_after_partial_text(results) -> None:
+    assert [result.status for result in results] == [STATUS_PARTIAL, STATUS_PARTIAL, STATUS_BLOCKED]
+    assert results[1].text == "Well, first you take the "
+    # The final result replaces the half-shown answer with the block message
+    assert "blocked" in results[-1].text and "take the" not in results[-1].text
+    assert not results[-1].ok
+
+
+def test_safety_stop_mid_stream(stopped_mid_stream):
+    _check_blocked_after_partial_text(list(gemini_client.stream_results(BACKSTORY, "How do I peel a potato?")))
+
+
+def test_safety_stop_mid_stream_async(stopped_mid_stream):
+    async def collect():
+        return [result async for result in gemini_client.stream_results_async(BACKSTORY, "How do I peel a potato?")]
+
+    _check_blocked_after_partial_text(asyncio.run(collect()))
+
+
+def test_stream_without_a_block_ends_ok(fake_model):
+    fake_model(chunks=3)
+    results = list(gemini_client.stream_results(BACKSTORY, "How do I peel a carrot?"))
+    assert results[-1].status == STATUS_OK
+    assert results[-1].text == results[-2].text.strip()
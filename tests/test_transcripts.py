@@ -0,0 +1,123 @@
+import gzip
+import json
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from app.transcripts import TranscriptLog
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _log(path, max_bytes: int = 1024 * 1024, backup_count: int = 2, batch_size: int = 3,
+         flush_seconds: float = 5.0, queue_size: int = 100) -> TranscriptLog:
+    return TranscriptLog(str(path), max_bytes, backup_count, batch_size, flush_seconds, queue_size)
+
+
+def _record(log: TranscriptLog, prompt: str) -> None:
+    log.record("submit", "Bartek", prompt, "Figure it out.", "ok", 0.25, 12, 4)
+
+
+def _read(path) -> list[dict]:
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    """Returns install(log): records the size of every batch the log writes."""
+    sizes = []
+
+    def install(log: TranscriptLog) -> list[int]:
+        write = log._write
+        monkeypatch.setattr(log, "_write", lambda batch: sizes.append(len(batch)) or write(batch))
+        return sizes
+
+    return install
+
+
+def test_writer_thread_starts_on_first_record(tmp_path):
+    log = _log(tmp_path / "transcripts.jsonl.gz")
+    assert log._thread is None
+    log.close() # Nothing to stop
+    _record(log, "How do I boil an egg?")
+    assert log._thread.is_alive()
+    log.close()
+    assert not log._thread.is_alive()
+
+
+def test_importing_does_not_start_the_writer(tmp_path):
+    script = (
+        "import threading\n"
+        "from app.transcripts import transcript_log\n"
+        "assert transcript_log is not None\n"
+        "assert not [t for t in threading.enumerate() if t.name == 'transcript-writer']\n"
+    )
+    env = dict(os.environ, TRANSCRIPTS_ENABLED="1", TRANSCRIPTS_PATH=str(tmp_path / "transcripts.jsonl.gz"))
+    subprocess.run([sys.executable, "-c", script], cwd=ROOT, env=env, check=True)
+
+
+def test_entries_are_written_in_batches(tmp_path, batches):
+    path = tmp_path / "transcripts.jsonl.gz"
+    log = _log(path, batch_size=3)
+    sizes = batches(log)
+    for n in range(7):
+        _record(log, f"Question {n}")
+    log.close()
+
+    assert sizes == [3, 3, 1] # The last batch is written on close, without waiting for the flush
+    entries = _read(path)
+    assert [entry["prompt"] for entry in entries] == [f"Question {n}" for n in range(7)]
+    assert entries[0]["persona"] == "Bartek" and entries[0]["prompt_tokens"] == 12
+    assert entries[0]["time"].endswith("+00:00")
+    assert log.stats() == {"written": 7, "dropped": 0, "queued": 0}
+
+
+def test_log_is_rotated_and_old_files_dropped(tmp_path):
+    path = tmp_path / "transcripts.jsonl.gz"
+    log = _log(path, max_bytes=1, backup_count=2, batch_size=1)
+    for n in range(4):
+        _record(log, f"Question {n}")
+    log.close()
+
+    # Each batch is a gzip member over max_bytes, so each write rotates
+    assert [entry["prompt"] for entry in _read(path)] == ["Question 3"]
+    assert [entry["prompt"] for entry in _read(tmp_path / "transcripts.1.jsonl.gz")] == ["Question 2"]
+    assert [entry["prompt"] for entry in _read(tmp_path / "transcripts.2.jsonl.gz")] == ["Question 1"]
+    assert not os.path.exists(tmp_path / "transcripts.3.jsonl.gz")
+
+
+def test_entries_are_dropped_when_the_writer_falls_behind(tmp_path, monkeypatch):
+    path = tmp_path / "transcripts.jsonl.gz"
+    log = _log(path, batch_size=1, queue_size=1)
+    writing, release = threading.Event(), threading.Event()
+    write = log._write
+
+    def slow_write(batch):
+        writing.set()
+        release.wait(5)
+        write(batch)
+
+    monkeypatch.setattr(log, "_write", slow_write)
+    _record(log, "Question 0")
+    assert writing.wait(5) # The writer holds the first entry
+    for n in range(1, 4):
+        _record(log, f"Question {n}") # One fits in the queue, two are dropped
+    assert log.dropped == 2
+    release.set()
+    log.close()
+
+    assert log.stats() == {"written": 2, "dropped": 2, "queued": 0}
+    assert [entry["prompt"] for entry in _read(path)] == ["Question 0", "Question 1"]
+
+
+def test_failed_writes_are_counted_as_dropped(tmp_path):
+    (tmp_path / "not-a-dir").write_text("")
+    log = _log(tmp_path / "not-a-dir" / "transcripts.jsonl.gz", batch_size=2)
+    for n in range(3):
+        _record(log, f"Question {n}")
+    log.close()
+    assert log.stats() == {"written": 0, "dropped": 3, "queued": 0}